@@ -0,0 +1,170 @@
+# archive.py
+
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+
+import db
+
+ARCHIVE_FILE = os.environ.get("ECHOSIM_ARCHIVE_FILE", "simverse-archive.db")
+
+# Agents retired longer ago than this are moved out of the agents table.
+ARCHIVE_AFTER_DAYS = float(os.environ.get("ECHOSIM_ARCHIVE_AFTER_DAYS", "30"))
+
+_pool = db.ConnectionPool(ARCHIVE_FILE)
+
+
+def get_archive_connection():
+    """Returns the calling thread's pooled connection to the archive database."""
+    return _pool.connection()
+
+
+def init_archive():
+    """Creates the archive table if it doesn't exist."""
+    with get_archive_connection() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS agent_archive (
+                id TEXT PRIMARY KEY,
+                archived_at TIMESTAMP NOT NULL,
+                record BLOB NOT NULL
+            )
+        """)
+        conn.commit()
+
+
+def _pack(record):
+    return zlib.compress(json.dumps(record, default=str).encode("utf-8"))
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+def archive_retired_agents(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=500, now=None):
+    """Moves agents retired before the cutoff from the agents table into the archive.
+
+    Each agent is stored as one compressed record holding its row and its
+    thoughts. Records are committed to the archive before the agents are
+    deleted from the main database, so an interrupted run leaves agents in
+    both places and the next run simply rewrites them.
+
+    Args:
+        older_than_days (float): Inactive agents last updated before this many days ago are archived.
+        batch_size (int): Agents moved per transaction.
+        now (datetime): The current time; defaults to utcnow.
+
+    Returns:
+        The number of agents archived.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+    init_archive()
+    archived = 0
+    while True:
+        with db.get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT {db.AGENT_COLUMNS} FROM agents WHERE is_active = FALSE AND updated_at < ? "
+                "ORDER BY updated_at, id LIMIT ?",
+                (cutoff, batch_size)
+            )
+            rows = [dict(row) for row in cursor.fetchall()]
+            if not rows:
+                break
+            ids = [row['id'] for row in rows]
+            placeholders = ",".join("?" for _ in ids)
+            cursor.execute(
+                f"SELECT agent_id, seq, ts, content FROM agent_thoughts WHERE agent_id IN ({placeholders}) "
+                "ORDER BY agent_id, seq", ids
+            )
+            thoughts = {}
+            for thought in cursor.fetchall():
+                thoughts.setdefault(thought['agent_id'], []).append(
+                    {"seq": thought['seq'], "ts": thought['ts'], "content": json.loads(thought['content'])})
+
+        with get_archive_connection() as archive_conn:
+            archive_conn.executemany(
+                "INSERT OR REPLACE INTO agent_archive (id, archived_at, record) VALUES (?, ?, ?)",
+                [(row['id'], now, _pack(dict(row, thoughts=thoughts.get(row['id'], [])))) for row in rows]
+            )
+            archive_conn.commit()
+
+        with db.get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "INSERT OR REPLACE INTO archived_agents (id, name, retired_at, archived_at) VALUES (?, ?, ?, ?)",
+                [(row['id'], row['name'], row['updated_at'], now) for row in rows]
+            )
+            cursor.execute(f"DELETE FROM agent_thoughts WHERE agent_id IN ({placeholders})", ids)
+            cursor.execute(f"DELETE FROM agents WHERE id IN ({placeholders})", ids)
+            conn.commit()
+        archived += len(rows)
+
+    if archived:
+        print(f"Archive: Moved {archived} agents retired before {cutoff:%Y-%m-%d} to cold storage.")
+    return archived
+
+
+def get_archived_agent(agent_id):
+    """Loads one archived agent, with its thoughts, or returns None."""
+    with get_archive_connection() as conn:
+        row = conn.execute("SELECT record FROM agent_archive WHERE id = ?", (agent_id,)).fetchone()
+    return _unpack(row['record']) if row is not None else None
+
+
+def _load_records(ids):
+    """Loads archived agents by ID, keeping the order of `ids`, without their thoughts."""
+    if not ids:
+        return []
+    with get_archive_connection() as conn:
+        rows = conn.execute(
+            f"SELECT id, record FROM agent_archive WHERE id IN ({','.join('?' for _ in ids)})", ids
+        ).fetchall()
+    records = {}
+    for row in rows:
+        record = _unpack(row['record'])
+        record.pop("thoughts", None)
+        records[row['id']] = dict(record, archived=True)
+    return [records[agent_id] for agent_id in ids if agent_id in records]
+
+
+def find_archived_agents(name, limit=50):
+    """Looks up archived agents by exact name using the index; only their records are read."""
+    with db.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM archived_agents WHERE name = ? ORDER BY retired_at DESC, id DESC LIMIT ?",
+                       (name, limit))
+        ids = [row['id'] for row in cursor.fetchall()]
+    return _load_records(ids)
+
+
+def get_archived_page(limit=50, cursor=None):
+    """Fetches one page of archived agents, most recently retired first.
+
+    Paging runs on the index in the main database; only the records on the
+    page are read from the archive and decompressed.
+
+    Args:
+        limit (int): Maximum number of agents to return.
+        cursor (str): The `next_cursor` from the previous page, or None.
+
+    Returns:
+        A tuple (agents, next_cursor); next_cursor is None on the last page.
+    """
+    params = []
+    query = "SELECT id, retired_at FROM archived_agents"
+    if cursor:
+        query += " WHERE (retired_at, id) < (?, ?)"
+        params.extend(db._decode_cursor(cursor))
+    query += " ORDER BY retired_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    with db.get_db_connection() as conn:
+        rows = conn.execute(query, params).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = db._encode_cursor(rows[-1]['retired_at'], rows[-1]['id'])
+    return _load_records([row['id'] for row in rows]), next_cursor
@@ -0,0 +1,88 @@
+# async_bridge.py
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import docker_bridge as docker
+
+# Seconds an operation may take before the caller gets a timeout error.
+DEFAULT_TIMEOUTS = {
+    "logs": 15,
+    "control": 30,
+    "retire": 30,
+    "create": 300,
+    "create_batch": 1800,
+    "retire_batch": 1800,
+}
+
+# Operations that may pull images, create containers or run their own pool; these share a smaller limit.
+HEAVY_OPERATIONS = {"create", "create_batch", "retire_batch"}
+
+
+class AsyncDockerBridge:
+    """
+    Runs blocking Docker SDK calls on a bounded worker pool.
+
+    The FastAPI event loop awaits these calls instead of making them inline,
+    so a slow `stop` or image pull no longer stalls every other client and the
+    broadcast loop.
+    """
+
+    def __init__(self, max_workers=8, heavy_limit=2, timeouts=None):
+        """Initializes the bridge.
+
+        Args:
+            max_workers (int): Size of the worker thread pool.
+            heavy_limit (int): Maximum number of heavy operations in flight.
+            timeouts (dict): Per-operation timeout overrides, in seconds.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="docker-io")
+        self.heavy_limit = heavy_limit
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self._heavy_semaphore = None
+
+    async def run(self, operation, func, *args):
+        """Runs `func(*args)` on the worker pool.
+
+        Args:
+            operation (str): The operation type, used for timeouts and limits.
+            func (callable): The blocking function to run.
+
+        Returns:
+            Whatever `func` returns.
+
+        Raises:
+            asyncio.TimeoutError: If the operation exceeds its timeout.
+        """
+        loop = asyncio.get_running_loop()
+        timeout = self.timeouts.get(operation)
+
+        if operation not in HEAVY_OPERATIONS:
+            return await asyncio.wait_for(loop.run_in_executor(self._executor, func, *args), timeout)
+
+        if self._heavy_semaphore is None:
+            self._heavy_semaphore = asyncio.Semaphore(self.heavy_limit)
+        await self._heavy_semaphore.acquire()
+        future = loop.run_in_executor(self._executor, func, *args)
+        # Hold the slot until the worker actually finishes, even if we stop waiting for it.
+        future.add_done_callback(lambda _: self._heavy_semaphore.release())
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    async def call(self, operation, func, *args):
+        """Like `run`, for functions returning (success, message); timeouts become failures."""
+        try:
+            return await self.run(operation, func, *args)
+        except asyncio.TimeoutError:
+            return False, f"Operation '{operation}' timed out after {self.timeouts.get(operation)}s"
+
+    async def get_container_logs(self, container_id, tail=100):
+        """Async version of `docker_bridge.get_container_logs`."""
+        return await self.call("logs", docker.get_container_logs, container_id, tail)
+
+    async def control_container(self, container_id, action):
+        """Async version of `docker_bridge.control_container`."""
+        return await self.call("control", docker.control_container, container_id, action)
+
+    def shutdown(self):
+        """Stops accepting work and abandons queued calls."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,200 @@
+# bench_sync.py
+"""
+Sync and persistence benchmarks against an in-process fake Docker daemon.
+
+Usage:
+    python -m benchmarks.bench_sync --sizes 100,1000,10000 --label my-branch
+    python -m benchmarks.bench_sync --baseline benchmarks/results/main.json
+
+Results are written as JSON to benchmarks/results/<label>.json so runs from
+different versions can be compared with --baseline.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+import sim_engine
+from snapshot import AgentSnapshotTracker
+from benchmarks.fake_docker import FakeDockerDaemon
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Metrics where a larger value in the new run is a regression.
+LOWER_IS_BETTER = (
+    "initial_sync_s", "idle_sync_s", "churn_sync_median_s", "churn_sync_max_s",
+    "get_all_agents_s", "snapshot_bytes", "delta_bytes", "peak_memory_bytes",
+)
+
+
+def _rows_written(change_set):
+    if not change_set:
+        return 0
+    return len(change_set["added"]) + len(change_set["updated"]) + len(change_set["deactivated"])
+
+
+def _timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def _encoded_size(message):
+    return len(json.dumps(message, default=str).encode("utf-8"))
+
+
+def run_size(size, cycles=5, churn=0.01, seed=0):
+    """Benchmarks one fleet size in a fresh database.
+
+    Returns:
+        A dict of measurements for this size.
+    """
+    daemon = FakeDockerDaemon(size, seed=seed)
+    workdir = tempfile.mkdtemp(prefix="simverse-bench-")
+    database = os.path.join(workdir, "bench.db")
+
+    with patch.object(db, "DATABASE_FILE", database), \
+            patch.object(sim_engine.docker, "get_docker_client", return_value=daemon), \
+            patch.object(sim_engine.docker, "list_containers", daemon.list_containers), \
+            contextlib.redirect_stdout(io.StringIO()):
+        db.init_db()
+        engine = sim_engine.SimEngine(db_session=db.get_pool())
+        tracker = AgentSnapshotTracker()
+
+        tracemalloc.start()
+        initial_s, change_set = _timed(engine.sync_agents_with_docker)
+        initial_rows = _rows_written(change_set)
+        tracker.update(db.get_all_agents(active_only=False))
+        snapshot_bytes = _encoded_size(tracker.snapshot())
+
+        idle_s, change_set = _timed(engine.sync_agents_with_docker)
+        idle_rows = _rows_written(change_set)
+
+        churn_times, churn_rows, delta_sizes = [], [], []
+        for _ in range(cycles):
+            base = tracker.generation
+            daemon.churn(status_changes=churn, additions=churn / 5, removals=churn / 5)
+            elapsed, change_set = _timed(engine.sync_agents_with_docker)
+            churn_times.append(elapsed)
+            churn_rows.append(_rows_written(change_set))
+            tracker.update(db.get_all_agents(active_only=False))
+            delta_sizes.append(_encoded_size(tracker.delta_since(base) or tracker.snapshot()))
+
+        read_s, agents = _timed(db.get_all_agents, False)
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # Close only this run's connection; the pool may hold others.
+        db.get_db_connection().close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "size": size,
+        "agents_read": len(agents),
+        "initial_sync_s": initial_s,
+        "initial_rows_written": initial_rows,
+        "idle_sync_s": idle_s,
+        "idle_rows_written": idle_rows,
+        "churn_fraction": churn,
+        "churn_sync_median_s": statistics.median(churn_times),
+        "churn_sync_max_s": max(churn_times),
+        "churn_rows_written_avg": statistics.mean(churn_rows),
+        "get_all_agents_s": read_s,
+        "snapshot_bytes": snapshot_bytes,
+        "delta_bytes": statistics.mean(delta_sizes),
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def _default_label():
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(__file__),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+
+
+def compare(results, baseline, threshold=1.2):
+    """Compares two result documents size by size.
+
+    Returns:
+        A list of (size, metric, old, new) tuples where new > old * threshold.
+    """
+    old_by_size = {entry["size"]: entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results["results"]:
+        old = old_by_size.get(entry["size"])
+        if not old:
+            continue
+        for metric in LOWER_IS_BETTER:
+            if metric in old and old[metric] > 0 and entry[metric] > old[metric] * threshold:
+                regressions.append((entry["size"], metric, old[metric], entry[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Simverse sync and persistence.")
+    parser.add_argument("--sizes", default="100,1000,10000",
+                        help="Comma-separated fleet sizes (up to 50000).")
+    parser.add_argument("--cycles", type=int, default=5, help="Churn/sync cycles per size.")
+    parser.add_argument("--churn", type=float, default=0.01, help="Fraction of containers changing per cycle.")
+    parser.add_argument("--label", default=None, help="Name of the results file (defaults to git describe).")
+    parser.add_argument("--baseline", default=None, help="Results JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression.")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    label = args.label or _default_label()
+    results = {
+        "label": label,
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "results": [],
+    }
+
+    for size in sizes:
+        entry = run_size(size, cycles=args.cycles, churn=args.churn)
+        results["results"].append(entry)
+        print(f"{size:>6} agents: initial {entry['initial_sync_s'] * 1000:8.1f} ms, "
+              f"idle {entry['idle_sync_s'] * 1000:7.1f} ms ({entry['idle_rows_written']} rows), "
+              f"churn {entry['churn_sync_median_s'] * 1000:7.1f} ms ({entry['churn_rows_written_avg']:.0f} rows), "
+              f"read {entry['get_all_agents_s'] * 1000:7.1f} ms, "
+              f"snapshot {entry['snapshot_bytes'] / 1024:8.1f} KiB, delta {entry['delta_bytes'] / 1024:6.1f} KiB, "
+              f"peak {entry['peak_memory_bytes'] / 1048576:6.1f} MiB")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{label}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for size, metric, old, new in regressions:
+            print(f"REGRESSION {size} agents {metric}: {old:.4g} -> {new:.4g}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
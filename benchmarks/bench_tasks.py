@@ -0,0 +1,155 @@
+# bench_tasks.py
+"""
+Task queue throughput benchmarks against a temporary database.
+
+Usage:
+    python -m benchmarks.bench_tasks --sizes 1000,10000 --agents 200 --label my-branch
+    python -m benchmarks.bench_tasks --baseline benchmarks/results/tasks-main.json
+
+Each size is the number of tasks queued before dispatch starts. Results are
+written as JSON to benchmarks/results/tasks-<label>.json.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+import task_queue
+from benchmarks.bench_sync import RESULTS_DIR, _default_label
+
+# Metrics where a smaller value in the new run is a regression.
+HIGHER_IS_BETTER = ("enqueue_tasks_per_s", "dispatch_tasks_per_s", "end_to_end_tasks_per_s")
+
+
+def run_size(size, agents=100, enqueue_batch=1000):
+    """Queues `size` tasks, then dispatches and acknowledges them all with `agents` agents.
+
+    Returns:
+        A dict of measurements for this size.
+    """
+    workdir = tempfile.mkdtemp(prefix="simverse-bench-tasks-")
+    database = os.path.join(workdir, "bench.db")
+
+    with patch.object(db, "DATABASE_FILE", database), contextlib.redirect_stdout(io.StringIO()):
+        db.init_db()
+        for i in range(agents):
+            db.add_or_update_agent({"id": f"agent-{i}", "name": f"echo-{i}", "status": "running"})
+
+        started = time.perf_counter()
+        for start in range(0, size, enqueue_batch):
+            task_queue.enqueue({"task": f"task {i}", "payload": {"n": i}, "priority": i % 10}
+                               for i in range(start, min(size, start + enqueue_batch)))
+        enqueue_s = time.perf_counter() - started
+
+        dispatcher = task_queue.Dispatcher(batch_size=agents)
+        omega = task_queue.Omega(decide=lambda task, result: task_queue.ARCHIVE)
+        dispatch_times, report_s, done = [], 0.0, 0
+        started = time.perf_counter()
+        while done < size:
+            round_started = time.perf_counter()
+            tasks = dispatcher.dispatch()
+            dispatch_times.append(time.perf_counter() - round_started)
+            if not tasks:
+                break
+            report_started = time.perf_counter()
+            for task in tasks:
+                omega.report(task["id"], task["agent_id"], {"ok": True})
+            report_s += time.perf_counter() - report_started
+            done += len(tasks)
+        total_s = time.perf_counter() - started
+        counts = task_queue.counts()
+        db.get_db_connection().close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "size": size,
+        "agents": agents,
+        "tasks_done": counts.get(task_queue.DONE, 0),
+        "enqueue_s": enqueue_s,
+        "enqueue_tasks_per_s": size / enqueue_s if enqueue_s else 0,
+        "dispatch_rounds": len(dispatch_times),
+        "dispatch_round_median_s": statistics.median(dispatch_times),
+        "dispatch_tasks_per_s": done / sum(dispatch_times) if dispatch_times else 0,
+        "report_s": report_s,
+        "end_to_end_tasks_per_s": done / total_s if total_s else 0,
+    }
+
+
+def compare(results, baseline, threshold=1.2):
+    """Compares two result documents size by size.
+
+    Returns:
+        A list of (size, metric, old, new) tuples where new < old / threshold.
+    """
+    old_by_size = {entry["size"]: entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results["results"]:
+        old = old_by_size.get(entry["size"])
+        if not old:
+            continue
+        for metric in HIGHER_IS_BETTER:
+            if metric in old and old[metric] > 0 and entry[metric] < old[metric] / threshold:
+                regressions.append((entry["size"], metric, old[metric], entry[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Simverse task queue.")
+    parser.add_argument("--sizes", default="1000,10000", help="Comma-separated numbers of queued tasks.")
+    parser.add_argument("--agents", type=int, default=100, help="Idle agents taking tasks each round.")
+    parser.add_argument("--label", default=None, help="Name of the results file (defaults to git describe).")
+    parser.add_argument("--baseline", default=None, help="Results JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression.")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    label = args.label or _default_label()
+    results = {
+        "label": label,
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "results": [],
+    }
+
+    for size in sizes:
+        entry = run_size(size, agents=args.agents)
+        results["results"].append(entry)
+        print(f"{size:>6} tasks, {entry['agents']} agents: "
+              f"enqueue {entry['enqueue_tasks_per_s']:9.0f}/s, "
+              f"dispatch {entry['dispatch_tasks_per_s']:9.0f}/s "
+              f"({entry['dispatch_round_median_s'] * 1000:6.1f} ms/round), "
+              f"end to end {entry['end_to_end_tasks_per_s']:8.0f}/s")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"tasks-{label}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for size, metric, old, new in regressions:
+            print(f"REGRESSION {size} tasks {metric}: {old:.4g} -> {new:.4g}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+# fake_docker.py
+
+import json
+import random
+
+# Rough status mix of a live Simverse.
+STATUS_WEIGHTS = {"running": 70, "exited": 20, "created": 5, "paused": 3, "restarting": 2}
+ZONE_NAMES = ("Alpha Hall", "Echo Plaza", "Docker Core", "Omega Gate")
+
+
+class FakeContainer:
+    """The subset of docker.models.containers.Container that sync reads."""
+
+    __slots__ = ("id", "name", "status", "labels")
+
+    def __init__(self, container_id, name, status, labels):
+        self.id = container_id
+        self.name = name
+        self.status = status
+        self.labels = labels
+
+
+class FakeDockerDaemon:
+    """
+    An in-process stand-in for a Docker daemon holding many Echo containers.
+
+    `churn` mutates a fraction of the fleet between syncs so benchmarks can
+    measure steady-state cost as well as the initial import.
+    """
+
+    def __init__(self, count, seed=0):
+        self._rng = random.Random(seed)
+        self._serial = 0
+        self.containers = {}
+        for _ in range(count):
+            self._add()
+
+    def _random_status(self):
+        return self._rng.choices(list(STATUS_WEIGHTS), weights=list(STATUS_WEIGHTS.values()))[0]
+
+    def _add(self):
+        self._serial += 1
+        container_id = f"{self._rng.getrandbits(256):064x}"
+        labels = {
+            "source": "echosim",
+            "echosim.zone": json.dumps({"name": self._rng.choice(ZONE_NAMES)}),
+        }
+        container = FakeContainer(container_id, f"echo-{self._serial}", self._random_status(), labels)
+        self.containers[container_id] = container
+        return container
+
+    def churn(self, status_changes=0.01, additions=0.002, removals=0.002):
+        """Mutates the fleet.
+
+        Args:
+            status_changes (float): Fraction of containers that change status.
+            additions (float): Fraction of the fleet size to add as new containers.
+            removals (float): Fraction of containers to destroy.
+
+        Returns:
+            A dict with the number of containers changed, added and removed.
+        """
+        size = len(self.containers)
+        ids = list(self.containers)
+        changed = self._rng.sample(ids, min(size, int(size * status_changes)))
+        for container_id in changed:
+            container = self.containers[container_id]
+            container.status = "exited" if container.status == "running" else "running"
+        removed = self._rng.sample(ids, min(size, int(size * removals)))
+        for container_id in removed:
+            self.containers.pop(container_id, None)
+        added = int(size * additions)
+        for _ in range(added):
+            self._add()
+        return {"changed": len(changed), "added": added, "removed": len(removed)}
+
+    def get_all_containers(self):
+        """Equivalent of docker_bridge.get_all_containers."""
+        return list(self.containers.values())
+
+    def list_containers(self, label_filters=None):
+        """Equivalent of docker_bridge.list_containers; every fake container is an Echo."""
+        return list(self.containers.values())
+
+    def get_container(self, container_id):
+        """Equivalent of docker_bridge.get_container."""
+        return self.containers.get(container_id)
@@ -0,0 +1,360 @@
+# cluster.py
+
+import asyncio
+import fcntl
+import json
+import os
+
+# A follower whose socket buffer grows past this is dropped; it reconnects and
+# catches up from the database.
+MAX_FOLLOWER_BUFFER = 4 * 1024 * 1024
+
+# Longest feed or call line either side reads. asyncio's default of 64 KiB is
+# smaller than a full-sync change set or a bulk command for a large fleet.
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+class LeaderLock:
+    """
+    An exclusive, non-blocking `flock` on a file; the holder is the sync leader.
+
+    The kernel releases the lock when the holding process exits, however it
+    exits, so a follower can take over without any lease bookkeeping.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        """Takes the lock if nobody else holds it. Returns True if we hold it."""
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class ChangeFeedServer:
+    """
+    Publishes newline-delimited JSON messages to every follower on a Unix socket.
+
+    Followers may also send `call` messages, which are run through `on_call`;
+    the `progress` and `reply` messages for a call go back to its sender only.
+    """
+
+    def __init__(self, path, on_call=None):
+        """Initializes the server.
+
+        Args:
+            path (str): The Unix socket to listen on.
+            on_call (coroutine function): Awaited as `on_call(op, args, progress)`
+                for each call a follower forwards; returns a JSON-serializable
+                result. `progress` sends a payload back to the caller.
+        """
+        self.path = path
+        self.on_call = on_call
+        self._server = None
+        self._writers = set()
+        self._calls = set()
+
+    async def start(self):
+        # Only the lock holder gets here, so any existing socket file is stale.
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path, limit=MAX_MESSAGE_BYTES)
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            # Followers only send calls; an empty read means they disconnected.
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    print("Cluster: Ignoring a malformed message from a follower.")
+                    continue
+                if message.get("kind") == "call" and self.on_call is not None:
+                    task = asyncio.create_task(self._serve_call(writer, message))
+                    self._calls.add(task)
+                    task.add_done_callback(self._calls.discard)
+        except ValueError:
+            print(f"Cluster: Dropping a follower that sent a message over {MAX_MESSAGE_BYTES} bytes.")
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _serve_call(self, writer, message):
+        call_id = message.get("id")
+
+        def progress(payload):
+            self._send(writer, {"kind": "progress", "id": call_id, "payload": payload})
+
+        try:
+            reply = {"kind": "reply", "id": call_id,
+                     "result": await self.on_call(message.get("op"), message.get("args") or {}, progress)}
+        except Exception as e:
+            reply = {"kind": "reply", "id": call_id, "error": str(e) or type(e).__name__}
+        self._send(writer, reply)
+
+    def _send(self, writer, message):
+        if not writer.is_closing():
+            writer.write((json.dumps(message, default=str) + "\n").encode("utf-8"))
+
+    @property
+    def follower_count(self):
+        return len(self._writers)
+
+    def publish(self, message):
+        """Queues a message for every connected follower without waiting."""
+        line = (json.dumps(message, default=str) + "\n").encode("utf-8")
+        for writer in list(self._writers):
+            if writer.transport.get_write_buffer_size() > MAX_FOLLOWER_BUFFER:
+                print("Cluster: Dropping a follower that stopped reading the change feed.")
+                self._writers.discard(writer)
+                writer.close()
+                continue
+            writer.write(line)
+
+    async def close(self):
+        for task in list(self._calls):
+            task.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for writer in list(self._writers):
+            writer.close()
+        self._writers.clear()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class ChangeFeedClient:
+    """Follows the leader's change feed, reconnecting until stopped, and forwards calls to the leader."""
+
+    def __init__(self, path, on_message, reconnect_delay=1, on_connect=None):
+        """Initializes the client.
+
+        Args:
+            path (str): The leader's Unix socket.
+            on_message (callable): Called on the event loop with each decoded message.
+            reconnect_delay (float): Seconds to wait before reconnecting.
+            on_connect (callable): Called on the event loop after every (re)connection;
+                messages published while disconnected are lost, so this is where
+                followers catch up from the database.
+        """
+        self.path = path
+        self.on_message = on_message
+        self.on_connect = on_connect
+        self.reconnect_delay = reconnect_delay
+        self.connected = False
+        self._running = False
+        self._writer = None
+        # call id -> (future, progress callback)
+        self._calls = {}
+        self._next_call_id = 0
+
+    async def run(self):
+        self._running = True
+        while self._running:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=MAX_MESSAGE_BYTES)
+            except OSError:
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            self._writer = writer
+            self.connected = True
+            if self.on_connect is not None:
+                try:
+                    self.on_connect()
+                except Exception as e:
+                    print(f"Cluster: Reconnect handler failed: {e}")
+            try:
+                while self._running:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    try:
+                        message = json.loads(line)
+                        if message.get("kind") in ("progress", "reply"):
+                            self._resolve(message)
+                        else:
+                            self.on_message(message)
+                    except Exception as e:
+                        print(f"Cluster: Could not handle change feed message: {e}")
+            except ValueError:
+                print(f"Cluster: Leader sent a message over {MAX_MESSAGE_BYTES} bytes; reconnecting.")
+            except (OSError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                self.connected = False
+                self._writer = None
+                writer.close()
+                self._fail_calls()
+            if self._running:
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def call(self, op, args, progress=None):
+        """Runs `op` in the leader and waits for its result.
+
+        Args:
+            op (str): The operation name understood by the leader's `on_call`.
+            args (dict): JSON-serializable arguments.
+            progress (callable): Called on the event loop with each progress payload.
+
+        Raises:
+            ConnectionError: If there is no leader connection, or it drops before the reply.
+            RuntimeError: If the call failed in the leader.
+        """
+        if self._writer is None:
+            raise ConnectionError("Not connected to the sync leader.")
+        self._next_call_id += 1
+        call_id = self._next_call_id
+        future = asyncio.get_running_loop().create_future()
+        self._calls[call_id] = (future, progress)
+        try:
+            self._writer.write((json.dumps({"kind": "call", "id": call_id, "op": op, "args": args},
+                                           default=str) + "\n").encode("utf-8"))
+            return await future
+        finally:
+            self._calls.pop(call_id, None)
+
+    def _resolve(self, message):
+        entry = self._calls.get(message.get("id"))
+        if entry is None:
+            return
+        future, progress = entry
+        if message["kind"] == "progress":
+            if progress is not None:
+                progress(message.get("payload"))
+        elif not future.done():
+            if "error" in message:
+                future.set_exception(RuntimeError(message["error"]))
+            else:
+                future.set_result(message.get("result"))
+
+    def _fail_calls(self):
+        for future, _ in list(self._calls.values()):
+            if not future.done():
+                future.set_exception(ConnectionError("Lost the connection to the sync leader."))
+
+    def stop(self):
+        self._running = False
+
+
+class ClusterNode:
+    """
+    Coordinates one worker process in a multi-worker EchoPulse.
+
+    Every worker tries to take the leader lock. The winner runs the
+    Docker-facing services (through `on_promote`) and publishes change sets
+    on a Unix socket. The other workers follow that socket and keep retrying
+    the lock, so one of them takes over if the leader dies. Every worker
+    fans messages out to its own WebSocket clients through `on_message`.
+    Commands that touch Docker or sync go through `call`, which runs them
+    in the leader, so only one worker ever writes agent state.
+    """
+
+    def __init__(self, directory, on_promote, on_message, poll_interval=2, on_call=None, on_connect=None):
+        """Initializes the node.
+
+        Args:
+            directory (str): Where the lock file and socket live; shared by all workers.
+            on_promote (coroutine function): Awaited once when this worker becomes leader.
+            on_message (callable): Called with each message published by the leader.
+            poll_interval (float): Seconds between attempts to take the lock.
+            on_call (coroutine function): Awaited in the leader as
+                `on_call(op, args, progress)` for every `call`, from any worker.
+            on_connect (callable): Called each time this follower (re)connects to the feed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.lock = LeaderLock(os.path.join(directory, "leader.lock"))
+        self.server = ChangeFeedServer(os.path.join(directory, "changes.sock"), on_call)
+        self.on_promote = on_promote
+        self.on_message = on_message
+        self.on_call = on_call
+        self.on_connect = on_connect
+        self.poll_interval = poll_interval
+        self._follower = None
+        self._follower_task = None
+        self._running = False
+
+    @property
+    def is_leader(self):
+        return self.lock.held
+
+    async def run(self):
+        """Follows the current leader until this worker wins the lock, then leads."""
+        self._running = True
+        while self._running:
+            if self.lock.try_acquire():
+                await self._promote()
+                return
+            if self._follower_task is None:
+                self._follower = ChangeFeedClient(self.server.path, self.on_message, on_connect=self.on_connect)
+                self._follower_task = asyncio.create_task(self._follower.run())
+            await asyncio.sleep(self.poll_interval)
+
+    async def _promote(self):
+        print(f"Cluster: Worker {os.getpid()} is now the sync leader.")
+        await self._stop_following()
+        await self.server.start()
+        await self.on_promote()
+
+    async def _stop_following(self):
+        if self._follower_task is not None:
+            self._follower.stop()
+            self._follower_task.cancel()
+            try:
+                await self._follower_task
+            except asyncio.CancelledError:
+                pass
+            self._follower, self._follower_task = None, None
+
+    async def call(self, op, args, progress=None):
+        """Runs `op` in the sync leader: directly if this worker leads, otherwise over the feed.
+
+        Raises:
+            ConnectionError: If this worker follows and cannot reach the leader.
+            RuntimeError: If the call failed in the leader.
+        """
+        if self.is_leader:
+            return await self.on_call(op, args, progress or (lambda payload: None))
+        if self._follower is None:
+            raise ConnectionError("Not connected to the sync leader.")
+        return await self._follower.call(op, args, progress)
+
+    def publish(self, kind, payload):
+        """Sends a message to every follower; a no-op unless this worker leads."""
+        if self.is_leader:
+            self.server.publish({"kind": kind, "payload": payload})
+
+    async def close(self):
+        self._running = False
+        await self._stop_following()
+        if self.is_leader:
+            await self.server.close()
+            self.lock.release()
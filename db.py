@@ -1,15 +1,117 @@
+import base64
+import binascii
 import sqlite3
 import json
-from datetime import datetime
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import metrics
+from zones import ZONE_LABEL, assign_zone
+
+logger = logging.getLogger(__name__)
 
 DATABASE_FILE = "simverse.db"
 
-def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DATABASE_FILE)
+# Applied to every new connection. WAL lets readers (the broadcast loop) proceed
+# while the sync thread writes; NORMAL is durable across application crashes in WAL mode.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",  # 16 MB page cache per connection
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# Size of each connection's prepared statement cache.
+STATEMENT_CACHE_SIZE = 256
+
+def _open_connection(database):
+    """Opens and configures a new SQLite connection."""
+    # Connections are confined to one thread by ConnectionPool, but may be
+    # closed from another thread on shutdown.
+    conn = sqlite3.connect(database, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+class ConnectionPool:
+    """
+    Hands out one long-lived SQLite connection per thread.
+
+    Reusing the connection keeps its page cache and prepared statements warm,
+    instead of paying for a fresh connection on every query. Connections of
+    threads that have exited are closed whenever a new one is opened, so
+    short-lived worker threads do not leave connections behind.
+    """
+
+    def __init__(self, database=None):
+        """Initializes the pool.
+
+        Args:
+            database (str): Path to the database. Defaults to `DATABASE_FILE`,
+                looked up on every call so it can be changed at runtime.
+        """
+        self.database = database
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # (owning thread, connection) pairs, so connections of exited threads can be closed.
+        self._connections = []
+
+    def connection(self):
+        """Returns the calling thread's connection, opening it if needed."""
+        database = self.database or DATABASE_FILE
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        stale = connections.get(database)
+        if stale is not None:
+            try:
+                stale.total_changes  # Raises if the connection was closed
+                return stale
+            except sqlite3.ProgrammingError:
+                pass
+        conn = _open_connection(database)
+        connections[database] = conn
+        with self._lock:
+            orphaned = [c for thread, c in self._connections if not thread.is_alive()]
+            self._connections = [(thread, c) for thread, c in self._connections
+                                 if thread.is_alive() and c is not stale]
+            self._connections.append((threading.current_thread(), conn))
+        _close(orphaned)
+        return conn
+
+    def close_all(self):
+        """Closes every connection handed out by this pool."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        _close(conn for _, conn in connections)
+        self._local = threading.local()
+
+def _close(connections):
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+_pool = ConnectionPool()
+
+def get_pool():
+    """Returns the module's shared connection pool."""
+    return _pool
+
+def get_db_connection():
+    """Returns the calling thread's pooled connection to the SQLite database."""
+    return _pool.connection()
+
+def _session_connection(db_session):
+    """Returns a connection from `db_session` if it is a pool, else the default pool."""
+    if isinstance(db_session, ConnectionPool):
+        return db_session.connection()
+    return get_db_connection()
+
 def init_db():
     """Initializes the database and creates the agents table if it doesn't exist."""
     with get_db_connection() as conn:
@@ -24,122 +126,717 @@ def init_db():
                 created_at TIMESTAMP,
                 updated_at TIMESTAMP,
                 is_active BOOLEAN DEFAULT TRUE,
-                thought_log TEXT
+                thought_log TEXT,
+                zone_key TEXT,
+                thought_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        _migrate_zone_key(cursor)
+        # Append-only thought log; agents.thought_count is the latest seq.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS agent_thoughts (
+                agent_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                ts TIMESTAMP NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (agent_id, seq)
+            ) WITHOUT ROWID
+        """)
+        _migrate_thought_log(cursor)
+        # Index of agents moved to the cold archive (see archive.py); the records live there.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS archived_agents (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                retired_at TIMESTAMP,
+                archived_at TIMESTAMP NOT NULL
             )
         """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_archived_agents_name ON archived_agents (name)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_archived_agents_retired ON archived_agents (retired_at, id)")
+        # Append-only history of real state transitions, written by sync.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS agent_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                agent_id TEXT NOT NULL,
+                ts TIMESTAMP NOT NULL,
+                kind TEXT NOT NULL,
+                from_status TEXT,
+                to_status TEXT,
+                from_zone TEXT,
+                to_zone TEXT
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_agent_events_agent_ts ON agent_events (agent_id, ts)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_agent_events_ts ON agent_events (ts)")
+        # Per-hour rollups of events that have aged out of agent_events.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS agent_event_hourly (
+                agent_id TEXT NOT NULL,
+                hour TIMESTAMP NOT NULL,
+                kind TEXT NOT NULL,
+                to_status TEXT NOT NULL DEFAULT '',
+                count INTEGER NOT NULL,
+                PRIMARY KEY (agent_id, hour, kind, to_status)
+            ) WITHOUT ROWID
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_agent_event_hourly_hour ON agent_event_hourly (hour)")
+        # Durable task queue for the Alpha-Omega dispatcher (see task_queue.py).
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task TEXT NOT NULL,
+                payload TEXT,
+                priority INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL DEFAULT 'queued',
+                agent_id TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                created_at TIMESTAMP NOT NULL,
+                expires_at TIMESTAMP,
+                lease_until TIMESTAMP,
+                finished_at TIMESTAMP,
+                result TEXT,
+                decision TEXT
+            )
+        """)
+        # Dequeue reads this partial index in priority order and never touches finished tasks.
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_queued ON tasks (priority DESC, id) WHERE state = 'queued'")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_leased ON tasks (agent_id, lease_until) WHERE state = 'leased'")
+        # Serves Memory Garden pages (is_active = FALSE ordered by updated_at) without a scan or sort.
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_agents_active_updated ON agents (is_active, updated_at, id)")
+        # Serves per-zone membership and occupancy queries.
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_agents_zone_key ON agents (zone_key, is_active)")
         conn.commit()
     print("Database initialized.")
 
+def _migrate_zone_key(cursor):
+    """Adds and backfills the zone_key column on databases created before it existed."""
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(agents)")}
+    if "zone_key" not in columns:
+        cursor.execute("ALTER TABLE agents ADD COLUMN zone_key TEXT")
+    cursor.execute("SELECT id, status, zone FROM agents WHERE zone_key IS NULL")
+    # The zone column holds the container's zone label, so the assignment can be recomputed exactly.
+    backfill = [(_zone_key(row['status'], row['zone']), row['id']) for row in cursor.fetchall()]
+    if backfill:
+        cursor.executemany("UPDATE agents SET zone_key = ? WHERE id = ?", backfill)
+
+def _migrate_thought_log(cursor):
+    """Moves thought_log blobs into agent_thoughts on databases created before it existed."""
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(agents)")}
+    if "thought_count" not in columns:
+        cursor.execute("ALTER TABLE agents ADD COLUMN thought_count INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("SELECT id, updated_at, thought_log FROM agents WHERE thought_log IS NOT NULL")
+    for row in cursor.fetchall():
+        try:
+            thoughts = json.loads(row['thought_log'])
+        except (json.JSONDecodeError, TypeError):
+            thoughts = [row['thought_log']]
+        if not isinstance(thoughts, list):
+            thoughts = [thoughts]
+        ts = row['updated_at'] or datetime.utcnow()
+        _insert_thoughts(cursor, [(row['id'], content) for content in thoughts], ts)
+    cursor.execute("UPDATE agents SET thought_log = NULL WHERE thought_log IS NOT NULL")
+
+def _zone_key(status, zone):
+    return assign_zone(status, {ZONE_LABEL: zone} if zone else None)
+
+# Columns sent to clients; the thought log itself is read with get_thoughts.
+AGENT_COLUMNS = "id, name, status, mood, zone, created_at, updated_at, is_active, zone_key, thought_count"
+
+_UPSERT_AGENT_SQL = """
+    INSERT INTO agents (id, name, status, mood, zone, created_at, updated_at, is_active, zone_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        name = excluded.name,
+        status = excluded.status,
+        mood = excluded.mood,
+        zone = excluded.zone,
+        zone_key = excluded.zone_key,
+        updated_at = excluded.updated_at
+"""
+
+def _agent_params(agent_data, now):
+    """Builds the parameter tuple for `_UPSERT_AGENT_SQL`."""
+    zone = agent_data.get("zone", "THE_VOID") # Zone is a simple string
+    zone_key = agent_data.get("zone_key") or _zone_key(agent_data.get('status'), zone)
+    return (
+        agent_data['id'],
+        agent_data['name'],
+        agent_data.get('status', 'unknown'),
+        agent_data.get('mood', 'neutral'),
+        zone,
+        now,
+        now,
+        True,
+        zone_key
+    )
+
 def add_or_update_agent(agent_data):
-    """Adds a new agent or updates an existing one (UPSERT)."""
+    """Adds a new agent or updates an existing one (UPSERT).
+
+    A `thought_log` list in `agent_data` seeds a new agent's thoughts; it is
+    ignored for an existing agent, whose thoughts grow through `append_thoughts`.
+    """
+    now = datetime.utcnow()
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        now = datetime.utcnow()
-        thought_log = json.dumps(agent_data.get("thought_log", []))
-        zone = agent_data.get("zone", "THE_VOID") # Zone is a simple string
+        cursor.execute("SELECT 1 FROM agents WHERE id = ?", (agent_data['id'],))
+        is_new = cursor.fetchone() is None
+        cursor.execute(_UPSERT_AGENT_SQL, _agent_params(agent_data, now))
+        if is_new:
+            _insert_thoughts(cursor, [(agent_data['id'], content) for content in agent_data.get("thought_log") or ()], now)
+        conn.commit()
 
-        cursor.execute("""
-            INSERT INTO agents (id, name, status, mood, zone, created_at, updated_at, is_active, thought_log)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(id) DO UPDATE SET
-                name = excluded.name,
-                status = excluded.status,
-                mood = excluded.mood,
-                zone = excluded.zone,
-                updated_at = excluded.updated_at
-        """, (
-            agent_data['id'],
-            agent_data['name'],
-            agent_data.get('status', 'unknown'),
-            agent_data.get('mood', 'neutral'),
-            zone,
-            now,
-            now,
-            True,
-            thought_log
-        ))
+# Largest number of thoughts returned by one read.
+MAX_THOUGHTS_PAGE = 500
+
+def _insert_thoughts(cursor, entries, now):
+    """Appends (agent_id, content) pairs, numbering each agent's thoughts after its last one.
+
+    Returns:
+        The stored records, in the order of `entries`.
+    """
+    if not entries:
+        return []
+    last_seq = {}
+    for agent_id in {agent_id for agent_id, _ in entries}:
+        cursor.execute("SELECT MAX(seq) FROM agent_thoughts WHERE agent_id = ?", (agent_id,))
+        last_seq[agent_id] = cursor.fetchone()[0] or 0
+    records = []
+    for agent_id, content in entries:
+        last_seq[agent_id] += 1
+        records.append({"agent_id": agent_id, "seq": last_seq[agent_id], "ts": now, "content": content})
+    cursor.executemany(
+        "INSERT INTO agent_thoughts (agent_id, seq, ts, content) VALUES (?, ?, ?, ?)",
+        [(r["agent_id"], r["seq"], now, json.dumps(r["content"], default=str)) for r in records]
+    )
+    cursor.executemany("UPDATE agents SET thought_count = ? WHERE id = ?",
+                       [(seq, agent_id) for agent_id, seq in last_seq.items()])
+    return records
+
+@metrics.DB_SECONDS.time(op="append_thoughts")
+def append_thoughts(entries, db_session=None):
+    """Appends a batch of thoughts in one transaction.
+
+    Thoughts are never rewritten; each agent's are numbered 1, 2, 3, ... and
+    the agent's `thought_count` is set to its latest number, so broadcasts
+    carry a cursor instead of the log itself.
+
+    Args:
+        entries (iterable): (agent_id, content) pairs, oldest first. The
+            content can be any JSON-serializable value.
+        db_session (ConnectionPool): Optional pool to take the connection from.
+
+    Returns:
+        A list of the stored records (agent_id, seq, ts, content).
+    """
+    entries = list(entries)
+    if not entries:
+        return []
+    with _session_connection(db_session) as conn:
+        # Take the write lock before reading the last seqs, so workers cannot interleave.
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        records = _insert_thoughts(conn.cursor(), entries, datetime.utcnow())
         conn.commit()
+    return records
+
+def get_thoughts(agent_id, limit=50, after_seq=None, before_seq=None):
+    """Fetches a bounded slice of an agent's thoughts, oldest first.
 
-def sync_containers_with_db(db_session, containers):
+    Without `after_seq`, returns the latest `limit` thoughts (before
+    `before_seq`, if given), which is how a client pages backwards. With
+    `after_seq`, returns the `limit` thoughts that follow it, which is how a
+    follower catches up.
+
+    Args:
+        agent_id (str): The agent to read.
+        limit (int): Maximum number of thoughts, capped at `MAX_THOUGHTS_PAGE`.
+        after_seq (int): Return thoughts with a larger seq, or None.
+        before_seq (int): Return thoughts with a smaller seq, or None.
+
+    Returns:
+        A list of dicts with `agent_id`, `seq`, `ts` and the decoded `content`.
+    """
+    limit = max(1, min(int(limit), MAX_THOUGHTS_PAGE))
+    clauses, params = ["agent_id = ?"], [agent_id]
+    if after_seq is not None:
+        clauses.append("seq > ?")
+        params.append(after_seq)
+    if before_seq is not None:
+        clauses.append("seq < ?")
+        params.append(before_seq)
+    order = "ASC" if after_seq is not None else "DESC"
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT agent_id, seq, ts, content FROM agent_thoughts WHERE {' AND '.join(clauses)} ORDER BY seq {order} LIMIT ?",
+            params + [limit]
+        )
+        rows = [dict(row, content=json.loads(row['content'])) for row in cursor.fetchall()]
+    return rows if after_seq is not None else rows[::-1]
+
+def container_to_agent_data(container):
+    """Maps a Docker container to the agent fields that sync maintains."""
+    # Basic agent data from the container
+    agent_data = {
+        'id': container.id,
+        'name': container.name,
+        'status': container.status,
+        'mood': 'inscrutable',  # Default mood, can be updated by other processes
+    }
+    # Safely get and parse labels for zone info
+    try:
+        zone_label = container.labels.get('echosim.zone', '{}')
+        zone_info = json.loads(zone_label)
+        agent_data['zone'] = json.dumps(zone_info)
+    except (json.JSONDecodeError, TypeError):
+        agent_data['zone'] = json.dumps({'name': 'The Void', 'description': 'Unlabeled territory'})
+    agent_data['zone_key'] = assign_zone(container.status, container.labels)
+    return agent_data
+
+def _transition(agent_id, kind, row=None, to_status=None, to_zone=None):
+    """Builds an agent_events record for a change of an agent's state."""
+    return {
+        "agent_id": agent_id,
+        "kind": kind,
+        "from_status": row['status'] if row is not None else None,
+        "to_status": to_status,
+        "from_zone": row['zone'] if row is not None else None,
+        "to_zone": to_zone,
+    }
+
+def _archived_ids(cursor, stored, containers):
+    """Returns the IDs of unknown, non-running containers whose agents were already archived.
+
+    An archived agent whose container is running again is un-archived: its
+    archived_agents row is deleted in the caller's transaction, so the diff
+    adds the agent back as a new row. Its old record stays in the archive
+    database until the agent is archived again.
+    """
+    unknown = {c.id: c for c in containers if c.id not in stored}
+    ids = list(unknown)
+    archived = set()
+    # Chunked to stay under SQLite's variable limit.
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        cursor.execute(f"SELECT id FROM archived_agents WHERE id IN ({','.join('?' for _ in chunk)})", chunk)
+        archived.update(row['id'] for row in cursor.fetchall())
+    revived = sorted(agent_id for agent_id in archived if unknown[agent_id].status == 'running')
+    if revived:
+        print(f"DB: Restoring {len(revived)} archived agents whose containers are running again.")
+        cursor.executemany("DELETE FROM archived_agents WHERE id = ?", [(agent_id,) for agent_id in revived])
+    return archived.difference(revived)
+
+def _diff_containers(stored, containers, now, change_set, archived=frozenset()):
+    """Diffs containers against stored rows, filling in `change_set`.
+
+    Containers in `archived` belong to agents in the cold archive; their
+    stopped containers are still listed by Docker but are not re-added.
+    `_archived_ids` leaves running ones out, so they are added again.
+
+    Returns:
+        A tuple (upsert parameter list, set of container IDs seen).
+    """
+    upserts = []
+    seen_ids = set()
+    for container in containers:
+        if container.id in archived:
+            continue
+        agent_data = container_to_agent_data(container)
+        seen_ids.add(agent_data['id'])
+        row = stored.get(agent_data['id'])
+        if row is None:
+            change_set["added"].append(agent_data['id'])
+            change_set["transitions"].append(
+                _transition(agent_data['id'], "added", None, agent_data['status'], agent_data['zone']))
+        elif (row['name'], row['status'], row['zone'], row['zone_key']) == (
+                agent_data['name'], agent_data['status'], agent_data['zone'], agent_data['zone_key']):
+            change_set["unchanged"] += 1
+            continue
+        else:
+            change_set["updated"].append(agent_data['id'])
+            # A rename alone is not a state transition.
+            if (row['status'], row['zone']) != (agent_data['status'], agent_data['zone']):
+                change_set["transitions"].append(
+                    _transition(agent_data['id'], "changed", row, agent_data['status'], agent_data['zone']))
+        # Zone membership of active agents, for the in-memory zone index; None removes.
+        active = row is None or row['is_active']
+        change_set["zone_keys"][agent_data['id']] = agent_data['zone_key'] if active else None
+        upserts.append(_agent_params(agent_data, now))
+    return upserts, seen_ids
+
+_INSERT_EVENT_SQL = """
+    INSERT INTO agent_events (agent_id, ts, kind, from_status, to_status, from_zone, to_zone)
+    VALUES (:agent_id, :ts, :kind, :from_status, :to_status, :from_zone, :to_zone)
+"""
+
+def _record_transitions(cursor, transitions, now):
+    """Appends transitions to agent_events."""
+    if transitions:
+        cursor.executemany(_INSERT_EVENT_SQL, [dict(t, ts=now) for t in transitions])
+
+def _apply_changes(cursor, upserts, ids_to_deactivate, transitions, now):
+    """Writes upserts, deactivations and their transitions with executemany."""
+    _record_transitions(cursor, transitions, now)
+    if upserts:
+        cursor.executemany(_UPSERT_AGENT_SQL, upserts)
+    if ids_to_deactivate:
+        cursor.executemany(
+            "UPDATE agents SET is_active = FALSE, updated_at = ? WHERE id = ?",
+            [(now, agent_id) for agent_id in ids_to_deactivate]
+        )
+
+def _deactivation_transitions(stored, agent_ids):
+    return [
+        _transition(agent_id, "deactivated", stored[agent_id], stored[agent_id]['status'], stored[agent_id]['zone'])
+        for agent_id in agent_ids
+    ]
+
+def _new_change_set():
+    return {"added": [], "updated": [], "deactivated": [], "unchanged": 0, "transitions": [], "zone_keys": {}}
+
+@metrics.DB_SECONDS.time(op="sync")
+def sync_containers_with_db(db_session, containers, id_prefixes=None):
     """
     Synchronizes the state of Docker containers with the database.
-    - Updates existing agents.
+    - Updates existing agents whose name, status or zone changed.
     - Adds new agents.
     - Marks agents that are no longer running as inactive.
+
+    The stored rows are read once, diffed against the containers, and every
+    write is applied in a single transaction.
+
+    `id_prefixes` limits deactivation to agents whose IDs start with one of
+    the prefixes, e.g. the hosts that were actually listed in a federated
+    sync. Agents on other hosts are left alone.
+
+    Returns:
+        A change set dict with the IDs that were `added`, `updated` and
+        `deactivated`, plus the number of `unchanged` agents.
     """
-    if not containers:
-        # No running containers found, so we should check if any previously active agents need to be deactivated.
-        print("DB: No running containers detected.")
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
+    change_set = _new_change_set()
+    now = datetime.utcnow()
+
+    with _session_connection(db_session) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name, status, zone, zone_key, is_active FROM agents")
+        stored = {row['id']: row for row in cursor.fetchall()}
+        active_ids = {agent_id for agent_id, row in stored.items() if row['is_active']}
+        if id_prefixes is not None:
+            prefixes = tuple(id_prefixes)
+            active_ids = {agent_id for agent_id in active_ids if agent_id.startswith(prefixes)}
+
+        if not containers and id_prefixes is None:
+            # No running containers found, so we should check if any previously active agents need to be deactivated.
+            print("DB: No running containers detected.")
+            change_set["deactivated"] = sorted(active_ids)
+            change_set["transitions"] = [
+                _transition(agent_id, "deactivated", stored[agent_id], "exited", stored[agent_id]['zone'])
+                for agent_id in change_set["deactivated"]
+            ]
+            _record_transitions(cursor, change_set["transitions"], now)
             cursor.execute("UPDATE agents SET is_active = FALSE, status = 'exited' WHERE is_active = TRUE")
             conn.commit()
             print("DB: Marked all previously active agents as inactive.")
-        return
+            return change_set
 
-    container_ids_from_docker = {c.id for c in containers}
+        upserts, seen_ids = _diff_containers(stored, containers, now, change_set,
+                                             _archived_ids(cursor, stored, containers))
+        # Deactivate agents that are in DB but no longer in Docker's active list
+        ids_to_deactivate = sorted(active_ids - seen_ids)
+        if ids_to_deactivate:
+            print(f"DB: Deactivating {len(ids_to_deactivate)} agents not found in Docker.")
+        change_set["transitions"].extend(_deactivation_transitions(stored, ids_to_deactivate))
+        _apply_changes(cursor, upserts, ids_to_deactivate, change_set["transitions"], now)
+        conn.commit()
 
-    # Get all active agent IDs from the DB to find which ones to deactivate
-    with get_db_connection() as conn:
+    change_set["deactivated"] = ids_to_deactivate
+    logger.debug("DB: Sync complete. Processed %d containers, wrote %d rows.",
+                 len(containers), len(upserts) + len(ids_to_deactivate))
+    return change_set
+
+@metrics.DB_SECONDS.time(op="update")
+def update_agents_from_containers(containers, deactivate_ids=(), db_session=None):
+    """Applies a partial sync for a few known containers.
+
+    Unlike `sync_containers_with_db`, agents that are not mentioned are left
+    untouched. Only the rows for the given containers and IDs are read.
+
+    Args:
+        containers (list): Containers whose current state should be stored.
+        deactivate_ids (iterable): Agent IDs whose containers no longer exist.
+        db_session (ConnectionPool): Optional pool to take the connection from.
+
+    Returns:
+        A change set dict in the same format as `sync_containers_with_db`.
+    """
+    change_set = _new_change_set()
+    now = datetime.utcnow()
+    ids = [c.id for c in containers] + list(deactivate_ids)
+    if not ids:
+        return change_set
+
+    with _session_connection(db_session) as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT id FROM agents WHERE is_active = TRUE")
-        agent_ids_from_db = {row['id'] for row in cursor.fetchall()}
+        placeholders = ",".join("?" for _ in ids)
+        cursor.execute(f"SELECT id, name, status, zone, zone_key, is_active FROM agents WHERE id IN ({placeholders})", ids)
+        stored = {row['id']: row for row in cursor.fetchall()}
 
-    # Sync containers from Docker to DB
-    for container in containers:
-        # Basic agent data from the container
-        agent_data = {
-            'id': container.id,
-            'name': container.name,
-            'status': container.status,
-            'mood': 'inscrutable',  # Default mood, can be updated by other processes
-        }
-        # Safely get and parse labels for zone info
-        try:
-            zone_label = container.labels.get('echosim.zone', '{}')
-            zone_info = json.loads(zone_label)
-            agent_data['zone'] = json.dumps(zone_info)
-        except (json.JSONDecodeError, TypeError):
-            agent_data['zone'] = json.dumps({'name': 'The Void', 'description': 'Unlabeled territory'})
+        upserts, _ = _diff_containers(stored, containers, now, change_set, _archived_ids(cursor, stored, containers))
+        ids_to_deactivate = sorted(
+            agent_id for agent_id in set(deactivate_ids)
+            if agent_id in stored and stored[agent_id]['is_active']
+        )
+        change_set["transitions"].extend(_deactivation_transitions(stored, ids_to_deactivate))
+        _apply_changes(cursor, upserts, ids_to_deactivate, change_set["transitions"], now)
+        conn.commit()
 
-        add_or_update_agent(agent_data)
+    change_set["deactivated"] = ids_to_deactivate
+    return change_set
 
-    # Deactivate agents that are in DB but no longer in Docker's active list
-    ids_to_deactivate = agent_ids_from_db - container_ids_from_docker
-    if ids_to_deactivate:
-        print(f"DB: Deactivating {len(ids_to_deactivate)} agents not found in Docker.")
-        for agent_id in ids_to_deactivate:
-            deactivate_agent(agent_id)
+def get_active_zone_assignments():
+    """Returns (agent_id, zone_key) for every active agent, to load a zones.ZoneIndex."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, zone_key FROM agents WHERE is_active = TRUE")
+        return [(row['id'], row['zone_key']) for row in cursor.fetchall()]
 
-    print(f"DB: Sync complete. Processed {len(containers)} containers.")
+def get_zone_agents(zone_key, active_only=True):
+    """Fetches the agents in one zone using the zone_key index."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        query = f"SELECT {AGENT_COLUMNS} FROM agents WHERE zone_key = ?"
+        if active_only:
+            query += " AND is_active = TRUE"
+        cursor.execute(query, (zone_key,))
+        return [dict(row) for row in cursor.fetchall()]
 
 def get_memory_garden_agents():
     """Fetches all inactive agents (Echoes in the Memory Garden)."""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM agents WHERE is_active = FALSE ORDER BY updated_at DESC")
+        cursor.execute(f"SELECT {AGENT_COLUMNS} FROM agents WHERE is_active = FALSE ORDER BY updated_at DESC, id DESC")
         return [dict(row) for row in cursor.fetchall()]
 
+def _encode_cursor(updated_at, agent_id):
+    return base64.urlsafe_b64encode(json.dumps([updated_at, agent_id]).encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor):
+    try:
+        updated_at, agent_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return updated_at, agent_id
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+def get_memory_garden_page(limit=50, cursor=None):
+    """Fetches one page of inactive agents, most recently retired first.
+
+    Uses keyset pagination on (updated_at, id), so every page costs the same
+    index range scan no matter how many agents have been retired.
+
+    Args:
+        limit (int): Maximum number of agents to return.
+        cursor (str): The `next_cursor` from the previous page, or None for the first page.
+
+    Returns:
+        A tuple (agents, next_cursor); next_cursor is None on the last page.
+    """
+    params = []
+    query = f"SELECT {AGENT_COLUMNS} FROM agents WHERE is_active = FALSE"
+    if cursor:
+        query += " AND (updated_at, id) < (?, ?)"
+        params.extend(_decode_cursor(cursor))
+    query += " ORDER BY updated_at DESC, id DESC LIMIT ?"
+    # Fetch one extra row to know whether there is a next page.
+    params.append(limit + 1)
+
+    with get_db_connection() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(query, params)
+        rows = [dict(row) for row in db_cursor.fetchall()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]['updated_at'], rows[-1]['id'])
+    return rows, next_cursor
+
+@metrics.DB_SECONDS.time(op="get_all_agents")
 def get_all_agents(active_only=True):
     """Fetches all agents from the database."""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        query = "SELECT * FROM agents"
+        query = f"SELECT {AGENT_COLUMNS} FROM agents"
         if active_only:
             query += " WHERE is_active = TRUE"
         cursor.execute(query)
         return [dict(row) for row in cursor.fetchall()]
 
+def get_known_agent_ids(agent_ids):
+    """Returns the subset of `agent_ids` that have a row in the agents table."""
+    agent_ids = list(dict.fromkeys(agent_ids))
+    known = set()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        for start in range(0, len(agent_ids), 500):
+            chunk = agent_ids[start:start + 500]
+            cursor.execute(f"SELECT id FROM agents WHERE id IN ({','.join('?' for _ in chunk)})", chunk)
+            known.update(row['id'] for row in cursor.fetchall())
+    return known
+
 def deactivate_agent(agent_id):
     """Marks an agent as inactive (moves to Memory Garden)."""
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        now = datetime.utcnow()
+        cursor.execute("SELECT id, status, zone FROM agents WHERE id = ? AND is_active = TRUE", (agent_id,))
+        row = cursor.fetchone()
+        if row is not None:
+            _record_transitions(cursor, _deactivation_transitions({agent_id: row}, [agent_id]), now)
         cursor.execute("""
             UPDATE agents
             SET is_active = FALSE, updated_at = ?
             WHERE id = ?
-        """, (datetime.utcnow(), agent_id))
+        """, (now, agent_id))
+        conn.commit()
+
+@metrics.DB_SECONDS.time(op="deactivate")
+def deactivate_agents(agent_ids, db_session=None):
+    """Marks many agents as inactive in one transaction.
+
+    Returns:
+        A change set dict in the same format as `sync_containers_with_db`,
+        listing the agents that were active until now as `deactivated`.
+    """
+    change_set = _new_change_set()
+    agent_ids = list(dict.fromkeys(agent_ids))
+    if not agent_ids:
+        return change_set
+    now = datetime.utcnow()
+    with _session_connection(db_session) as conn:
+        cursor = conn.cursor()
+        stored = {}
+        for start in range(0, len(agent_ids), 500):
+            chunk = agent_ids[start:start + 500]
+            cursor.execute(f"SELECT id, status, zone FROM agents WHERE is_active = TRUE AND id IN ({','.join('?' for _ in chunk)})", chunk)
+            stored.update((row['id'], row) for row in cursor.fetchall())
+        ids_to_deactivate = [agent_id for agent_id in agent_ids if agent_id in stored]
+        change_set["transitions"] = _deactivation_transitions(stored, ids_to_deactivate)
+        _apply_changes(cursor, [], ids_to_deactivate, change_set["transitions"], now)
+        conn.commit()
+    change_set["deactivated"] = ids_to_deactivate
+    return change_set
+
+def _event_filters(agent_id=None, start=None, end=None, kind=None, to_status=None, time_column="ts"):
+    """Builds a WHERE clause and parameters for agent event queries."""
+    clauses, params = [], []
+    for column, value in (("agent_id", agent_id), ("kind", kind), ("to_status", to_status)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if start is not None:
+        clauses.append(f"{time_column} >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append(f"{time_column} < ?")
+        params.append(end)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def get_agent_events(agent_id, start=None, end=None, limit=1000):
+    """Fetches an agent's recorded transitions in a time range, oldest first.
+
+    Args:
+        agent_id (str): The agent to look up.
+        start (datetime): Inclusive lower bound, or None.
+        end (datetime): Exclusive upper bound, or None.
+        limit (int): Maximum number of events to return.
+
+    Returns:
+        A list of event dictionaries.
+    """
+    where, params = _event_filters(agent_id, start, end)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT * FROM agent_events{where} ORDER BY ts, id LIMIT ?", params + [limit])
+        return [dict(row) for row in cursor.fetchall()]
+
+def count_agent_events(agent_id=None, kind=None, to_status=None, start=None, end=None):
+    """Counts transitions, including those already compacted into hourly summaries.
+
+    For example, `count_agent_events(agent_id, kind="changed", to_status="running")`
+    answers how often an Echo has (re)started. Compacted events are matched by
+    the hour they fall in, so range bounds are exact only for recent events.
+
+    Returns:
+        The number of matching events.
+    """
+    raw_where, raw_params = _event_filters(agent_id, start, end, kind, to_status)
+    hourly_where, hourly_params = _event_filters(agent_id, start, end, kind, to_status, time_column="hour")
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM agent_events{raw_where}", raw_params)
+        raw_count = cursor.fetchone()[0]
+        cursor.execute(f"SELECT COALESCE(SUM(count), 0) FROM agent_event_hourly{hourly_where}", hourly_params)
+        return raw_count + cursor.fetchone()[0]
+
+def get_agent_event_counts(kind=None, to_status=None, start=None, end=None, limit=20):
+    """Aggregates transition counts per agent, busiest agents first.
+
+    Returns:
+        A list of (agent_id, count) tuples.
+    """
+    raw_where, raw_params = _event_filters(None, start, end, kind, to_status)
+    hourly_where, hourly_params = _event_filters(None, start, end, kind, to_status, time_column="hour")
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT agent_id, SUM(n) AS total FROM (
+                SELECT agent_id, COUNT(*) AS n FROM agent_events{raw_where} GROUP BY agent_id
+                UNION ALL
+                SELECT agent_id, SUM(count) AS n FROM agent_event_hourly{hourly_where} GROUP BY agent_id
+            )
+            GROUP BY agent_id
+            ORDER BY total DESC, agent_id
+            LIMIT ?
+        """, raw_params + hourly_params + [limit])
+        return [(row['agent_id'], row['total']) for row in cursor.fetchall()]
+
+@metrics.DB_SECONDS.time(op="compact")
+def compact_agent_events(retention_days=7, summary_retention_days=365, now=None):
+    """Rolls events older than the retention window into per-hour summaries.
+
+    Args:
+        retention_days (float): Raw events younger than this are kept as-is.
+        summary_retention_days (float): Hourly summaries older than this are
+            deleted. None keeps them forever.
+        now (datetime): The current time; defaults to utcnow.
+
+    Returns:
+        The number of raw events that were compacted.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=retention_days)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO agent_event_hourly (agent_id, hour, kind, to_status, count)
+            SELECT agent_id, strftime('%Y-%m-%d %H:00:00', ts), kind, COALESCE(to_status, ''), COUNT(*)
+            FROM agent_events
+            WHERE ts < ?
+            GROUP BY agent_id, strftime('%Y-%m-%d %H:00:00', ts), kind, COALESCE(to_status, '')
+            ON CONFLICT (agent_id, hour, kind, to_status) DO UPDATE SET count = count + excluded.count
+        """, (cutoff,))
+        cursor.execute("DELETE FROM agent_events WHERE ts < ?", (cutoff,))
+        compacted = cursor.rowcount
+        if summary_retention_days is not None:
+            cursor.execute("DELETE FROM agent_event_hourly WHERE hour < ?",
+                           (now - timedelta(days=summary_retention_days),))
         conn.commit()
+    if compacted:
+        print(f"DB: Compacted {compacted} agent events older than {retention_days} days.")
+    return compacted
 
 # Initialize the database when the module is loaded
 if __name__ == '__main__':
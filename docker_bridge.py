@@ -1,12 +1,31 @@
 import docker
 import os
+from threading import Lock
+
+import metrics
+from image_cache import ImageCache
+
+# Re-exported so callers importing this module as `docker` can catch SDK errors.
+errors = docker.errors
+
+# Container lifecycle events that affect an agent's stored state.
+CONTAINER_EVENTS = ("create", "start", "die", "stop", "pause", "unpause", "destroy")
 
 # --- Docker Client Initialization ---
 _client = None
 
 def get_docker_client():
-    """Initializes and returns a Docker client, reusing if already created."""
+    """Initializes and returns a Docker client, reusing if already created.
+
+    With DOCKER_HOSTS set, returns the client of the first reachable host.
+    """
     global _client
+    if DOCKER_HOSTS:
+        for host in DOCKER_HOSTS:
+            client = get_host_client(host)
+            if client is not None:
+                return client
+        return None
     if _client is not None:
         return _client
 
@@ -51,6 +70,93 @@ def get_docker_client():
 
     return _client
 
+# --- Multi-host Federation ---
+# DOCKER_HOSTS="edge1=tcp://10.0.0.5:2375,edge2=ssh://docker@10.0.0.6" makes the
+# engine manage every listed daemon. Agent IDs then take the form "<host>:<container id>".
+HOST_SEPARATOR = ":"
+
+def _parse_hosts(spec):
+    """Parses a DOCKER_HOSTS value into an ordered {alias: url} dict."""
+    hosts = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        alias, sep, url = (part.strip() for part in item.partition("="))
+        if not sep or not alias or not url or HOST_SEPARATOR in alias:
+            raise ValueError(f"Invalid DOCKER_HOSTS entry '{item}': expected <alias>=<url>, with no ':' in the alias")
+        hosts[alias] = url
+    return hosts
+
+DOCKER_HOSTS = _parse_hosts(os.environ.get("DOCKER_HOSTS", ""))
+# Seconds a federated host may take to answer one API call.
+HOST_TIMEOUT = float(os.environ.get("ECHOSIM_HOST_TIMEOUT", "10"))
+_host_clients = {}
+_host_clients_lock = Lock()
+
+def get_hosts():
+    """Returns the federated host aliases, or an empty list in single-host mode."""
+    return list(DOCKER_HOSTS)
+
+def get_host_client(host):
+    """Returns the client for one federated host, connecting on first use.
+
+    Returns:
+        A DockerClient, or None if the host is unknown or unreachable. An
+        unreachable host is retried on the next call.
+    """
+    client = _host_clients.get(host)
+    if client is not None:
+        return client
+    url = DOCKER_HOSTS.get(host)
+    if url is None:
+        return None
+    try:
+        client = docker.DockerClient(base_url=url, timeout=HOST_TIMEOUT)
+        client.ping()
+    except docker.errors.DockerException as e:
+        print(f"Could not connect to Docker host '{host}' ({url}): {e}")
+        return None
+    with _host_clients_lock:
+        return _host_clients.setdefault(host, client)
+
+def qualify_id(host, container_id):
+    """Returns the agent ID for a container on `host` (the bare ID in single-host mode)."""
+    return f"{host}{HOST_SEPARATOR}{container_id}" if host else container_id
+
+def split_agent_id(agent_id):
+    """Splits an agent ID into (host, container_id); host is None in single-host mode."""
+    if DOCKER_HOSTS:
+        host, sep, container_id = agent_id.partition(HOST_SEPARATOR)
+        if sep and host in DOCKER_HOSTS:
+            return host, container_id
+    return None, agent_id
+
+def _resolve(agent_id):
+    """Returns (client, container_id) for the daemon that owns an agent."""
+    host, container_id = split_agent_id(agent_id)
+    client = get_host_client(host) if host else get_docker_client()
+    return client, container_id
+
+# Locally present images, refreshed in the background; see image_cache.ImageCache.
+image_cache = ImageCache(get_docker_client,
+                         refresh_interval=float(os.environ.get("ECHOSIM_IMAGE_REFRESH_INTERVAL", "300")))
+_host_image_caches = {}
+
+def get_image_cache(host=None):
+    """Returns the image cache for a federated host, or the default cache."""
+    if not host:
+        return image_cache
+    with _host_clients_lock:
+        if host not in _host_image_caches:
+            _host_image_caches[host] = ImageCache(lambda: get_host_client(host),
+                                                  refresh_interval=image_cache.refresh_interval)
+        return _host_image_caches[host]
+
+def get_image_caches():
+    """Returns one image cache per daemon."""
+    return [get_image_cache(host) for host in DOCKER_HOSTS] or [image_cache]
+
 def get_all_containers():
     """Fetches a list of all containers from the Docker daemon."""
     client = get_docker_client()
@@ -62,26 +168,157 @@ def get_all_containers():
         print(f"Error fetching containers: {e}")
         return []
 
+# Server-side label filters for the lean listing used by sync, e.g. "source=echosim".
+# Set ECHOSIM_LABEL_FILTER to an empty string to treat every container as an agent.
+LABEL_FILTERS = [f.strip() for f in os.environ.get("ECHOSIM_LABEL_FILTER", "source=echosim").split(",") if f.strip()]
+
+def has_agent_labels(labels):
+    """Whether a container's labels match LABEL_FILTERS; with no filters, every container does."""
+    labels = labels or {}
+    for label_filter in LABEL_FILTERS:
+        key, sep, value = label_filter.partition("=")
+        if key not in labels or (sep and labels[key] != value):
+            return False
+    return True
+
+class ContainerSummary:
+    """
+    A container as reported by a single list call: just the fields sync stores.
+
+    `containers.list()` inspects every container one by one; this record is
+    built from the list response alone. Full inspect data is fetched only if
+    something reads `attrs`.
+    """
+
+    __slots__ = ("id", "host", "name", "status", "labels", "_attrs")
+
+    def __init__(self, entry, host=None):
+        self.host = host
+        self.id = qualify_id(host, entry["Id"])
+        names = entry.get("Names") or []
+        self.name = names[0].lstrip("/") if names else entry["Id"][:12]
+        self.status = entry.get("State")
+        self.labels = entry.get("Labels") or {}
+        self._attrs = None
+
+    @classmethod
+    def from_attrs(cls, attrs, host=None):
+        """Builds a record from full inspect data, e.g. `Container.attrs`."""
+        summary = cls({
+            "Id": attrs["Id"],
+            "Names": [attrs["Name"]] if attrs.get("Name") else [],
+            "State": attrs["State"]["Status"],
+            "Labels": attrs["Config"].get("Labels"),
+        }, host)
+        summary._attrs = attrs
+        return summary
+
+    @property
+    def attrs(self):
+        """The container's full inspect data, fetched on first access."""
+        if self._attrs is None:
+            client, container_id = _resolve(self.id)
+            self._attrs = client.api.inspect_container(container_id)
+        return self._attrs
+
+@metrics.DOCKER_API_SECONDS.time(call="list")
+def list_containers(label_filters=None, host=None):
+    """Lists containers with one API call and server-side label filtering.
+
+    Args:
+        label_filters (list): Label filters such as "source=echosim"; defaults
+            to LABEL_FILTERS. An empty list matches every container.
+        host (str): The federated host to list; records get host-qualified IDs.
+
+    Returns:
+        A list of ContainerSummary records.
+
+    Raises:
+        docker.errors.APIError: If the daemon rejects the call. Unlike
+            `get_all_containers`, errors are not turned into an empty list,
+            which a sync would read as "every agent is gone".
+    """
+    client = get_host_client(host) if host else get_docker_client()
+    if not client:
+        raise docker.errors.DockerException(f"Docker host '{host}' not available" if host else "Docker client not available")
+    label_filters = LABEL_FILTERS if label_filters is None else label_filters
+    filters = {"label": list(label_filters)} if label_filters else None
+    return [ContainerSummary(entry, host) for entry in client.api.containers(all=True, filters=filters)]
+
+@metrics.DOCKER_API_SECONDS.time(call="inspect")
+def get_container(container_id):
+    """Fetches a single container, or None if it does not exist.
+
+    For a host-qualified agent ID, returns a ContainerSummary carrying that ID.
+    """
+    host, _ = split_agent_id(container_id)
+    client, raw_id = _resolve(container_id)
+    if not client:
+        return None
+    try:
+        container = client.containers.get(raw_id)
+    except docker.errors.NotFound:
+        return None
+    return ContainerSummary.from_attrs(container.attrs, host) if host else container
+
+def stream_container_events(since=None, host=None):
+    """Subscribes to the daemon's container lifecycle events.
+
+    Args:
+        since: Only return events after this time (a Docker timestamp such as
+            "1700000000.123456789", an int, or a datetime).
+        host (str): The federated host to follow. Event IDs are not qualified.
+
+    Returns:
+        A closable iterator of decoded event dicts.
+    """
+    client = get_host_client(host) if host else get_docker_client()
+    if not client:
+        raise docker.errors.DockerException(f"Docker host '{host}' not available" if host else "Docker client not available")
+    filters = {"type": "container", "event": list(CONTAINER_EVENTS)}
+    if LABEL_FILTERS:
+        filters["label"] = LABEL_FILTERS
+    return client.events(since=since, decode=True, filters=filters)
+
+@metrics.DOCKER_API_SECONDS.time(call="stats")
 def get_container_stats(container_id):
     """Fetches real-time stats for a specific container."""
-    client = get_docker_client()
+    client, raw_id = _resolve(container_id)
     if not client:
         return None
     try:
-        container = client.containers.get(container_id)
+        container = client.containers.get(raw_id)
         stats = container.stats(stream=False) # Get a single snapshot of stats
         return stats
     except (docker.errors.NotFound, docker.errors.APIError) as e:
         print(f"Error fetching stats for container {container_id}: {e}")
         return None
 
+@metrics.DOCKER_API_SECONDS.time(call="stats")
+def get_container_stats_snapshot(container_id):
+    """Fetches one stats sample without waiting for the daemon's CPU sampling cycle.
+
+    Uses the low-level API with `one_shot=True`, which returns immediately and
+    skips the per-container inspect. `precpu_stats` is empty in this mode, so
+    callers compute CPU usage from their own previous sample.
+    """
+    client, raw_id = _resolve(container_id)
+    if not client:
+        return None
+    try:
+        return client.api.stats(raw_id, stream=False, one_shot=True)
+    except (docker.errors.NotFound, docker.errors.APIError) as e:
+        print(f"Error fetching stats for container {container_id}: {e}")
+        return None
+
+@metrics.DOCKER_API_SECONDS.time(call="logs")
 def get_container_logs(container_id, tail=100):
     """Fetches logs for a specific container."""
-    client = get_docker_client()
+    client, raw_id = _resolve(container_id)
     if not client:
         return False, "Docker client not available"
     try:
-        container = client.containers.get(container_id)
+        container = client.containers.get(raw_id)
         logs = container.logs(tail=tail).decode('utf-8')
         return True, logs
     except docker.errors.NotFound:
@@ -89,13 +326,34 @@ def get_container_logs(container_id, tail=100):
     except Exception as e:
         return False, f"Error fetching logs: {e}"
 
+def stream_container_logs(container_id, since=None, tail='all'):
+    """Opens a follow-mode log stream for a container.
+
+    Lines are prefixed with the daemon's RFC 3339 timestamp, so callers can
+    resume a dropped stream with `since`.
+
+    Args:
+        container_id (str): The container to follow.
+        since (float): Only return lines after this Unix timestamp.
+        tail (int or 'all'): Number of existing lines to start with.
+
+    Returns:
+        A closable iterator of raw byte chunks.
+    """
+    client, raw_id = _resolve(container_id)
+    if not client:
+        raise docker.errors.DockerException("Docker client not available")
+    container = client.containers.get(raw_id)
+    return container.logs(stream=True, follow=True, timestamps=True, since=since, tail=tail)
+
+@metrics.DOCKER_API_SECONDS.time(call="control")
 def control_container(container_id, action):
     """Performs an action (start, stop, restart) on a container."""
-    client = get_docker_client()
+    client, raw_id = _resolve(container_id)
     if not client:
         return False, "Docker client not available"
     try:
-        container = client.containers.get(container_id)
+        container = client.containers.get(raw_id)
         if action == "start":
             container.start()
             return True, f"Container {container_id} started."
@@ -110,30 +368,82 @@ def control_container(container_id, action):
     except (docker.errors.NotFound, docker.errors.APIError) as e:
         return False, f"Error performing '{action}' on container {container_id}: {e}"
 
-def create_agent(name, image="hello-world"):
-    """Creates and starts a new Docker container (agent)."""
-    client = get_docker_client()
+@metrics.DOCKER_API_SECONDS.time(call="stop")
+def stop_container(container_id, timeout=10, kill=False):
+    """Stops a container, giving it `timeout` seconds before Docker kills it.
+
+    Args:
+        container_id (str): The container to stop.
+        timeout (float): Grace period in seconds.
+        kill (bool): Send SIGKILL directly if the stop call itself fails or times out.
+
+    Returns:
+        A tuple (success, message). A container that no longer exists counts as
+        stopped. Containers without the agent labels (see LABEL_FILTERS) are
+        left running.
+    """
+    client, raw_id = _resolve(container_id)
     if not client:
         return False, "Docker client not available"
+    try:
+        container = client.containers.get(raw_id)
+    except docker.errors.NotFound:
+        return True, f"Container {container_id} no longer exists."
+    except docker.errors.APIError as e:
+        return False, f"Error stopping container {container_id}: {e}"
+    # The daemon resolves ID prefixes; never stop a container that is not an agent.
+    if not has_agent_labels(container.labels):
+        return False, f"Container {container_id} is not an agent container."
+    try:
+        container.stop(timeout=timeout)
+        return True, f"Container {container_id} stopped."
+    except docker.errors.NotFound:
+        return True, f"Container {container_id} no longer exists."
+    except Exception as e:
+        if not kill:
+            return False, f"Error stopping container {container_id}: {e}"
+        print(f"Stopping container {container_id} failed ({e}); killing it.")
+    try:
+        container.kill()
+        return True, f"Container {container_id} killed."
+    except docker.errors.NotFound:
+        return True, f"Container {container_id} no longer exists."
+    except docker.errors.APIError as e:
+        return False, f"Error killing container {container_id}: {e}"
+
+@metrics.DOCKER_API_SECONDS.time(call="create")
+def create_agent(name, image="hello-world", host=None):
+    """Creates and starts a new Docker container (agent).
+
+    With DOCKER_HOSTS set, the agent is created on `host`, or on the first
+    reachable host, and the returned ID is host-qualified.
+    """
+    if DOCKER_HOSTS and not host:
+        host = next((h for h in DOCKER_HOSTS if get_host_client(h) is not None), None)
+    if host and host not in DOCKER_HOSTS:
+        return False, f"Unknown Docker host '{host}'"
+    client = get_host_client(host) if host else get_docker_client()
+    if not client:
+        return False, "Docker client not available"
+    image_cache = get_image_cache(host)
     try:
         print(f"Attempting to create agent '{name}' from image '{image}'...")
-        # Ensure the image is available locally
+        # Ensure the image is available locally; a no-op when the cache already knows it.
+        image_cache.ensure(image)
+
         try:
-            client.images.get(image)
-            print(f"Image '{image}' found locally.")
+            container = client.containers.run(
+                image,
+                detach=True,
+                name=name,
+                labels={"source": "echosim"}
+            )
         except docker.errors.ImageNotFound:
-            print(f"Image '{image}' not found locally. Pulling from Docker Hub...")
-            client.images.pull(image)
-            print(f"Successfully pulled image '{image}'.")
-
-        container = client.containers.run(
-            image,
-            detach=True,
-            name=name,
-            labels={"source": "echosim"}
-        )
+            # The image was removed since the cache last saw it.
+            image_cache.invalidate(image)
+            raise
         print(f"Successfully created and started container {container.id} ({name})")
-        return True, container.id
+        return True, qualify_id(host, container.id)
     except docker.errors.APIError as e:
         print(f"Error creating container: {e}")
         return False, str(e)
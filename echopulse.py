@@ -1,91 +1,687 @@
 import asyncio
+import logging
+import math
+import os
 import uvicorn
 import json
 import db
+import docker_bridge
 from sim_engine import SimEngine
 import memory_garden
-from docker_bridge import get_container_logs, control_container
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import archive
+import zones
+import metrics
+from snapshot import AgentSnapshotTracker, SnapshotEncoder, available_encodings
+from fanout import ClientChannel
+from log_streams import LogStreamHub
+from stats_sampler import StatsSampler
+from async_bridge import AsyncDockerBridge
+from cluster import ClusterNode
+from subscriptions import Subscription, SubscriptionRouter
+from thoughts import ThoughtLog
+from task_queue import Dispatcher, Omega
+import task_queue
+from fastapi import FastAPI, Response, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from typing import List
+from typing import Dict, List
 from datetime import datetime
 
 # --- Global SimEngine Instance ---
 sim_engine: SimEngine = None
+stats_sampler: StatsSampler = None
+# Alpha: hands queued tasks to idle agents; runs beside the sync services.
+dispatcher: Dispatcher = None
+# Set when running with several workers; see cluster.ClusterNode.
+cluster: ClusterNode = None
+
+logging.basicConfig(level=os.environ.get("ECHOSIM_LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
 
 # --- FastAPI App Initialization ---
 app = FastAPI(title="EchoPulse WebSocket Server")
 
 @app.on_event("startup")
 async def startup_event():
-    """Handles application startup logic."""
-    global sim_engine
+    """Handles application startup logic.
+
+    With ECHOSIM_WORKERS > 1, uvicorn runs several copies of this app. Each
+    one serves its own WebSocket clients, but only the worker holding the
+    cluster lock talks to Docker; the others follow its change feed.
+    """
+    global sim_engine, cluster
     print("--- Server starting up... ---")
     db.init_db()
+    archive.init_archive()
     print("--- Database initialized. ---")
-    # Initialize and start the simulation engine
+    # Initialize the simulation engine; every worker uses it for commands
     print("--- Initializing SimEngine... ---")
-    sim_engine = SimEngine(db_session=db.get_db_connection())
-    print("--- SimEngine initialized. Starting... ---")
-    sim_engine.start()
-    print("--- SimEngine started. ---")
+    loop = asyncio.get_running_loop()
+    sim_engine = SimEngine(
+        db_session=db.get_pool(),
+        sync_mode=os.environ.get("ECHOSIM_SYNC_MODE", "poll"),
+        on_change=lambda change_set: loop.call_soon_threadsafe(publish_change_set, change_set),
+        archive_after_days=archive.ARCHIVE_AFTER_DAYS if archive.ARCHIVE_AFTER_DAYS > 0 else None,
+    )
+    sim_engine.load_zone_index()
+    print("--- SimEngine initialized. ---")
+    # Every worker writes the thoughts its own clients send
+    thought_log.db_session = db.get_pool()
+    thought_log.start()
+
+    if int(os.environ.get("ECHOSIM_WORKERS", "1")) > 1:
+        cluster = ClusterNode(
+            os.environ.get("ECHOSIM_CLUSTER_DIR", os.path.join(os.path.dirname(os.path.abspath(db.DATABASE_FILE)), ".echosim-cluster")),
+            on_promote=start_sync_services,
+            on_message=handle_cluster_message,
+            on_call=run_command,
+            on_connect=request_zone_reconcile,
+        )
+        asyncio.create_task(cluster.run())
+        print("--- Joined the worker cluster. ---")
+    else:
+        await start_sync_services()
 
     # Start the continuous broadcast loop
     print("--- Creating periodic broadcast task... ---")
     asyncio.create_task(periodic_broadcast())
     print("--- Startup complete. ---")
 
+async def start_sync_services():
+    """Starts the Docker-facing background services. Runs in one worker only."""
+    global stats_sampler, dispatcher
+    if cluster:
+        # A promoted follower's index may have missed feed messages; start the leader from the database.
+        sim_engine.load_zone_index()
+    print("--- Starting SimEngine... ---")
+    sim_engine.start()
+    print("--- SimEngine started. ---")
+
+    # Load the local image list and pull warm images in the background
+    if sim_engine.docker_client:
+        prefetch = [i.strip() for i in os.environ.get("ECHOSIM_PREFETCH_IMAGES", "hello-world").split(",") if i.strip()]
+        for cache in docker_bridge.get_image_caches():
+            cache.start(prefetch=prefetch)
+
+    # Sample container stats in the background and push them to subscribers
+    stats_interval = float(os.environ.get("ECHOSIM_STATS_INTERVAL", "5"))
+    if stats_interval > 0 and sim_engine.docker_client:
+        loop = asyncio.get_running_loop()
+        stats_sampler = StatsSampler(
+            interval=stats_interval,
+            on_sample=lambda samples: loop.call_soon_threadsafe(publish_stats, samples),
+        )
+        # Sample only what some worker's clients are subscribed to.
+        apply_stats_watch()
+        stats_sampler.start()
+        print("--- Stats sampler started. ---")
+
+    # Hand queued tasks to idle agents in batches
+    loop = asyncio.get_running_loop()
+    dispatcher = Dispatcher(
+        deliver=lambda tasks: loop.call_soon_threadsafe(publish_tasks, tasks),
+        batch_size=int(os.environ.get("ECHOSIM_TASK_BATCH", "100")),
+        lease_seconds=float(os.environ.get("ECHOSIM_TASK_LEASE", "60")),
+    )
+    dispatcher.start()
+    print("--- Task dispatcher started. ---")
+
 @app.on_event("shutdown")
-def shutdown_event():
+async def shutdown_event():
     """Handles application shutdown logic."""
     print("--- Server shutting down ---")
     if sim_engine:
         sim_engine.stop()
+    if stats_sampler:
+        stats_sampler.stop()
+    thought_log.stop()
+    if dispatcher:
+        dispatcher.stop()
+    for cache in docker_bridge.get_image_caches():
+        cache.stop()
+    if cluster:
+        await cluster.close()
+    docker_io.shutdown()
+    db.get_pool().close_all()
 
 # --- Connection Manager ---
 
+def json_encoder(obj):
+    """Custom JSON encoder to handle datetime objects."""
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+# State messages for fleets at least this large are encoded in a worker thread.
+ENCODE_OFFLOAD_THRESHOLD = int(os.environ.get("ECHOSIM_ENCODE_OFFLOAD_THRESHOLD", "1000"))
+
 class ConnectionManager:
-    """Manages active WebSocket connections."""
-    def __init__(self):
+    """Manages active WebSocket connections.
+
+    Every client gets a ClientChannel with its own bounded queue and writer
+    task, so broadcasts fan out concurrently and a slow client only falls
+    behind itself.
+    """
+    def __init__(self, max_queue=32, policy="coalesce", send_timeout=10):
         self.active_connections: List[WebSocket] = []
+        self.channels: Dict[WebSocket, ClientChannel] = {}
+        # Per-client sync state: last generation acknowledged, last generation sent, wire encoding.
+        self.client_state: Dict[WebSocket, dict] = {}
+        # Clients that asked for a filtered view; everyone else gets the shared broadcast.
+        self.subscriptions = SubscriptionRouter()
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
+        channel = ClientChannel(
+            websocket,
+            max_queue=self.max_queue,
+            policy=self.policy,
+            send_timeout=self.send_timeout,
+            on_close=lambda ch: self.disconnect(ch.websocket),
+        )
         self.active_connections.append(websocket)
+        self.channels[websocket] = channel
+        self.client_state[websocket] = {"acked": None, "sent": None, "encoding": "json"}
+        channel.start()
         print(f"New connection: {websocket.client}. Total connections: {len(self.active_connections)}")
 
     def disconnect(self, websocket: WebSocket):
+        if websocket not in self.channels:
+            return
         self.active_connections.remove(websocket)
+        channel = self.channels.pop(websocket)
+        self.client_state.pop(websocket, None)
+        self.subscriptions.unsubscribe(websocket)
+        if not channel.closed:
+            asyncio.ensure_future(channel.close())
         print(f"Connection closed: {websocket.client}. Total connections: {len(self.active_connections)}")
 
+    def acknowledge(self, websocket: WebSocket, generation):
+        """Records the generation a client has applied."""
+        state = self.client_state.get(websocket)
+        if state is not None and isinstance(generation, int):
+            state["acked"] = generation
+
+    def send(self, websocket: WebSocket, message, coalesce_key=None):
+        """Queues an encoded message for one client."""
+        channel = self.channels.get(websocket)
+        if channel is None:
+            return False
+        return channel.offer(message, coalesce_key)
+
+    async def send_json(self, websocket: WebSocket, data: dict):
+        """Queues a JSON reply for one client."""
+        self.send(websocket, json.dumps(data, default=json_encoder))
+
+    def set_encoding(self, websocket: WebSocket, encoding: str):
+        """Switches the wire encoding of one client's state messages.
+
+        Raises:
+            ValueError: If the encoding is not available on this server.
+        """
+        if encoding not in available_encodings():
+            raise ValueError(f"Unsupported encoding '{encoding}'. Available: {', '.join(available_encodings())}")
+        state = self.client_state.get(websocket)
+        if state is not None:
+            state["encoding"] = encoding
+
+    def subscribe(self, websocket: WebSocket, subscription: Subscription):
+        """Limits one client's state messages to the agents its subscription matches."""
+        if websocket in self.client_state:
+            self.subscriptions.subscribe(websocket, subscription)
+
+    def unsubscribe(self, websocket: WebSocket):
+        """Returns a client to the unfiltered broadcast."""
+        self.subscriptions.unsubscribe(websocket)
+
+    def _filtered_snapshot(self, websocket: WebSocket, encoder: SnapshotEncoder, encoding: str):
+        tracker = encoder.tracker
+        return encoder.dumps({
+            "type": "full_update",
+            "generation": tracker.generation,
+            "agents": self.subscriptions.snapshot_agents(websocket, tracker),
+        }, encoding)
+
+    async def send_snapshot(self, websocket: WebSocket, encoder: SnapshotEncoder):
+        """Sends a full snapshot of the current generation to one client."""
+        state = self.client_state.get(websocket)
+        if state is None:
+            return
+        if websocket in self.subscriptions:
+            self.subscriptions.index(encoder.tracker)
+            message = self._filtered_snapshot(websocket, encoder, state["encoding"])
+        else:
+            message = encoder.encode_snapshot(state["encoding"])
+        self.send(websocket, message, coalesce_key="state")
+        state["sent"] = encoder.tracker.generation
+
+    async def broadcast_state(self, encoder: SnapshotEncoder):
+        """Sends every client the changes since the generation it last acknowledged.
+
+        Clients that are already up to date get nothing. Clients that have not
+        acknowledged anything yet, or that fell behind the tracker's history,
+        get a full snapshot. State messages coalesce in a lagging client's queue,
+        since each one supersedes the previous. Each distinct (base, encoding)
+        pair is encoded once; for large fleets that happens off the event loop.
+        """
+        generation = encoder.tracker.generation
+        pending, subscribed = [], []
+        for connection in list(self.active_connections):
+            state = self.client_state.get(connection)
+            if state is None or state["sent"] == generation:
+                continue
+            if connection in self.subscriptions:
+                subscribed.append((connection, state))
+            else:
+                pending.append((connection, state, (state["acked"], state["encoding"])))
+        if subscribed:
+            self._send_subscribed(encoder, subscribed)
+        if not pending:
+            return
+
+        def encode_all(keys):
+            with metrics.ENCODE_SECONDS.time():
+                encoded = {key: encoder.encode_state(*key) for key in keys}
+            for (_, encoding), message in encoded.items():
+                metrics.PAYLOAD_BYTES.observe(len(message), encoding=encoding)
+            return encoded
+
+        keys = {key for _, _, key in pending}
+        if len(encoder.tracker.agents) >= ENCODE_OFFLOAD_THRESHOLD:
+            encoded = await asyncio.to_thread(encode_all, keys)
+        else:
+            encoded = encode_all(keys)
+        for connection, state, key in pending:
+            if self.send(connection, encoded[key], coalesce_key="state"):
+                state["sent"] = generation
+
+    def _send_subscribed(self, encoder: SnapshotEncoder, pending):
+        """Sends subscribed clients only the changes their filters route to them.
+
+        Clients with nothing relevant get an empty delta, encoded once per
+        base, so their acknowledged generation keeps moving.
+        """
+        tracker = encoder.tracker
+        self.subscriptions.index(tracker)
+        by_base = {}
+        for connection, state in pending:
+            by_base.setdefault(state["acked"], []).append((connection, state))
+
+        for base, group in by_base.items():
+            delta = tracker.delta_since(base)
+            routed = self.subscriptions.route(delta, [c for c, _ in group]) if delta else None
+            empty = {}
+            for connection, state in group:
+                encoding = state["encoding"]
+                if routed is None:
+                    message = self._filtered_snapshot(connection, encoder, encoding)
+                elif any(routed[connection].values()):
+                    message = encoder.dumps({"type": "delta", "base": base, "generation": tracker.generation,
+                                             **routed[connection]}, encoding)
+                else:
+                    if encoding not in empty:
+                        empty[encoding] = encoder.dumps({"type": "delta", "base": base, "generation": tracker.generation,
+                                                         "added": [], "changed": [], "removed": []}, encoding)
+                    message = empty[encoding]
+                if self.send(connection, message, coalesce_key="state"):
+                    state["sent"] = tracker.generation
+
     async def broadcast_json(self, data: dict):
         """Broadcasts JSON data to all connected clients."""
-        # Custom JSON encoder to handle datetime objects
-        def json_encoder(obj):
-            if isinstance(obj, datetime):
-                return obj.isoformat()
-            raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
-        
         message = json.dumps(data, default=json_encoder)
-        for connection in self.active_connections:
-            await connection.send_text(message)
+        for connection in list(self.active_connections):
+            self.send(connection, message)
+
+    def lag_report(self):
+        """Returns fan-out statistics for every connected client."""
+        return [channel.stats() for channel in self.channels.values()]
 
-manager = ConnectionManager()
+manager = ConnectionManager(
+    max_queue=int(os.environ.get("ECHOSIM_CLIENT_QUEUE_SIZE", "32")),
+    policy=os.environ.get("ECHOSIM_SLOW_CONSUMER_POLICY", "coalesce"),
+)
+tracker = AgentSnapshotTracker()
+# Caches each agent's serialized form between broadcasts.
+encoder = SnapshotEncoder(tracker, default=json_encoder)
+# Blocking Docker calls run here so they never stall the event loop.
+docker_io = AsyncDockerBridge()
+# Shared follow-mode log streams, one upstream per container.
+log_hub = LogStreamHub()
+# Batched thought appends and their followers.
+thought_log = ThoughtLog()
+
+# Largest Memory Garden page a client may request.
+MAX_GARDEN_PAGE_SIZE = 200
+
+# Limits for batch agent creation requests.
+MAX_CREATE_BATCH = 500
+MAX_CREATE_PARALLELISM = 16
+
+# Limits for bulk retirement requests.
+MAX_RETIRE_BATCH = 1000
+MAX_RETIRE_PARALLELISM = 32
+# Longest grace period a client may give each retiring container, in seconds.
+MAX_STOP_TIMEOUT = 300
+
+# Most tasks a client may enqueue in one command.
+MAX_TASK_BATCH = 10000
+
+# Omega: collects task results and decides what happens next.
+omega = Omega()
+
+# Most thoughts a client may append in one command.
+MAX_THOUGHT_BATCH = 1000
+
+# Seconds between broadcasts when no sync reports a change.
+BROADCAST_INTERVAL = 5
+# Set to broadcast before the interval is up.
+broadcast_wakeup = asyncio.Event()
+
+# Seconds between rebuilds of a follower's zone index from the database.
+ZONE_RECONCILE_INTERVAL = float(os.environ.get("ECHOSIM_ZONE_RECONCILE_INTERVAL", "60"))
+# Set when a follower must rebuild its zone index at the next broadcast, e.g. after a feed reconnect.
+zone_reconcile_requested = False
+zone_reconciled_at = 0.0
+
+# Container IDs each client wants live stats for.
+stats_subscriptions: Dict[WebSocket, set] = {}
+# Identifies this worker's stats watch in the sync leader.
+WORKER_ID = str(os.getpid())
+# Seconds a worker's stats watch lasts in the leader; workers renew theirs every broadcast.
+STATS_WATCH_TTL = 30
+# Sync leader only: worker ID -> (container IDs its clients want stats for, loop time the watch lapses).
+stats_watchers: Dict[str, tuple] = {}
+
+# --- Command Validation ---
+
+def bounded_int(value, name, low, high, clamp=False):
+    """Parses a client-supplied integer and checks it lies in [low, high].
+
+    Args:
+        clamp (bool): Pull out-of-range values into range instead of rejecting them.
+
+    Raises:
+        ValueError: If the value is not an integer, or out of range without `clamp`.
+    """
+    message = f"'{name}' must be an integer between {low} and {high}."
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(message)
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(message) from None
+    if clamp:
+        return max(low, min(number, high))
+    if not low <= number <= high:
+        raise ValueError(message)
+    return number
+
+def bounded_float(value, name, low, high, clamp=False):
+    """Parses a client-supplied number and checks it lies in [low, high].
+
+    Args:
+        clamp (bool): Pull out-of-range values (including infinities) into
+            range instead of rejecting them. NaN is always rejected.
+
+    Raises:
+        ValueError: If the value is not a number, or out of range without `clamp`.
+    """
+    message = f"'{name}' must be a number between {low} and {high}."
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(message)
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(message) from None
+    if math.isnan(number):
+        raise ValueError(message)
+    if clamp:
+        return max(low, min(number, high))
+    if not low <= number <= high:
+        raise ValueError(message)
+    return number
+
+# Largest seq a client may page from; SQLite's largest integer.
+MAX_THOUGHT_SEQ = 2 ** 63 - 1
+
+def thought_page(command: dict):
+    """Parses the `limit`, `after_seq` and `before_seq` of a thoughts request.
+
+    Returns:
+        A tuple (limit, after_seq, before_seq); the seqs may be None.
+
+    Raises:
+        ValueError: If a field is not an integer in range.
+    """
+    limit = bounded_int(command.get("limit", 50), "limit", 1, db.MAX_THOUGHTS_PAGE, clamp=True)
+    seqs = [None if command.get(name) is None else bounded_int(command[name], name, 0, MAX_THOUGHT_SEQ)
+            for name in ("after_seq", "before_seq")]
+    return (limit, *seqs)
+
+def create_specs(command: dict):
+    """Builds the agent specs of a create_agents command, bounding its size first.
+
+    Clients send either `agents`, a list of specs, or `count` with an
+    optional `prefix`, `image` and `host`.
+
+    Raises:
+        ValueError: If the request is malformed or larger than MAX_CREATE_BATCH.
+    """
+    specs = command.get("agents")
+    if specs:
+        if not isinstance(specs, list) or not all(isinstance(spec, dict) for spec in specs):
+            raise ValueError("'agents' must be a list of agent specs.")
+        if len(specs) > MAX_CREATE_BATCH:
+            raise ValueError(f"At most {MAX_CREATE_BATCH} agents per batch.")
+    elif command.get("count") is not None:
+        count = bounded_int(command["count"], "count", 1, MAX_CREATE_BATCH)
+        prefix = command.get("prefix", "echo")
+        specs = [{"name": f"{prefix}-{i + 1}", "image": command.get("image"), "host": command.get("host")}
+                 for i in range(count)]
+    if not specs or any(not spec.get("name") for spec in specs):
+        raise ValueError("Every agent needs a name.")
+    return specs
 
 # --- Background Broadcast Task ---
 
+def push_stats(samples: dict):
+    """Sends the latest stats samples to every client subscribed to them."""
+    for websocket, container_ids in list(stats_subscriptions.items()):
+        wanted = {cid: samples[cid] for cid in container_ids if cid in samples}
+        if wanted:
+            message = json.dumps({"type": "stats", "samples": wanted})
+            manager.send(websocket, message, coalesce_key="stats")
+
+def publish_stats(samples: dict):
+    """Delivers stats samples to this worker's clients and to the other workers."""
+    push_stats(samples)
+    if cluster:
+        cluster.publish("stats", samples)
+
+def publish_change_set(change_set: dict):
+    """Broadcasts a sync's changes now instead of at the next interval, in every worker."""
+    broadcast_wakeup.set()
+    if cluster:
+        # Followers only update their zone index; the agent rows themselves come from the database.
+        cluster.publish("change_set", {"zone_keys": change_set.get("zone_keys", {}),
+                                       "deactivated": change_set.get("deactivated", [])})
+
+def push_tasks(tasks: list):
+    """Tells every client which agents were just given which tasks."""
+    message = json.dumps({"type": "tasks_assigned", "tasks": tasks}, default=json_encoder)
+    for websocket in list(manager.active_connections):
+        manager.send(websocket, message)
+
+def publish_tasks(tasks: list):
+    """Delivers task assignments to this worker's clients and to the other workers."""
+    push_tasks(tasks)
+    if cluster:
+        cluster.publish("tasks", tasks)
+
+def handle_cluster_message(message: dict):
+    """Applies a message from the sync leader's change feed in a follower worker."""
+    if message.get("kind") == "change_set":
+        sim_engine.zone_index.apply(message["payload"])
+        broadcast_wakeup.set()
+    elif message.get("kind") == "stats":
+        push_stats(message["payload"])
+    elif message.get("kind") == "tasks":
+        push_tasks(message["payload"])
+
+async def run_command(op: str, args: dict, progress):
+    """Runs a command that touches Docker or writes agent state. Runs in the sync leader only.
+
+    Followers forward these commands through `leader_call`, so only the
+    leader syncs and its change sets reach every worker through the feed.
+
+    Args:
+        op (str): The command name.
+        args (dict): The command's JSON arguments.
+        progress (callable): Called on the event loop with each progress payload.
+
+    Returns:
+        A JSON-serializable result dict.
+
+    Raises:
+        RuntimeError: If the command times out or is unknown.
+    """
+    loop = asyncio.get_running_loop()
+
+    def report(outcome):
+        # Called from the worker threads; hand off to the event loop.
+        loop.call_soon_threadsafe(progress, outcome)
+
+    if op == "control":
+        success, message = await docker_io.control_container(args["container_id"], args["action"])
+        # Re-read just this container; its change is pushed as soon as it is stored
+        sim_engine.request_resync(args["container_id"])
+        return {"success": success, "message": message}
+    if op == "create":
+        success, result = await docker_io.call("create", sim_engine.create_new_agent,
+                                               args["name"], args["image"], args.get("host"))
+        return {"success": success, "result": result}
+    if op == "create_batch":
+        try:
+            results = await docker_io.run("create_batch", sim_engine.create_agents, args["specs"],
+                                          args["parallelism"], report)
+        except asyncio.TimeoutError:
+            raise RuntimeError("Batch creation timed out.") from None
+        return {"results": results}
+    if op == "retire":
+        success, message = await docker_io.call("retire", memory_garden.retire_agent, args["container_id"])
+        if success:
+            sim_engine.zone_index.remove(args["container_id"])
+            sim_engine.request_resync(args["container_id"])
+            broadcast_wakeup.set()
+        return {"success": success, "message": message}
+    if op == "retire_batch":
+        try:
+            results, change_set = await docker_io.run(
+                "retire_batch", memory_garden.retire_agents, args["agent_ids"], args["parallelism"],
+                args["timeout"], args["kill"], report)
+        except asyncio.TimeoutError:
+            raise RuntimeError("Bulk retirement timed out.") from None
+        sim_engine.zone_index.apply(change_set)
+        publish_change_set(change_set)
+        return {"results": results, "deactivated": change_set["deactivated"]}
+    if op == "stats_history":
+        history = stats_sampler.history(args["container_id"], args["resolution"]) if stats_sampler else {}
+        return {"history": history}
+    if op == "stats_watch":
+        if args["container_ids"]:
+            stats_watchers[args["worker"]] = (set(args["container_ids"]), loop.time() + STATS_WATCH_TTL)
+        else:
+            stats_watchers.pop(args["worker"], None)
+        apply_stats_watch()
+        return {}
+    raise RuntimeError(f"Unknown command: {op}")
+
+async def leader_call(op: str, args: dict, progress=None):
+    """Runs `run_command` in the sync leader, which may be this worker."""
+    if cluster is None:
+        return await run_command(op, args, progress or (lambda payload: None))
+    return await cluster.call(op, args, progress)
+
+def apply_stats_watch():
+    """Points the leader's sampler at the containers some worker still watches."""
+    now = asyncio.get_running_loop().time()
+    for worker, (_, lapses_at) in list(stats_watchers.items()):
+        if lapses_at < now:
+            del stats_watchers[worker]
+    if stats_sampler:
+        stats_sampler.watch(set().union(*(container_ids for container_ids, _ in stats_watchers.values())))
+
+async def send_stats_watch():
+    """Tells the sync leader which containers this worker's clients want live stats for."""
+    container_ids = sorted(set().union(*stats_subscriptions.values()))
+    try:
+        await leader_call("stats_watch", {"worker": WORKER_ID, "container_ids": container_ids})
+    except (ConnectionError, RuntimeError) as e:
+        print(f"Could not update the stats watch in the sync leader: {e}")
+
+def request_zone_reconcile():
+    """Rebuilds the zone index at the next broadcast, which runs at once."""
+    global zone_reconcile_requested
+    zone_reconcile_requested = True
+    broadcast_wakeup.set()
+
+def reconcile_zone_index(all_agents: list):
+    """Rebuilds a follower's zone index from the agent rows the broadcast just read.
+
+    Followers only learn about zone changes from the leader's feed, and
+    anything published while they were disconnected is lost. The rows are
+    read on the event loop, where feed messages are applied too, so the
+    rebuilt index already includes every message applied before it. The
+    leader applies its own syncs and is never rebuilt this way.
+    """
+    global zone_reconcile_requested, zone_reconciled_at
+    if not cluster or cluster.is_leader:
+        return
+    now = asyncio.get_running_loop().time()
+    if not zone_reconcile_requested and now - zone_reconciled_at < ZONE_RECONCILE_INTERVAL:
+        return
+    zone_reconcile_requested, zone_reconciled_at = False, now
+    sim_engine.zone_index.load((agent["id"], agent["zone_key"]) for agent in all_agents if agent["is_active"])
+
 async def periodic_broadcast():
-    """Periodically fetches all agents from the DB and broadcasts them."""
+    """Periodically fetches all agents from the DB and broadcasts what changed.
+
+    A change set from a sync cuts the wait short, so changes go out at once.
+    """
     while True:
-        print("Broadcasting agent states...")
-        all_agents = db.get_all_agents(active_only=False)
-        await manager.broadcast_json({
-            "type": "full_update",
-            "agents": all_agents
-        })
-        await asyncio.sleep(5) # Broadcast every 5 seconds
+        logger.debug("Broadcasting agent states...")
+        all_agents = await asyncio.to_thread(db.get_all_agents, active_only=False)
+        reconcile_zone_index(all_agents)
+        tracker.update(all_agents)
+        await manager.broadcast_state(encoder)
+        await asyncio.to_thread(thought_log.catch_up, tracker.agents)
+        # Renew this worker's stats watch before it lapses in the leader, and let the leader expire stale ones.
+        if any(stats_subscriptions.values()):
+            await send_stats_watch()
+        if cluster is None or cluster.is_leader:
+            apply_stats_watch()
+        try:
+            await asyncio.wait_for(broadcast_wakeup.wait(), BROADCAST_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        broadcast_wakeup.clear()
+
+
+
+# --- Metrics Endpoint ---
 
+metrics.CONNECTED_CLIENTS.set_function(lambda: len(manager.active_connections))
+metrics.CLIENT_SEND_LAG_SECONDS.set_function(
+    lambda: {(stats["client"],): stats["lag"] for stats in manager.lag_report()})
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Serves timings and gauges in the Prometheus text format."""
+    # Async so the gauges read the connection manager on the event loop that owns it.
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 # --- WebSocket Endpoint ---
 
@@ -93,6 +689,8 @@ async def periodic_broadcast():
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     try:
+        # New clients always start from a full snapshot; deltas follow their acks.
+        await manager.send_snapshot(websocket, encoder)
         while True:
             # This loop is now primarily for receiving commands.
             # Broadcasting is handled by the global sync_and_broadcast task.
@@ -102,57 +700,332 @@ async def websocket_endpoint(websocket: WebSocket):
             action = command.get("action")
             container_id = command.get("container_id")
 
-            if action == 'get_logs' and container_id:
+            if action == "ack":
+                manager.acknowledge(websocket, command.get("generation"))
+
+            elif action == "set_encoding":
+                encoding = command.get("encoding", "json")
+                try:
+                    manager.set_encoding(websocket, encoding)
+                except ValueError as e:
+                    await manager.send_json(websocket, {"type": "error", "message": str(e)})
+                else:
+                    # Switch formats from a clean snapshot rather than mid-delta.
+                    await manager.send_snapshot(websocket, encoder)
+
+            elif action == "subscribe":
+                try:
+                    subscription = Subscription.from_command(command)
+                except ValueError as e:
+                    await manager.send_json(websocket, {"type": "error", "message": str(e)})
+                else:
+                    manager.subscribe(websocket, subscription)
+                    # Start the filtered view from a clean snapshot.
+                    await manager.send_snapshot(websocket, encoder)
+
+            elif action == "unsubscribe":
+                manager.unsubscribe(websocket)
+                await manager.send_snapshot(websocket, encoder)
+
+            elif action == "zone_occupancy":
+                occupancy = sim_engine.zone_index.occupancy()
+                await manager.send_json(websocket, {
+                    "type": "zone_occupancy",
+                    "zones": {key: {"name": zone["name"], "emoji": zone["emoji"], "count": occupancy[key]}
+                              for key, zone in zones.ZONES.items()},
+                })
+
+            elif action == "zone_members":
+                zone_key = zones.zone_key_for(command.get("zone"))
+                if zone_key is None:
+                    await manager.send_json(websocket, {"type": "error", "message": f"Unknown zone: {command.get('zone')}"})
+                else:
+                    await manager.send_json(websocket, {
+                        "type": "zone_members",
+                        "zone": zone_key,
+                        "agent_ids": sorted(sim_engine.zone_index.members(zone_key)),
+                    })
+
+            elif action == "resync":
+                await manager.send_snapshot(websocket, encoder)
+
+            elif action == 'get_logs' and container_id:
                 print(f"Fetching logs for {container_id[:12]}...")
-                success, logs = get_container_logs(container_id)
+                success, logs = await docker_io.get_container_logs(container_id)
                 log_data = {
                     "type": "logs",
                     "container_id": container_id,
                     "success": success,
                     "logs": logs
                 }
-                await websocket.send_text(json.dumps(log_data))
+                await manager.send_json(websocket, log_data)
                 print(f"Sent logs for {container_id[:12]} to client.")
 
+            elif action == "follow_logs" and container_id:
+                loop = asyncio.get_running_loop()
+
+                def deliver(cid, lines, ws=websocket):
+                    # Called from the hub's reader thread; hand off to the event loop.
+                    message = json.dumps({"type": "log_chunk", "container_id": cid, "lines": lines})
+                    loop.call_soon_threadsafe(manager.send, ws, message)
+
+                history = log_hub.follow(container_id, websocket, deliver)
+                await manager.send_json(websocket, {
+                    "type": "log_chunk",
+                    "container_id": container_id,
+                    "lines": history,
+                    "history": True
+                })
+
+            elif action == "unfollow_logs" and container_id:
+                log_hub.unfollow(container_id, websocket)
+
+            elif action == "append_thoughts":
+                entries = command.get("thoughts")
+                if entries is None and container_id:
+                    entries = [{"agent_id": container_id, "content": command.get("content")}]
+                if not entries or any(not isinstance(e, dict) or not e.get("agent_id") for e in entries):
+                    await manager.send_json(websocket, {"type": "error", "message": "Every thought needs an agent_id."})
+                elif len(entries) > MAX_THOUGHT_BATCH:
+                    await manager.send_json(websocket, {"type": "error", "message": f"At most {MAX_THOUGHT_BATCH} thoughts per batch."})
+                else:
+                    for entry in entries:
+                        thought_log.append(entry["agent_id"], entry.get("content"))
+
+            elif action == "get_thoughts" and container_id:
+                try:
+                    limit, after_seq, before_seq = thought_page(command)
+                except ValueError as e:
+                    await manager.send_json(websocket, {"type": "error", "message": str(e)})
+                else:
+                    thoughts = await asyncio.to_thread(
+                        db.get_thoughts, container_id, limit=limit, after_seq=after_seq, before_seq=before_seq)
+                    await manager.send_json(websocket, {
+                        "type": "thoughts",
+                        "container_id": container_id,
+                        "thoughts": thoughts
+                    })
+
+            elif action == "follow_thoughts" and container_id:
+                try:
+                    history_size = bounded_int(command.get("limit", 50), "limit", 0, db.MAX_THOUGHTS_PAGE, clamp=True)
+                except ValueError as e:
+                    await manager.send_json(websocket, {"type": "error", "message": str(e)})
+                else:
+                    loop = asyncio.get_running_loop()
+
+                    def deliver_thoughts(agent_id, records, ws=websocket):
+                        # Called from the writer thread or the broadcast loop.
+                        message = json.dumps({"type": "thought_chunk", "container_id": agent_id, "thoughts": records},
+                                             default=json_encoder)
+                        loop.call_soon_threadsafe(manager.send, ws, message)
+
+                    history = await asyncio.to_thread(
+                        thought_log.follow, container_id, websocket, deliver_thoughts, history=history_size)
+                    await manager.send_json(websocket, {
+                        "type": "thought_chunk",
+                        "container_id": container_id,
+                        "thoughts": history,
+                        "history": True
+                    })
+
+            elif action == "unfollow_thoughts" and container_id:
+                thought_log.unfollow(container_id, websocket)
+
+            elif action == "subscribe_stats" and container_id:
+                stats_subscriptions.setdefault(websocket, set()).add(container_id)
+                await send_stats_watch()
+                # The sampler runs in the sync leader; live samples reach followers over the feed.
+                try:
+                    history = (await leader_call("stats_history", {
+                        "container_id": container_id, "resolution": command.get("resolution", "fine")}))["history"]
+                except (ConnectionError, RuntimeError) as e:
+                    await manager.send_json(websocket, {"type": "error", "message": f"Stats history unavailable: {e}"})
+                else:
+                    await manager.send_json(websocket, {
+                        "type": "stats_history",
+                        "container_id": container_id,
+                        "history": history
+                    })
+
+            elif action == "unsubscribe_stats" and container_id:
+                stats_subscriptions.get(websocket, set()).discard(container_id)
+                await send_stats_watch()
+
+            elif action == "browse_garden":
+                cursor = command.get("cursor")
+                try:
+                    limit = bounded_int(command.get("limit", 50), "limit", 1, MAX_GARDEN_PAGE_SIZE, clamp=True)
+                    if cursor is not None and not isinstance(cursor, str):
+                        raise ValueError("'cursor' must be the next_cursor of a previous page.")
+                except ValueError as e:
+                    await manager.send_json(websocket, {"type": "error", "message": str(e)})
+                else:
+                    agents, next_cursor = await asyncio.to_thread(memory_garden.get_retired_agents_page, limit, cursor)
+                    await manager.send_json(websocket, {
+                        "type": "garden_page",
+                        "cursor": cursor,
+                        "agents": agents,
+                        "next_cursor": next_cursor
+                    })
+
+            elif action == "get_archived_agent" and container_id:
+                agent = await asyncio.to_thread(memory_garden.get_archived_agent, container_id)
+                await manager.send_json(websocket, {"type": "archived_agent", "container_id": container_id, "agent": agent})
+
+            elif action == "find_archived_agents" and command.get("name"):
+                agents = await asyncio.to_thread(memory_garden.find_archived_agents, command["name"])
+                await manager.send_json(websocket, {
+                    "type": "archived_agents",
+                    "name": command["name"],
+                    "agents": agents
+                })
+
             elif action in ['start', 'stop', 'restart'] and container_id:
                 print(f"Received command: {action} on {container_id[:12]}")
-                success, message = control_container(container_id, action)
-                print(message)
+                try:
+                    outcome = await leader_call("control", {"container_id": container_id, "action": action})
+                except (ConnectionError, RuntimeError) as e:
+                    outcome = {"success": False, "message": f"Could not {action} {container_id[:12]}: {e}"}
+                print(outcome["message"])
                 # Immediately send a command confirmation back to the specific client
-                await websocket.send_json({"type": "command_receipt", "success": success, "message": message})
-                # The SimEngine will pick up the state change on its next cycle
+                await manager.send_json(websocket, {"type": "command_receipt", **outcome})
 
             elif action == "create_agent":
                 name = command.get("name")
                 image = command.get("image", "hello-world")
+                host = command.get("host")
                 if not name:
-                    await websocket.send_json({"type": "error", "message": "Agent name is required."})
+                    await manager.send_json(websocket, {"type": "error", "message": "Agent name is required."})
                 else:
                     print(f"WebSocket request to create agent: {name} from image {image}")
-                    success, result = sim_engine.create_new_agent(name, image)
+                    try:
+                        outcome = await leader_call("create", {"name": name, "image": image, "host": host})
+                        success, result = outcome["success"], outcome["result"]
+                    except (ConnectionError, RuntimeError) as e:
+                        success, result = False, str(e)
                     if success:
-                        await websocket.send_json({"type": "command_receipt", "success": True, "message": f"Agent {name} created successfully."})
+                        await manager.send_json(websocket, {"type": "command_receipt", "success": True, "message": f"Agent {name} created successfully."})
                     else:
-                        await websocket.send_json({"type": "error", "message": f"Failed to create agent: {result}"})
+                        await manager.send_json(websocket, {"type": "error", "message": f"Failed to create agent: {result}"})
+
+            elif action == "create_agents":
+                try:
+                    specs = create_specs(command)
+                    parallelism = bounded_int(command.get("parallelism", 4), "parallelism", 1, MAX_CREATE_PARALLELISM, clamp=True)
+                except ValueError as e:
+                    await manager.send_json(websocket, {"type": "error", "message": str(e)})
+                else:
+                    print(f"WebSocket request to create {len(specs)} agents with parallelism {parallelism}")
+
+                    def report(outcome, ws=websocket):
+                        manager.send(ws, json.dumps(dict(outcome, type="create_progress")))
+
+                    try:
+                        results = (await leader_call("create_batch", {"specs": specs, "parallelism": parallelism},
+                                                     report))["results"]
+                    except (ConnectionError, RuntimeError) as e:
+                        await manager.send_json(websocket, {"type": "error", "message": str(e)})
+                    else:
+                        created = sum(1 for r in results if r["success"])
+                        await manager.send_json(websocket, {
+                            "type": "command_receipt",
+                            "success": created == len(specs),
+                            "message": f"Created {created} of {len(specs)} agents."
+                        })
 
             elif action == "retire_agent" and container_id:
                 print(f"WebSocket request to retire agent: {container_id}")
-                success, message = memory_garden.retire_agent(container_id)
+                try:
+                    outcome = await leader_call("retire", {"container_id": container_id})
+                    success, message = outcome["success"], outcome["message"]
+                except (ConnectionError, RuntimeError) as e:
+                    success, message = False, f"Could not retire {container_id}: {e}"
                 if success:
-                    await websocket.send_json({"type": "command_receipt", "success": True, "message": message})
+                    await manager.send_json(websocket, {"type": "command_receipt", "success": True, "message": message})
                 else:
-                    await websocket.send_json({"type": "error", "message": message})
+                    await manager.send_json(websocket, {"type": "error", "message": message})
             
+            elif action == "enqueue_tasks":
+                tasks = command.get("tasks")
+                if not isinstance(tasks, list) or not tasks or not all(isinstance(t, dict) for t in tasks):
+                    await manager.send_json(websocket, {"type": "error", "message": "'tasks' must be a list of tasks."})
+                elif len(tasks) > MAX_TASK_BATCH:
+                    await manager.send_json(websocket, {"type": "error", "message": f"At most {MAX_TASK_BATCH} tasks per batch."})
+                else:
+                    try:
+                        task_ids = await asyncio.to_thread(task_queue.enqueue, tasks)
+                    except (ValueError, TypeError) as e:
+                        await manager.send_json(websocket, {"type": "error", "message": str(e)})
+                    else:
+                        await manager.send_json(websocket, {"type": "tasks_enqueued", "task_ids": task_ids})
+
+            elif action == "report_task" and container_id:
+                task_id = command.get("task_id")
+                if isinstance(task_id, bool) or not isinstance(task_id, int):
+                    await manager.send_json(websocket, {"type": "error", "message": "'task_id' must be an integer."})
+                else:
+                    task = await asyncio.to_thread(omega.report, task_id, container_id, command.get("result"),
+                                                   success=command.get("success", True))
+                    if task is None:
+                        await manager.send_json(websocket, {"type": "error", "message": f"Task {task_id} is not leased to {container_id}."})
+                    else:
+                        await manager.send_json(websocket, {"type": "task_receipt", "task_id": task["id"],
+                                                            "state": task["state"], "decision": task.get("decision")})
+
+            elif action == "task_counts":
+                await manager.send_json(websocket, {"type": "task_counts", "counts": await asyncio.to_thread(task_queue.counts)})
+
+            elif action == "retire_agents":
+                agent_ids = command.get("agent_ids")
+                try:
+                    if not isinstance(agent_ids, list) or not agent_ids or \
+                            not all(isinstance(agent_id, str) and agent_id for agent_id in agent_ids):
+                        raise ValueError("'agent_ids' must be a list of agent IDs.")
+                    if len(agent_ids) > MAX_RETIRE_BATCH:
+                        raise ValueError(f"At most {MAX_RETIRE_BATCH} agents per batch.")
+                    parallelism = bounded_int(command.get("parallelism", 8), "parallelism", 1, MAX_RETIRE_PARALLELISM, clamp=True)
+                    stop_timeout = bounded_float(command.get("timeout", memory_garden.STOP_TIMEOUT), "timeout",
+                                                 0, MAX_STOP_TIMEOUT, clamp=True)
+                except ValueError as e:
+                    await manager.send_json(websocket, {"type": "error", "message": str(e)})
+                else:
+                    print(f"WebSocket request to retire {len(agent_ids)} agents with parallelism {parallelism}")
+
+                    def report_retire(outcome, ws=websocket):
+                        manager.send(ws, json.dumps(dict(outcome, type="retire_progress")))
+
+                    try:
+                        outcome = await leader_call("retire_batch", {
+                            "agent_ids": agent_ids, "parallelism": parallelism, "timeout": stop_timeout,
+                            "kill": bool(command.get("kill", True))}, report_retire)
+                    except (ConnectionError, RuntimeError) as e:
+                        await manager.send_json(websocket, {"type": "error", "message": str(e)})
+                    else:
+                        results = outcome["results"]
+                        stopped = sum(1 for r in results if r["stopped"])
+                        await manager.send_json(websocket, {
+                            "type": "command_receipt",
+                            "success": stopped == len(results),
+                            "message": f"Retired {len(outcome['deactivated'])} agents; stopped {stopped} of {len(results)} containers."
+                        })
+
             else:
                 print(f"Received unknown command or missing data: {command}")
 
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
     except json.JSONDecodeError:
-        print("Received non-JSON message, ignoring.")
+        print("Received non-JSON message, closing the connection.")
     except Exception as e:
         print(f"An error occurred in websocket_endpoint: {e}")
+    finally:
+        # Every exit path drops the client's channel, so its writer stops getting broadcasts.
         manager.disconnect(websocket)
+        log_hub.unfollow_all(websocket)
+        thought_log.unfollow_all(websocket)
+        if stats_subscriptions.pop(websocket, None):
+            await send_stats_watch()
 
 # --- Main Entry Point ---
 
@@ -165,4 +1038,6 @@ app.mount("/", StaticFiles(directory="static", html=True), name="static")
 
 if __name__ == "__main__":
     print("Starting EchoPulse server on http://localhost:8502")
-    uvicorn.run("echopulse:app", host="0.0.0.0", port=8502, reload=True)
\ No newline at end of file
+    # Browsers offer permessage-deflate; accept it unless ECHOSIM_WS_DEFLATE=false.
+    uvicorn.run("echopulse:app", host="0.0.0.0", port=8502, reload=True,
+                ws_per_message_deflate=os.environ.get("ECHOSIM_WS_DEFLATE", "true").lower() != "false")
\ No newline at end of file
@@ -0,0 +1,141 @@
+# fanout.py
+
+import asyncio
+import time
+from collections import deque
+
+import metrics
+
+# What to do when a client's outbound queue is full.
+SLOW_CONSUMER_POLICIES = ("coalesce", "drop", "disconnect")
+
+
+class ClientChannel:
+    """
+    A bounded outbound queue and writer task for one WebSocket client.
+
+    Broadcasts only enqueue messages, so one slow or stalled browser never
+    delays the others. Messages offered with a `coalesce_key` replace any
+    still-queued message with the same key under the "coalesce" policy, so
+    a lagging client skips straight to the latest state.
+    """
+
+    def __init__(self, websocket, max_queue=32, policy="coalesce", send_timeout=10, on_close=None):
+        """Initializes the channel.
+
+        Args:
+            websocket: The connected WebSocket.
+            max_queue (int): Maximum number of queued outbound messages.
+            policy (str): One of SLOW_CONSUMER_POLICIES.
+            send_timeout (float): Seconds a single send may take before the client is dropped.
+            on_close (callable): Called with this channel once its writer stops.
+        """
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow-consumer policy: {policy}")
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.on_close = on_close
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._queue = deque()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        """Starts the writer task on the running event loop."""
+        self._task = asyncio.create_task(self._writer())
+
+    def offer(self, message, coalesce_key=None):
+        """Queues a message for this client without waiting for it to be sent.
+
+        Args:
+            message (str | bytes): The encoded message.
+            coalesce_key (str): Messages sharing a key supersede each other.
+
+        Returns:
+            True if the message was queued (or merged), False if it was dropped.
+        """
+        if self.closed:
+            return False
+
+        if coalesce_key is not None and self.policy == "coalesce":
+            for index, (_, key, enqueued_at) in enumerate(self._queue):
+                if key == coalesce_key:
+                    # Keep the original enqueue time so lag reflects how long the client has been behind.
+                    self._queue[index] = (message, key, enqueued_at)
+                    self.coalesced += 1
+                    return True
+
+        if len(self._queue) >= self.max_queue:
+            if self.policy == "disconnect":
+                print(f"Disconnecting slow client {self.websocket.client}: {len(self._queue)} messages queued.")
+                asyncio.ensure_future(self.close(code=1013))
+            self.dropped += 1
+            return False
+
+        self._queue.append((message, coalesce_key, time.monotonic()))
+        self._wakeup.set()
+        return True
+
+    def lag(self):
+        """Returns how many seconds the oldest queued message has been waiting."""
+        if self._queue:
+            return time.monotonic() - self._queue[0][2]
+        return 0.0
+
+    def stats(self):
+        """Returns per-client fan-out statistics."""
+        return {
+            "client": str(self.websocket.client),
+            "queued": len(self._queue),
+            "lag": self.lag(),
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+    async def close(self, code=1000):
+        """Stops the writer and closes the socket."""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+        if self.on_close:
+            self.on_close(self)
+
+    async def _writer(self):
+        """Sends queued messages in order until the client goes away."""
+        try:
+            while not self.closed:
+                if not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                message, _, enqueued_at = self._queue.popleft()
+                if isinstance(message, bytes):
+                    await asyncio.wait_for(self.websocket.send_bytes(message), self.send_timeout)
+                else:
+                    await asyncio.wait_for(self.websocket.send_text(message), self.send_timeout)
+                self.sent += 1
+                self.last_lag = time.monotonic() - enqueued_at
+                self.max_lag = max(self.max_lag, self.last_lag)
+                metrics.SEND_LAG_SECONDS.observe(self.last_lag)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Send to {self.websocket.client} failed, dropping client: {e}")
+            await self.close(code=1011)
@@ -4,6 +4,9 @@ const useWebSocket = (url) => {
   const [data, setData] = useState(null);
   const [isConnected, setIsConnected] = useState(false);
   const ws = useRef(null);
+  // Local replica of the agent table, kept in sync via snapshot + delta messages.
+  const agentsRef = useRef(new Map());
+  const generationRef = useRef(null);
 
   useEffect(() => {
     if (!url) return;
@@ -20,10 +23,46 @@ const useWebSocket = (url) => {
       setIsConnected(false);
     };
 
+    const send = (message) => {
+      if (ws.current && ws.current.readyState === WebSocket.OPEN) {
+        ws.current.send(JSON.stringify(message));
+      }
+    };
+
+    const publishAgents = () => {
+      setData({
+        type: 'full_update',
+        generation: generationRef.current,
+        agents: Array.from(agentsRef.current.values()),
+      });
+    };
+
     ws.current.onmessage = (event) => {
       try {
         const message = JSON.parse(event.data);
-        if (message.agents) {
+        if (message.type === 'full_update' && message.agents) {
+          agentsRef.current = new Map(message.agents.map(agent => [agent.id, agent]));
+          generationRef.current = message.generation ?? null;
+          publishAgents();
+          if (message.generation !== undefined) {
+            send({ action: 'ack', generation: message.generation });
+          }
+        } else if (message.type === 'delta') {
+          if (generationRef.current === null || message.base > generationRef.current) {
+            // We missed a generation; ask the server for a fresh snapshot.
+            send({ action: 'resync' });
+            return;
+          }
+          // Deltas are cumulative since our last ack, so re-applying one on top
+          // of a newer local state is safe.
+          const agents = agentsRef.current;
+          message.added.forEach(agent => agents.set(agent.id, agent));
+          message.changed.forEach(agent => agents.set(agent.id, agent));
+          message.removed.forEach(agentId => agents.delete(agentId));
+          generationRef.current = message.generation;
+          publishAgents();
+          send({ action: 'ack', generation: message.generation });
+        } else if (message.agents) {
           setData(message);
         }
         if (message.type === 'command_receipt') {
@@ -0,0 +1,152 @@
+# image_cache.py
+
+import time
+from concurrent.futures import Future
+from threading import Thread, Lock
+
+import docker
+
+
+def normalize_image(image):
+    """Returns the canonical reference for an image ("alpine" -> "alpine:latest")."""
+    if "@" in image:
+        return image
+    last_component = image.rsplit("/", 1)[-1]
+    return image if ":" in last_component else f"{image}:latest"
+
+
+class ImageCache:
+    """
+    Remembers which images the daemon has locally and pulls missing ones once.
+
+    The set of local images is refreshed on a schedule, so agent creation can
+    check it in memory instead of calling `images.get` every time. Concurrent
+    requests for the same missing image share a single pull. A list of warm
+    images can be prefetched in the background at startup.
+    """
+
+    def __init__(self, client_getter, refresh_interval=300):
+        """Initializes the cache.
+
+        Args:
+            client_getter (callable): Returns a Docker client, or None.
+            refresh_interval (float): Seconds between refreshes of the local image list.
+        """
+        self.client_getter = client_getter
+        self.refresh_interval = refresh_interval
+        self.is_running = False
+        self._present = set()
+        self._inflight = {}
+        self._lock = Lock()
+        self._thread = None
+
+    def refresh(self):
+        """Reloads the set of locally present images from the daemon."""
+        client = self.client_getter()
+        if not client:
+            return
+        present = set()
+        for image in client.images.list():
+            present.add(image.id)
+            present.update(normalize_image(tag) for tag in image.tags)
+            present.update(image.attrs.get("RepoDigests") or [])
+        with self._lock:
+            self._present = present
+
+    def is_present(self, image):
+        """Returns True if the image is known to be available locally."""
+        with self._lock:
+            return normalize_image(image) in self._present
+
+    def invalidate(self, image):
+        """Forgets an image, e.g. after the daemon reported it missing."""
+        with self._lock:
+            self._present.discard(normalize_image(image))
+
+    def ensure(self, image):
+        """Makes sure an image is available locally, pulling it at most once.
+
+        Returns immediately when the image is already known to be present.
+        Otherwise the first caller pulls it and any concurrent callers for the
+        same image wait for that pull.
+
+        Raises:
+            docker.errors.DockerException: If the image could not be pulled.
+        """
+        key = normalize_image(image)
+        with self._lock:
+            if key in self._present:
+                return
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            future.result()
+            return
+
+        try:
+            self._fetch(image)
+            with self._lock:
+                self._present.add(key)
+            future.set_result(True)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _fetch(self, image):
+        client = self.client_getter()
+        if not client:
+            raise docker.errors.DockerException("Docker client not available")
+        try:
+            # The refresh may simply not have seen it yet.
+            client.images.get(image)
+            print(f"Image '{image}' found locally.")
+        except docker.errors.ImageNotFound:
+            print(f"Image '{image}' not found locally. Pulling from Docker Hub...")
+            client.images.pull(image)
+            print(f"Successfully pulled image '{image}'.")
+
+    def prefetch(self, images):
+        """Pulls each image in the background if it is not already present."""
+        for image in images:
+            Thread(target=self._prefetch_one, args=(image,), daemon=True).start()
+
+    def _prefetch_one(self, image):
+        try:
+            self.ensure(image)
+        except Exception as e:
+            print(f"ImageCache: Could not prefetch image '{image}': {e}")
+
+    def start(self, prefetch=()):
+        """Loads the image list, starts the refresh thread and prefetches warm images."""
+        if self.is_running:
+            return
+        self.is_running = True
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"ImageCache: Initial refresh failed: {e}")
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self.prefetch(prefetch)
+
+    def stop(self):
+        self.is_running = False
+
+    def _run(self):
+        while self.is_running:
+            deadline = time.monotonic() + self.refresh_interval
+            while self.is_running and time.monotonic() < deadline:
+                time.sleep(min(1, self.refresh_interval))
+            if not self.is_running:
+                break
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"ImageCache: Refresh failed: {e}")
@@ -0,0 +1,191 @@
+# log_streams.py
+
+import time
+from collections import deque
+from datetime import datetime, timezone
+from threading import Thread, Lock
+
+import docker_bridge as docker
+
+
+def _split_timestamp(line):
+    """Splits a `timestamps=True` log line into (unix time in integer nanoseconds, text).
+
+    Nanoseconds are kept exact; as a float they would round distinct stamps together.
+    """
+    stamp, sep, text = line.partition(" ")
+    if not sep or not stamp.endswith("Z"):
+        return None, line
+    try:
+        # Docker reports nanoseconds; datetime only handles microseconds.
+        main, _, fraction = stamp[:-1].partition(".")
+        moment = datetime.strptime(main, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+        if fraction and not fraction.isdigit():
+            return None, line
+        nanos = int(fraction.ljust(9, "0")[:9]) if fraction else 0
+        return int(moment.timestamp()) * 1_000_000_000 + nanos, text
+    except ValueError:
+        return None, line
+
+
+class _FollowedContainer:
+    """Upstream state for one followed container."""
+
+    def __init__(self, container_id, history_lines):
+        self.container_id = container_id
+        self.history = deque(maxlen=history_lines)
+        self.subscribers = {}
+        # Timestamp (ns) of the last line delivered, and how many lines carried exactly that stamp.
+        self.cursor = None
+        self.cursor_lines = 0
+        # Lines at `cursor` a reopened stream will repeat; None once past the replay.
+        self.replay_skip = None
+        self.partial = ""
+        self.stream = None
+        self.thread = None
+        self.stopped = False
+
+
+class LogStreamHub:
+    """
+    Shares one follow-mode log stream per container between many viewers.
+
+    Each followed container keeps a bounded ring buffer of recent lines, so a
+    viewer that joins late gets history without another daemon call. When a
+    stream drops, it is reopened with `since` set to the last line seen.
+    """
+
+    def __init__(self, history_lines=500, opener=None, reconnect_delay=2):
+        """Initializes the hub.
+
+        Args:
+            history_lines (int): Lines kept per container for late joiners.
+            opener (callable): Called as `opener(container_id, since=..., tail=...)`
+                to open a stream. Defaults to `docker_bridge.stream_container_logs`.
+            reconnect_delay (float): Seconds to wait before reopening a stream.
+        """
+        self.history_lines = history_lines
+        self.opener = opener or docker.stream_container_logs
+        self.reconnect_delay = reconnect_delay
+        self._followed = {}
+        self._lock = Lock()
+
+    def follow(self, container_id, key, callback):
+        """Subscribes `callback(container_id, lines)` to a container's new log lines.
+
+        Args:
+            container_id (str): The container to follow.
+            key: Identifies the subscriber, e.g. its WebSocket.
+            callback (callable): Called from the reader thread with each batch of lines.
+
+        Returns:
+            The buffered recent lines, oldest first.
+        """
+        with self._lock:
+            followed = self._followed.get(container_id)
+            if followed is None:
+                followed = _FollowedContainer(container_id, self.history_lines)
+                self._followed[container_id] = followed
+            followed.subscribers[key] = callback
+            history = list(followed.history)
+            if followed.thread is None:
+                followed.thread = Thread(target=self._read, args=(followed,), daemon=True)
+                followed.thread.start()
+        return history
+
+    def unfollow(self, container_id, key):
+        """Removes a subscriber, closing the upstream stream if it was the last one."""
+        with self._lock:
+            followed = self._followed.get(container_id)
+            if followed is None:
+                return
+            followed.subscribers.pop(key, None)
+            if followed.subscribers:
+                return
+            del self._followed[container_id]
+            followed.stopped = True
+        self._close(followed)
+
+    def unfollow_all(self, key):
+        """Removes a subscriber from every container it follows."""
+        with self._lock:
+            container_ids = [cid for cid, f in self._followed.items() if key in f.subscribers]
+        for container_id in container_ids:
+            self.unfollow(container_id, key)
+
+    def followed_containers(self):
+        """Returns the IDs of containers with at least one viewer."""
+        with self._lock:
+            return list(self._followed)
+
+    def _close(self, followed):
+        stream, followed.stream = followed.stream, None
+        if stream is not None and hasattr(stream, "close"):
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def _read(self, followed):
+        """Reader thread: drains the upstream stream, reconnecting until unfollowed."""
+        while not followed.stopped:
+            try:
+                if followed.cursor is None:
+                    stream = self.opener(followed.container_id, since=None, tail=self.history_lines)
+                else:
+                    # `since` is float seconds; step back a microsecond so rounding cannot skip a line.
+                    stream = self.opener(followed.container_id, since=(followed.cursor - 1000) / 1e9)
+                    followed.replay_skip = followed.cursor_lines
+                with self._lock:
+                    followed.stream = stream
+                    stopped = followed.stopped
+                if stopped:
+                    # Unfollowed while the stream was opening; `unfollow` could not close it.
+                    break
+                for chunk in followed.stream:
+                    if followed.stopped:
+                        break
+                    self._ingest(followed, chunk)
+            except Exception as e:
+                if not followed.stopped:
+                    print(f"LogStreamHub: Log stream for {followed.container_id[:12]} interrupted: {e}")
+            finally:
+                self._close(followed)
+            if not followed.stopped:
+                time.sleep(self.reconnect_delay)
+
+    def _ingest(self, followed, chunk):
+        """Splits a raw chunk into lines, advances the cursor and notifies subscribers."""
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode("utf-8", errors="replace")
+        text = followed.partial + chunk
+        *complete, followed.partial = text.split("\n")
+
+        lines = []
+        for line in complete:
+            stamp, message = _split_timestamp(line)
+            if stamp is not None:
+                if followed.replay_skip is not None:
+                    # A reopened stream starts at or before the cursor and repeats lines we already have.
+                    if stamp < followed.cursor:
+                        continue
+                    if stamp == followed.cursor and followed.replay_skip > 0:
+                        followed.replay_skip -= 1
+                        continue
+                    followed.replay_skip = None
+                if stamp == followed.cursor:
+                    followed.cursor_lines += 1
+                else:
+                    followed.cursor, followed.cursor_lines = stamp, 1
+            lines.append(message)
+        if not lines:
+            return
+
+        with self._lock:
+            followed.history.extend(lines)
+            callbacks = list(followed.subscribers.values())
+        for callback in callbacks:
+            try:
+                callback(followed.container_id, lines)
+            except Exception as e:
+                print(f"LogStreamHub: Subscriber callback failed: {e}")
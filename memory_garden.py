@@ -1,8 +1,18 @@
 # memory_garden.py
 
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import archive
 import db
 import docker_bridge as docker
 
+# Seconds a retiring container gets to exit before Docker kills it.
+STOP_TIMEOUT = float(os.environ.get("ECHOSIM_STOP_TIMEOUT", "10"))
+
+# Prefix of page cursors that point into the archive rather than the agents table.
+ARCHIVE_CURSOR_PREFIX = "archive:"
+
 
 def retire_agent(agent_id):
     """Retires an agent, stopping its container and marking it as inactive.
@@ -18,7 +28,7 @@ def retire_agent(agent_id):
     print(f"MemoryGarden: Retiring agent {agent_id}...")
 
     # 1. Stop the container
-    success, message = docker.control_container(agent_id, 'stop')
+    success, message = docker.stop_container(agent_id, STOP_TIMEOUT)
     if not success:
         # If stopping fails, we might still want to mark it as inactive
         print(f"Warning: Could not stop container {agent_id}: {message}")
@@ -35,14 +45,134 @@ def retire_agent(agent_id):
         return False, error_message
 
 
-def get_retired_agents():
+def retire_agents(agent_ids, parallelism=8, stop_timeout=STOP_TIMEOUT, kill=True, progress=None):
+    """Retires many agents at once.
+
+    Containers are stopped concurrently on a pool of `parallelism` workers,
+    each with its own `stop_timeout`. As with `retire_agent`, an agent is
+    retired even if its container could not be stopped. Once every stop has
+    finished, all agents are deactivated in a single transaction. IDs with
+    no row in the agents table are reported as not stopped and never reach
+    Docker, so a stray ID cannot stop an unrelated container.
+
+    Args:
+        agent_ids (list): The agents to retire.
+        parallelism (int): Maximum number of concurrent stops.
+        stop_timeout (float): Grace period per container, in seconds.
+        kill (bool): Kill containers whose stop call fails or times out.
+        progress (callable): Called with a result dict as each container is stopped.
+
+    Returns:
+        A tuple (results, change_set). `results` has a dict with `agent_id`,
+        `stopped` and `result` per agent, in the order of `agent_ids`;
+        `change_set` is the change set of the deactivation.
+    """
+    agent_ids = list(dict.fromkeys(agent_ids))
+    total = len(agent_ids)
+    results = [None] * total
+    done = 0
+    print(f"MemoryGarden: Retiring {total} agents with parallelism {parallelism}...")
+
+    known = db.get_known_agent_ids(agent_ids)
+    for index, agent_id in enumerate(agent_ids):
+        if agent_id not in known:
+            results[index] = {"agent_id": agent_id, "stopped": False, "result": f"Unknown agent {agent_id}."}
+            done += 1
+            if progress:
+                progress(dict(results[index], done=done, total=total))
+
+    with ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix="retire") as pool:
+        futures = {pool.submit(docker.stop_container, agent_id, stop_timeout, kill): index
+                   for index, agent_id in enumerate(agent_ids) if agent_id in known}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                stopped, message = future.result()
+            except Exception as e:
+                stopped, message = False, str(e)
+            if not stopped:
+                print(f"Warning: Could not stop container {agent_ids[index]}: {message}")
+            results[index] = {"agent_id": agent_ids[index], "stopped": stopped, "result": message}
+            done += 1
+            if progress:
+                progress(dict(results[index], done=done, total=total))
+
+    change_set = db.deactivate_agents([agent_id for agent_id in agent_ids if agent_id in known])
+    print(f"MemoryGarden: {len(change_set['deactivated'])} agents have been enshrined in the Memory Garden.")
+    return results, change_set
+
+
+def get_retired_agents(include_archived=False):
     """Fetches all retired agents from the Memory Garden.
 
+    Agents moved to the archive are only loaded when `include_archived` is
+    set; prefer `get_retired_agents_page`, which reads them a page at a time.
+
     Returns:
         A list of agent data dictionaries.
     """
     try:
-        return db.get_memory_garden_agents()
+        agents = db.get_memory_garden_agents()
+        if include_archived:
+            cursor = None
+            while True:
+                page, cursor = archive.get_archived_page(limit=500, cursor=cursor)
+                agents.extend(page)
+                if cursor is None:
+                    break
+        return agents
     except Exception as e:
         print(f"MemoryGarden: Error fetching retired agents: {e}")
-        return []
\ No newline at end of file
+        return []
+
+
+def get_retired_agents_page(limit=50, cursor=None):
+    """Fetches one page of retired agents from the Memory Garden.
+
+    Pages run through the agents still in the database first and then on
+    into the archive, whose records are only read for the page requested.
+
+    Args:
+        limit (int): Maximum number of agents to return.
+        cursor (str): The cursor returned with the previous page, or None.
+
+    Returns:
+        A tuple (agents, next_cursor); next_cursor is None on the last page.
+    """
+    try:
+        if cursor and cursor.startswith(ARCHIVE_CURSOR_PREFIX):
+            return _archived_page(limit, cursor[len(ARCHIVE_CURSOR_PREFIX):] or None)
+        agents, next_cursor = db.get_memory_garden_page(limit=limit, cursor=cursor)
+        if next_cursor is None and len(agents) < limit:
+            archived, next_cursor = _archived_page(limit - len(agents), None)
+            agents.extend(archived)
+        elif next_cursor is None:
+            # This page is full; the archive starts on the next one.
+            next_cursor = ARCHIVE_CURSOR_PREFIX
+        return agents, next_cursor
+    except Exception as e:
+        print(f"MemoryGarden: Error fetching retired agents page: {e}")
+        return [], None
+
+
+def _archived_page(limit, cursor):
+    agents, next_cursor = archive.get_archived_page(limit=limit, cursor=cursor)
+    return agents, (ARCHIVE_CURSOR_PREFIX + next_cursor) if next_cursor else None
+
+
+def get_archived_agent(agent_id):
+    """Loads one agent from the archive, thoughts included, or returns None."""
+    try:
+        return archive.get_archived_agent(agent_id)
+    except Exception as e:
+        print(f"MemoryGarden: Error loading archived agent {agent_id}: {e}")
+        return None
+
+
+def find_archived_agents(name):
+    """Finds archived agents by name."""
+    try:
+        return archive.find_archived_agents(name)
+    except Exception as e:
+        print(f"MemoryGarden: Error searching the archive for {name}: {e}")
+        return []
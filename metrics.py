@@ -0,0 +1,215 @@
+# metrics.py
+
+import functools
+import math
+import time
+from threading import Lock
+
+# Content type of the Prometheus text exposition format.
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Latency buckets in seconds, from a fast SQLite query to a slow image pull.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, math.inf)
+
+# Payload size buckets in bytes.
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, math.inf)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """A named metric with optional labels; one series per distinct label set."""
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = sorted(self._series.items())
+            lines.extend(self._render_series(key, value) for key, value in series)
+        return "\n".join(line for line in lines if line)
+
+    def _render_series(self, key, value):
+        return f"{self.name}{_format_labels(key)} {_format_value(value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, either set directly or read from a function at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def set_function(self, function):
+        """Reads the value from `function()` whenever metrics are rendered.
+
+        For a labelled gauge, `function()` returns {tuple of label values: value}
+        and replaces every series, so label sets that disappear stop being exported.
+        """
+        self._function = function
+
+    def render(self):
+        if self._function is not None:
+            try:
+                value = self._function()
+                if self.labelnames:
+                    series = {tuple(zip(self.labelnames, labels)): v for labels, v in value.items()}
+                    with self._lock:
+                        self._series = series
+                else:
+                    self.set(value)
+            except Exception as e:
+                print(f"Metrics: Could not read {self.name}: {e}")
+        return super().render()
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            # A fresh timer per call, so concurrent calls do not share a start time.
+            with _Timer(self.histogram, self.labels):
+                return func(*args, **kwargs)
+        return timed
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self._started, **self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != math.inf:
+            self.buckets += (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][index] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def time(self, **labels):
+        """Times a block or a function call: `with HISTOGRAM.time(...)` or `@HISTOGRAM.time(...)`."""
+        self._key(labels)
+        return _Timer(self, labels)
+
+    def _render_series(self, key, series):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, series["buckets"]):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(series['sum'])}")
+        lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return "\n".join(lines)
+
+
+class Registry:
+    """Holds every metric and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def render():
+    """Returns every registered metric in the Prometheus text format."""
+    return REGISTRY.render()
+
+
+# --- Metrics ---
+
+SYNC_SECONDS = REGISTRY.register(Histogram(
+    "echosim_sync_seconds", "Duration of agent syncs with Docker.", ("kind",)))
+DOCKER_API_SECONDS = REGISTRY.register(Histogram(
+    "echosim_docker_api_seconds", "Latency of Docker API calls.", ("call",)))
+DB_SECONDS = REGISTRY.register(Histogram(
+    "echosim_db_transaction_seconds", "Duration of database transactions.", ("op",)))
+LOCK_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "echosim_engine_lock_wait_seconds", "Time spent waiting for SimEngine.lock.", ("op",)))
+ENCODE_SECONDS = REGISTRY.register(Histogram(
+    "echosim_broadcast_encode_seconds", "Time spent encoding one state broadcast."))
+PAYLOAD_BYTES = REGISTRY.register(Histogram(
+    "echosim_broadcast_payload_bytes", "Size of encoded state messages.", ("encoding",), buckets=BYTE_BUCKETS))
+SEND_LAG_SECONDS = REGISTRY.register(Histogram(
+    "echosim_client_send_lag_seconds", "Time from queueing a message for a client to sending it."))
+CLIENT_SEND_LAG_SECONDS = REGISTRY.register(Gauge(
+    "echosim_client_queue_lag_seconds", "Age of the oldest message queued for each client.", ("client",)))
+CONNECTED_CLIENTS = REGISTRY.register(Gauge(
+    "echosim_connected_clients", "Connected WebSocket clients."))
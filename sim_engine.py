@@ -1,87 +1,481 @@
 # sim_engine.py
 
+import logging
 import time
-from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from threading import Event, Thread, Lock
 
+import archive
 import docker_bridge as docker
 import db
+import metrics
+from zones import ZoneIndex
+
+logger = logging.getLogger(__name__)
 
 class SimEngine:
     """
     Manages the lifecycle of all agents (Echoes) in the Simverse.
     It runs a background thread to keep the database in sync with Docker.
+
+    In "poll" mode the thread lists every container on a short interval.
+    In "events" mode a second thread follows the daemon's container event
+    stream and updates only the affected agent, while the full sync runs on
+    a much slower interval as a safety net.
+
+    With several Docker hosts configured (DOCKER_HOSTS), every host is listed
+    by its own worker at the same time and each host gets its own event
+    stream. A host that is down or slower than `host_timeout` is skipped for
+    that cycle and its agents are left as they were.
     """
 
-    def __init__(self, db_session):
+    def __init__(self, db_session, sync_mode="poll", event_source=None,
+                 sync_interval=10, reconcile_interval=300, reconnect_delay=2,
+                 maintenance_interval=3600, event_retention_days=7, host_timeout=None,
+                 on_change=None, archive_after_days=None, resync_delay=0.05, resync_burst_limit=20):
         """Initializes the simulation engine.
 
         Args:
-            db_session: An active SQLAlchemy session.
+            db_session (db.ConnectionPool): The connection pool used for database writes.
+            sync_mode (str): "poll" for periodic full syncs, "events" to follow
+                the Docker events stream with a slow periodic reconcile.
+            event_source (callable): Called as `event_source(since=...)` to open an
+                event stream. Defaults to `docker_bridge.stream_container_events`.
+            sync_interval (int): Seconds between full syncs in "poll" mode.
+            reconcile_interval (int): Seconds between full syncs in "events" mode.
+            reconnect_delay (int): Seconds to wait before reopening a failed event stream.
+            maintenance_interval (int): Seconds between database maintenance runs.
+            event_retention_days (float): Age after which agent events are compacted.
+            host_timeout (float): Seconds to wait for each federated host's listing.
+                Defaults to `docker_bridge.HOST_TIMEOUT`.
+            on_change (callable): Called with every change set that added, updated
+                or deactivated an agent. Runs on the syncing thread.
+            archive_after_days (float): Age after which retired agents are moved
+                to the archive during maintenance. None disables archiving.
+            resync_delay (float): Seconds to collect resync requests before running them.
+            resync_burst_limit (int): More pending resyncs than this run one full sync instead.
         """
+        if sync_mode not in ("poll", "events"):
+            raise ValueError(f"Unknown sync mode: {sync_mode}")
         self.db_session = db_session
+        self.sync_mode = sync_mode
+        self.event_source = event_source or docker.stream_container_events
+        self.sync_interval = sync_interval
+        self.reconcile_interval = reconcile_interval
+        self.reconnect_delay = reconnect_delay
+        self.maintenance_interval = maintenance_interval
+        self.event_retention_days = event_retention_days
+        self.archive_after_days = archive_after_days
+        self._last_maintenance = time.monotonic()
         self.is_running = False
         self.lock = Lock()
+        self.last_change_set = None
+        self.on_change = on_change
+        self.resync_delay = resync_delay
+        self.resync_burst_limit = resync_burst_limit
+        self._resync_pending = set()
+        self._resync_lock = Lock()
+        self._resync_wakeup = Event()
+        # One long-lived worker, started on the first request, so its pooled connection is reused.
+        self._resync_thread = None
+        self._resync_closed = False
+        # Zone membership of active agents; load with load_zone_index() once the database is ready.
+        self.zone_index = ZoneIndex()
+        self.last_event_since = None
+        self._event_streams = {}
+        self.hosts = docker.get_hosts()
+        self.host_timeout = host_timeout or docker.HOST_TIMEOUT
+        # Per-host outcome of the last federated sync: ok, error, duration, last_ok.
+        self.host_status = {}
+        self.host_event_since = {}
+        self._host_listings = {}
+        self._host_pool = (ThreadPoolExecutor(max_workers=len(self.hosts), thread_name_prefix="host-sync")
+                           if self.hosts else None)
         self.docker_client = docker.get_docker_client() # Force immediate initialization
         self._sync_thread = Thread(target=self._periodic_sync, daemon=True)
+        self._event_threads = [Thread(target=self._watch_events, args=(host,), daemon=True)
+                               for host in (self.hosts or [None])]
 
     def start(self):
         """Starts the engine's background synchronization thread."""
         if not self.is_running:
             print("--- Simulation Engine starting ---")
-            if self.docker_client:
-                print("--- Docker client confirmed. Starting sync thread. ---")
+            # Federated hosts that are down at startup are retried on every sync.
+            if self.docker_client or self.hosts:
+                print(f"--- Docker client confirmed. Starting sync thread ({self.sync_mode} mode). ---")
                 self.is_running = True
                 self._sync_thread.start()
+                if self.sync_mode == "events":
+                    for thread in self._event_threads:
+                        thread.start()
                 print("--- Simulation Engine is running ---")
             else:
                 print("--- FATAL: Could not get Docker client. SimEngine will not run. ---")
 
     def stop(self):
-        """Stops the engine's background thread."""
+        """Stops the engine's background threads."""
+        self._resync_closed = True
+        self._resync_wakeup.set()
         if self.is_running:
             print("--- Simulation Engine stopping ---")
             self.is_running = False
+            # Closing the streams unblocks event threads waiting on a daemon.
+            for host in list(self._event_streams):
+                self._close_event_stream(host)
+            for thread in self._event_threads:
+                if thread.is_alive():
+                    thread.join()
             if self._sync_thread.is_alive():
                 self._sync_thread.join()
+            if self._host_pool:
+                self._host_pool.shutdown(wait=False, cancel_futures=True)
             print("--- Simulation Engine has stopped ---")
 
     def _periodic_sync(self):
         """The main loop for the background thread."""
+        interval = self.reconcile_interval if self.sync_mode == "events" else self.sync_interval
         while self.is_running:
-            print("SimEngine: Running periodic sync...")
+            logger.debug("SimEngine: Running periodic sync...")
             self.sync_agents_with_docker()
-            time.sleep(10)  # Sync every 10 seconds
+            if time.monotonic() - self._last_maintenance >= self.maintenance_interval:
+                self.run_maintenance()
+            # Sleep in short steps so stop() does not wait for a whole reconcile interval.
+            deadline = time.monotonic() + interval
+            while self.is_running and time.monotonic() < deadline:
+                time.sleep(min(1, interval))
 
-    def sync_agents_with_docker(self):
-        """Fetches all Docker containers and updates their state in the database."""
+    def _watch_events(self, host=None):
+        """Follows one daemon's events stream, reconnecting after failures."""
+        while self.is_running:
+            try:
+                self._consume_event_stream(host)
+            except Exception as e:
+                print(f"SimEngine: Event stream{f' for {host}' if host else ''} interrupted: {e}")
+            finally:
+                self._close_event_stream(host)
+            if self.is_running:
+                time.sleep(self.reconnect_delay)
+
+    def _consume_event_stream(self, host=None):
+        """Opens one event stream, resuming after the last seen event, and drains it."""
+        if host is None:
+            stream = self.event_source(since=self.last_event_since)
+        else:
+            stream = self.event_source(since=self.host_event_since.get(host), host=host)
+        self._event_streams[host] = stream
+        for event in stream:
+            if not self.is_running:
+                break
+            self.handle_container_event(event, host)
+
+    def _close_event_stream(self, host=None):
+        stream = self._event_streams.pop(host, None)
+        if stream is not None and hasattr(stream, "close"):
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def handle_container_event(self, event, host=None):
+        """Applies a single Docker container event to the database.
+
+        Args:
+            event (dict): A decoded event from the Docker events API.
+            host (str): The federated host the event came from, if any.
+
+        Returns:
+            The change set for the affected agent, or None if the event was ignored.
+        """
+        if event.get("Type", "container") != "container":
+            return None
+
+        # Remember where we are so a reconnect resumes from here.
+        since = None
+        if event.get("timeNano"):
+            seconds, nanos = divmod(int(event["timeNano"]), 1_000_000_000)
+            since = f"{seconds}.{nanos:09d}"
+        elif event.get("time"):
+            since = int(event["time"])
+        if since is not None:
+            if host is None:
+                self.last_event_since = since
+            else:
+                self.host_event_since[host] = since
+
+        action = event.get("Action") or event.get("status")
+        container_id = event.get("id") or event.get("Actor", {}).get("ID")
+        if action not in docker.CONTAINER_EVENTS or not container_id:
+            return None
+        return self.sync_agent(docker.qualify_id(host, container_id), removed=(action == "destroy"))
+
+    @contextmanager
+    def _locked(self, op):
+        """Holds `self.lock`, recording how long it took to get it."""
+        started = time.perf_counter()
         with self.lock:
-            print("SimEngine: Acquiring lock and syncing agents.")
+            metrics.LOCK_WAIT_SECONDS.observe(time.perf_counter() - started, op=op)
+            yield
+
+    def sync_agent(self, container_id, removed=False):
+        """Re-reads a single container and updates only its agent row.
+
+        Args:
+            container_id (str): The container to refresh.
+            removed (bool): True if the container is known to be gone.
+
+        Returns:
+            The change set from `db.update_agents_from_containers`, or None on error.
+        """
+        with metrics.SYNC_SECONDS.time(kind="agent"), self._locked("agent"):
             try:
-                # The get_all_containers function returns an empty list on error, so we can proceed safely.
-                all_containers = docker.get_all_containers()
-                db.sync_containers_with_db(self.db_session, all_containers)
-                if all_containers is not None:
-                    print(f"SimEngine: Synced {len(all_containers)} containers.")
+                container = None if removed else docker.get_container(container_id)
+                if container is None:
+                    change_set = db.update_agents_from_containers(
+                        [], deactivate_ids=[container_id], db_session=self.db_session)
+                else:
+                    change_set = db.update_agents_from_containers([container], db_session=self.db_session)
+                self._record_change_set(change_set)
+                return change_set
+            except docker.errors.APIError as e:
+                print(f"SimEngine: Docker API error while syncing {container_id[:12]}: {e}")
+            except Exception as e:
+                print(f"SimEngine: An unexpected error occurred while syncing {container_id[:12]}: {e}")
+            return None
+
+    def sync_agents_with_docker(self):
+        """Fetches all Docker containers and updates their state in the database.
+
+        Returns:
+            The change set from `db.sync_containers_with_db`, or None if the sync failed.
+        """
+        if self.hosts:
+            return self._sync_hosts()
+        with metrics.SYNC_SECONDS.time(kind="full"), self._locked("full"):
+            try:
+                # One lean, label-filtered list call; errors raise so no agent is wrongly deactivated.
+                all_containers = docker.list_containers()
+                change_set = db.sync_containers_with_db(self.db_session, all_containers)
+                logger.debug("SimEngine: Synced %d containers.", len(all_containers))
+                self._record_change_set(change_set)
+                return change_set
             except docker.errors.APIError as e:
                 print(f"SimEngine: Docker API error during sync: {e}")
             except Exception as e:
                 # Catching other potential errors, e.g., from the DB layer
                 print(f"SimEngine: An unexpected error occurred during sync: {e}")
+            return None
+
+    def _list_host(self, host):
+        started = time.monotonic()
+        containers = docker.list_containers(host=host)
+        return containers, time.monotonic() - started
 
-    def create_new_agent(self, name, image="hello-world"):
+    def _mark_host(self, host, ok, error=None, duration=None):
+        status = self.host_status.setdefault(host, {"ok": False, "error": None, "duration": None, "last_ok": None})
+        status.update(ok=ok, error=error, duration=duration)
+        if ok:
+            status["last_ok"] = time.time()
+        else:
+            print(f"SimEngine: Host '{host}' skipped this sync: {error}")
+
+    @metrics.SYNC_SECONDS.time(kind="federated")
+    def _sync_hosts(self):
+        """Lists every federated host concurrently and syncs the hosts that answered.
+
+        The wait is bounded by `host_timeout`, so a cycle takes as long as the
+        slowest healthy host. A host whose previous listing is still running
+        is skipped rather than queued again.
+
+        Returns:
+            The change set, or None if no host could be listed.
+        """
+        futures = {}
+        for host in self.hosts:
+            pending = self._host_listings.get(host)
+            if pending is not None and not pending.done():
+                self._mark_host(host, False, "previous listing still running")
+                continue
+            futures[host] = self._host_listings[host] = self._host_pool.submit(self._list_host, host)
+
+        done, _ = wait(futures.values(), timeout=self.host_timeout)
+        containers, synced = [], []
+        for host, future in futures.items():
+            if future not in done:
+                self._mark_host(host, False, f"timed out after {self.host_timeout}s")
+                continue
+            try:
+                host_containers, duration = future.result()
+            except Exception as e:
+                self._mark_host(host, False, str(e))
+                continue
+            containers.extend(host_containers)
+            synced.append(host)
+            self._mark_host(host, True, duration=duration)
+
+        if not synced:
+            print("SimEngine: No Docker host could be listed; skipping sync.")
+            return None
+        with self._locked("federated"):
+            try:
+                change_set = db.sync_containers_with_db(
+                    self.db_session, containers,
+                    id_prefixes=[docker.qualify_id(host, "") for host in synced])
+                logger.debug("SimEngine: Synced %d containers from %d of %d hosts.",
+                             len(containers), len(synced), len(self.hosts))
+                self._record_change_set(change_set)
+                return change_set
+            except Exception as e:
+                print(f"SimEngine: An unexpected error occurred during sync: {e}")
+            return None
+
+    def load_zone_index(self):
+        """Fills the zone index from the database; sync keeps it current afterwards."""
+        self.zone_index.load(db.get_active_zone_assignments())
+
+    def _record_change_set(self, change_set):
+        self.last_change_set = change_set
+        if change_set:
+            self.zone_index.apply(change_set)
+        if self.on_change and change_set and (
+                change_set["added"] or change_set["updated"] or change_set["deactivated"]):
+            try:
+                self.on_change(change_set)
+            except Exception as e:
+                print(f"SimEngine: Change listener failed: {e}")
+
+    def run_maintenance(self):
+        """Compacts old agent events into hourly summaries and archives long-retired agents."""
+        self._last_maintenance = time.monotonic()
+        try:
+            db.compact_agent_events(retention_days=self.event_retention_days)
+            if self.archive_after_days is not None:
+                archive.archive_retired_agents(older_than_days=self.archive_after_days)
+        except Exception as e:
+            print(f"SimEngine: Database maintenance failed: {e}")
+
+    @metrics.SYNC_SECONDS.time(kind="targeted")
+    def sync_agents(self, container_ids):
+        """Re-reads a set of containers and updates their rows in one transaction.
+
+        Args:
+            container_ids (list): The containers to refresh.
+
+        Returns:
+            The change set from `db.update_agents_from_containers`, or None on error.
+        """
+        try:
+            containers, missing = [], []
+            for container_id in container_ids:
+                container = docker.get_container(container_id)
+                if container is None:
+                    missing.append(container_id)
+                else:
+                    containers.append(container)
+            with self._locked("targeted"):
+                change_set = db.update_agents_from_containers(
+                    containers, deactivate_ids=missing, db_session=self.db_session)
+                self._record_change_set(change_set)
+                return change_set
+        except docker.errors.APIError as e:
+            print(f"SimEngine: Docker API error during targeted sync: {e}")
+        except Exception as e:
+            print(f"SimEngine: An unexpected error occurred during targeted sync: {e}")
+        return None
+
+    def request_resync(self, container_id):
+        """Queues a targeted resync of one container, e.g. after a command changed it.
+
+        Requests arriving within `resync_delay` of each other are handled
+        together: one targeted sync for a few containers, or a single full
+        sync when more than `resync_burst_limit` are pending. Returns at once;
+        the change reaches clients through `on_change`.
+        """
+        with self._resync_lock:
+            if self._resync_closed:
+                return
+            self._resync_pending.add(container_id)
+            if self._resync_thread is None:
+                self._resync_thread = Thread(target=self._drain_resyncs, name="resync", daemon=True)
+                self._resync_thread.start()
+        self._resync_wakeup.set()
+
+    def _drain_resyncs(self):
+        while True:
+            self._resync_wakeup.wait()
+            if self._resync_closed:
+                return
+            # Collect the rest of the burst before syncing.
+            time.sleep(self.resync_delay)
+            self._resync_wakeup.clear()
+            with self._resync_lock:
+                container_ids, self._resync_pending = self._resync_pending, set()
+            if not container_ids:
+                continue
+            if len(container_ids) > self.resync_burst_limit:
+                logger.debug("SimEngine: Coalescing %d resyncs into a full sync.", len(container_ids))
+                self.sync_agents_with_docker()
+            else:
+                self.sync_agents(sorted(container_ids))
+
+    def create_agents(self, specs, parallelism=4, progress=None):
+        """Creates many agents concurrently.
+
+        Containers are created on a pool of `parallelism` workers without holding
+        the engine lock, so periodic sync keeps running. Once every create has
+        finished, one targeted sync registers all the new agents in a single
+        database transaction.
+
+        Args:
+            specs (list): Dicts with a `name`, an optional `image`, and an
+                optional `host` when several Docker hosts are configured.
+            parallelism (int): Maximum number of concurrent creates.
+            progress (callable): Called with a result dict as each agent finishes.
+
+        Returns:
+            A list of result dicts with `name`, `image`, `success` and `result`
+            (the container ID, or an error message), in the order of `specs`.
+        """
+        total = len(specs)
+        results = [None] * total
+        done = 0
+
+        def create(spec):
+            image = spec.get("image") or "hello-world"
+            print(f"SimEngine: Creating agent '{spec['name']}' from image '{image}'.")
+            kwargs = {"host": spec["host"]} if spec.get("host") else {}
+            success, result = docker.create_agent(spec["name"], image, **kwargs)
+            return {"name": spec["name"], "image": image, "success": success, "result": result}
+
+        with ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix="create") as pool:
+            futures = {pool.submit(create, spec): index for index, spec in enumerate(specs)}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    outcome = {"name": specs[index]["name"], "image": specs[index].get("image"),
+                               "success": False, "result": str(e)}
+                results[index] = outcome
+                done += 1
+                if progress:
+                    progress(dict(outcome, done=done, total=total))
+
+        created_ids = [r["result"] for r in results if r["success"]]
+        if created_ids:
+            self.sync_agents(created_ids)
+        return results
+
+    def create_new_agent(self, name, image="hello-world", host=None):
         """Creates a new agent (Docker container).
 
         Args:
             name (str): The name for the new agent.
             image (str): The Docker image to use.
+            host (str): The federated host to create it on, if any.
 
         Returns:
             A tuple (success, message_or_id).
         """
-        with self.lock:
-            print(f"SimEngine: Creating agent '{name}' from image '{image}'.")
-            success, result = docker.create_agent(name, image)
-            if success:
-                # After creation, trigger an immediate sync to update the DB
-                self.sync_agents_with_docker()
-            return success, result
\ No newline at end of file
+        outcome = self.create_agents([{"name": name, "image": image, "host": host}], parallelism=1)[0]
+        return outcome["success"], outcome["result"]
@@ -0,0 +1,252 @@
+# snapshot.py
+
+import json
+from collections import deque
+from threading import Lock
+
+try:
+    import msgpack
+except ImportError:  # MessagePack is optional; clients fall back to JSON.
+    msgpack = None
+
+# Fields that change on every sync without the agent itself changing.
+VOLATILE_FIELDS = ("updated_at",)
+
+# Agent fields stored as JSON strings; they are sent to clients already decoded.
+DECODED_FIELDS = ("zone",)
+
+
+def _comparable(agent):
+    """Returns the part of an agent row that is relevant for change detection."""
+    return {k: v for k, v in agent.items() if k not in VOLATILE_FIELDS}
+
+
+class AgentSnapshotTracker:
+    """
+    Keeps a versioned view of the agent table for snapshot+delta broadcasts.
+
+    Every call to `update` that detects a difference bumps the generation
+    number and records the change set. Clients that acknowledged an older
+    generation can then be sent only the agents that were added, changed or
+    removed since then. Clients that fall further behind than the retained
+    history get a full snapshot instead.
+    """
+
+    def __init__(self, history_size=50):
+        """Initializes the tracker.
+
+        Args:
+            history_size (int): How many generations of change sets to keep.
+        """
+        self.generation = 0
+        self.agents = {}
+        # Generation in which each agent last changed; a cache key for its encoding.
+        self.versions = {}
+        self._history = deque(maxlen=history_size)
+
+    def update(self, agents):
+        """Records a fresh read of the agent table.
+
+        Args:
+            agents (list): Agent dictionaries as returned by `db.get_all_agents`.
+
+        Returns:
+            The new generation number if anything changed, otherwise None.
+        """
+        incoming = {agent['id']: agent for agent in agents}
+        added = [i for i in incoming if i not in self.agents]
+        changed = [
+            i for i in incoming
+            if i in self.agents and _comparable(incoming[i]) != _comparable(self.agents[i])
+        ]
+        removed = [i for i in self.agents if i not in incoming]
+
+        if not (added or changed or removed):
+            return None
+
+        self.agents = incoming
+        self.generation += 1
+        for agent_id in added + changed:
+            self.versions[agent_id] = self.generation
+        for agent_id in removed:
+            self.versions.pop(agent_id, None)
+        self._history.append((self.generation, set(added), set(changed), set(removed)))
+        return self.generation
+
+    def last_change(self):
+        """Returns (generation, added, changed, removed) for the newest generation, or None."""
+        return self._history[-1] if self._history else None
+
+    def snapshot(self):
+        """Returns a full snapshot message for the current generation."""
+        return {
+            "type": "full_update",
+            "generation": self.generation,
+            "agents": list(self.agents.values()),
+        }
+
+    def delta_since(self, base_generation):
+        """Builds a delta message covering every change after `base_generation`.
+
+        Args:
+            base_generation (int): The last generation the client acknowledged.
+
+        Returns:
+            A delta message dict, or None if the client is too far behind and
+            needs a full snapshot instead.
+        """
+        if base_generation is None or base_generation > self.generation:
+            return None
+        if base_generation == self.generation:
+            return {"type": "delta", "base": base_generation, "generation": self.generation,
+                    "added": [], "changed": [], "removed": []}
+
+        oldest = self._history[0][0] if self._history else self.generation + 1
+        if base_generation < oldest - 1:
+            return None
+
+        added, changed, removed = set(), set(), set()
+        for generation, gen_added, gen_changed, gen_removed in self._history:
+            if generation <= base_generation:
+                continue
+            for agent_id in gen_added:
+                removed.discard(agent_id)
+                added.add(agent_id)
+            for agent_id in gen_changed:
+                if agent_id not in added:
+                    changed.add(agent_id)
+            for agent_id in gen_removed:
+                # Always report removals, even for agents added inside the window:
+                # a client may have applied a newer delta than it acknowledged.
+                added.discard(agent_id)
+                changed.discard(agent_id)
+                removed.add(agent_id)
+
+        return {
+            "type": "delta",
+            "base": base_generation,
+            "generation": self.generation,
+            "added": [self.agents[i] for i in added if i in self.agents],
+            "changed": [self.agents[i] for i in changed if i in self.agents],
+            "removed": sorted(removed),
+        }
+
+
+def decode_agent(agent):
+    """Returns a copy of an agent row with its JSON string fields decoded."""
+    agent = dict(agent)
+    for field in DECODED_FIELDS:
+        if isinstance(agent.get(field), str):
+            try:
+                agent[field] = json.loads(agent[field])
+            except ValueError:
+                pass
+    return agent
+
+
+def available_encodings():
+    """Returns the wire encodings this server can produce."""
+    return ("json", "msgpack") if msgpack else ("json",)
+
+
+class SnapshotEncoder:
+    """
+    Serializes tracker snapshots and deltas, reusing each agent's encoding.
+
+    Every agent's fragment is cached per encoding, keyed by the generation in
+    which the agent last changed, so a broadcast only encodes agents that
+    actually changed and splices the cached fragments into the message.
+    Agent fields holding JSON strings (`DECODED_FIELDS`) are decoded once
+    here instead of in every client.
+
+    Because fragments are reused until an agent really changes, `updated_at`
+    reflects the last change rather than the last sync, as in deltas.
+
+    `encode_snapshot` and `encode_delta` may run in a worker thread, but not
+    concurrently with `AgentSnapshotTracker.update`. They may run in several
+    threads at once (e.g. a broadcast offloaded to a thread while the event
+    loop sends a snapshot to a new client); the fragment cache is guarded by
+    a lock that is only held for dict operations, never while encoding.
+    """
+
+    def __init__(self, tracker, default=None):
+        """Initializes the encoder.
+
+        Args:
+            tracker (AgentSnapshotTracker): The tracker whose state is encoded.
+            default (callable): Fallback for values JSON/MessagePack cannot encode.
+        """
+        self.tracker = tracker
+        self.default = default
+        self._fragments = {encoding: {} for encoding in available_encodings()}
+        self._lock = Lock()
+
+    def _check(self, encoding):
+        if encoding not in self._fragments:
+            raise ValueError(f"Unsupported encoding '{encoding}'. Available: {', '.join(available_encodings())}")
+
+    def dumps(self, value, encoding="json"):
+        """Encodes a plain value in the given wire encoding."""
+        if encoding == "msgpack":
+            return msgpack.packb(value, default=self.default)
+        return json.dumps(value, default=self.default)
+
+    def fragment(self, agent_id, encoding="json"):
+        """Returns the encoded agent, re-encoding it only if it changed."""
+        cache = self._fragments[encoding]
+        version = self.tracker.versions.get(agent_id)
+        with self._lock:
+            cached = cache.get(agent_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        # Encoded outside the lock; two threads racing here store the same payload.
+        payload = self.dumps(decode_agent(self.tracker.agents[agent_id]), encoding)
+        with self._lock:
+            cache[agent_id] = (version, payload)
+        return payload
+
+    def _assemble(self, header, lists, encoding):
+        """Builds a message from plain header values and lists of agent fragments."""
+        if encoding == "msgpack":
+            packer = msgpack.Packer(default=self.default)
+            parts = [packer.pack_map_header(len(header) + len(lists))]
+            for key, value in header.items():
+                parts.append(packer.pack(key) + packer.pack(value))
+            for key, fragments in lists.items():
+                parts.append(packer.pack(key) + packer.pack_array_header(len(fragments)))
+                parts.extend(fragments)
+            return b"".join(parts)
+        parts = [f"{json.dumps(key)}: {json.dumps(value, default=self.default)}" for key, value in header.items()]
+        parts += [f"{json.dumps(key)}: [{', '.join(fragments)}]" for key, fragments in lists.items()]
+        return "{" + ", ".join(parts) + "}"
+
+    def encode_snapshot(self, encoding="json"):
+        """Returns the encoded full snapshot message for the current generation."""
+        self._check(encoding)
+        agents = self.tracker.agents
+        cache = self._fragments[encoding]
+        with self._lock:
+            if len(cache) > len(agents):
+                for agent_id in [i for i in cache if i not in agents]:
+                    del cache[agent_id]
+        fragments = [self.fragment(agent_id, encoding) for agent_id in list(agents)]
+        header = {"type": "full_update", "generation": self.tracker.generation}
+        return self._assemble(header, {"agents": fragments}, encoding)
+
+    def encode_delta(self, base_generation, encoding="json"):
+        """Returns the encoded delta since `base_generation`, or None if a snapshot is needed."""
+        self._check(encoding)
+        delta = self.tracker.delta_since(base_generation)
+        if delta is None:
+            return None
+        header = {"type": "delta", "base": delta["base"], "generation": delta["generation"],
+                  "removed": delta["removed"]}
+        lists = {
+            key: [self.fragment(agent["id"], encoding) for agent in delta[key]]
+            for key in ("added", "changed")
+        }
+        return self._assemble(header, lists, encoding)
+
+    def encode_state(self, base_generation, encoding="json"):
+        """Returns the delta since `base_generation`, or a full snapshot if the client is too far behind."""
+        return self.encode_delta(base_generation, encoding) or self.encode_snapshot(encoding)
@@ -2,4 +2,4 @@
 
 # Start the FastAPI server
 # It serves both the API and the static frontend files
-uvicorn echopulse:app --host 0.0.0.0 --port 8502
+uvicorn echopulse:app --host 0.0.0.0 --port 8502 --ws-per-message-deflate "${ECHOSIM_WS_DEFLATE:-true}" --workers "${ECHOSIM_WORKERS:-1}"
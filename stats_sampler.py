@@ -0,0 +1,237 @@
+# stats_sampler.py
+
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock
+
+import db
+import docker_bridge as docker
+
+# Metrics kept for every agent, in the order they are stored.
+METRICS = ("cpu_percent", "mem_bytes", "mem_percent", "net_rx_rate", "net_tx_rate")
+
+
+class MetricRing:
+    """A fixed-size ring buffer of (timestamp, value) pairs stored as C doubles."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._times = array('d', bytes(8 * capacity))
+        self._values = array('d', bytes(8 * capacity))
+        self._head = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, value):
+        self._times[self._head] = timestamp
+        self._values[self._head] = value
+        self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def items(self):
+        """Returns the stored pairs, oldest first."""
+        start = (self._head - self._count) % self.capacity
+        indexes = [(start + i) % self.capacity for i in range(self._count)]
+        return [(self._times[i], self._values[i]) for i in indexes]
+
+
+def parse_stats(raw, previous=None):
+    """Turns a raw Docker stats document into compact metrics.
+
+    Args:
+        raw (dict): A stats document from the Docker API.
+        previous (dict): The counters returned for the previous sample, used
+            to compute CPU usage and network rates.
+
+    Returns:
+        A tuple (metrics dict, counters dict).
+    """
+    cpu = raw.get("cpu_stats") or {}
+    cpu_total = (cpu.get("cpu_usage") or {}).get("total_usage", 0)
+    system_total = cpu.get("system_cpu_usage", 0)
+    online_cpus = cpu.get("online_cpus") or len((cpu.get("cpu_usage") or {}).get("percpu_usage") or []) or 1
+
+    memory = raw.get("memory_stats") or {}
+    memory_detail = memory.get("stats") or {}
+    # Page cache is reclaimable, so it is not counted as used memory (same as `docker stats`).
+    mem_bytes = memory.get("usage", 0) - memory_detail.get("inactive_file", memory_detail.get("cache", 0))
+    mem_limit = memory.get("limit", 0)
+
+    networks = raw.get("networks") or {}
+    rx_bytes = sum(n.get("rx_bytes", 0) for n in networks.values())
+    tx_bytes = sum(n.get("tx_bytes", 0) for n in networks.values())
+
+    now = time.time()
+    counters = {"time": now, "cpu_total": cpu_total, "system_total": system_total,
+                "rx_bytes": rx_bytes, "tx_bytes": tx_bytes}
+
+    cpu_percent = net_rx_rate = net_tx_rate = 0.0
+    if previous:
+        cpu_delta = cpu_total - previous["cpu_total"]
+        system_delta = system_total - previous["system_total"]
+        if cpu_delta > 0 and system_delta > 0:
+            cpu_percent = cpu_delta / system_delta * online_cpus * 100.0
+        elapsed = now - previous["time"]
+        if elapsed > 0:
+            net_rx_rate = max(0.0, (rx_bytes - previous["rx_bytes"]) / elapsed)
+            net_tx_rate = max(0.0, (tx_bytes - previous["tx_bytes"]) / elapsed)
+
+    metrics = {
+        "cpu_percent": cpu_percent,
+        "mem_bytes": float(max(mem_bytes, 0)),
+        "mem_percent": (mem_bytes / mem_limit * 100.0) if mem_limit else 0.0,
+        "net_rx_rate": net_rx_rate,
+        "net_tx_rate": net_tx_rate,
+    }
+    return metrics, counters
+
+
+class AgentStats:
+    """Recent (fine) and downsampled (coarse) metric history for one agent."""
+
+    def __init__(self, fine_capacity, coarse_capacity, downsample_every):
+        self.fine = {metric: MetricRing(fine_capacity) for metric in METRICS}
+        self.coarse = {metric: MetricRing(coarse_capacity) for metric in METRICS}
+        self.downsample_every = downsample_every
+        self.counters = None
+        self.latest = None
+        self._pending = {metric: 0.0 for metric in METRICS}
+        self._pending_count = 0
+
+    def add(self, timestamp, metrics):
+        self.latest = dict(metrics, time=timestamp)
+        for metric in METRICS:
+            self.fine[metric].append(timestamp, metrics[metric])
+            self._pending[metric] += metrics[metric]
+        self._pending_count += 1
+        if self._pending_count == self.downsample_every:
+            # Older data survives as the average of each block of fine samples.
+            for metric in METRICS:
+                self.coarse[metric].append(timestamp, self._pending[metric] / self._pending_count)
+                self._pending[metric] = 0.0
+            self._pending_count = 0
+
+    def history(self, resolution="fine"):
+        rings = self.fine if resolution == "fine" else self.coarse
+        return {metric: rings[metric].items() for metric in METRICS}
+
+
+def _running_agent_ids():
+    return [agent['id'] for agent in db.get_all_agents(active_only=True) if agent.get('status') == 'running']
+
+
+class StatsSampler:
+    """
+    Samples container stats for running agents in the background.
+
+    Samples are fetched concurrently on a small thread pool with the daemon's
+    one-shot stats mode, parsed into fixed-size numeric ring buffers, and
+    handed to `on_sample` so they can be pushed to subscribed clients. Once
+    `watch` has been called, only the watched agents are sampled.
+    """
+
+    def __init__(self, interval=5, max_workers=16, fine_capacity=120, coarse_capacity=288,
+                 downsample_every=12, agent_source=None, fetcher=None, on_sample=None):
+        """Initializes the sampler.
+
+        Args:
+            interval (float): Seconds between sampling rounds.
+            max_workers (int): Number of stats requests in flight at once.
+            fine_capacity (int): Full-resolution samples kept per metric.
+            coarse_capacity (int): Downsampled samples kept per metric.
+            downsample_every (int): Fine samples averaged into one coarse sample.
+            agent_source (callable): Returns the agent IDs to sample.
+            fetcher (callable): Returns a raw stats document for an agent ID, or None.
+            on_sample (callable): Called with {agent_id: latest metrics} after each round.
+        """
+        self.interval = interval
+        self.fine_capacity = fine_capacity
+        self.coarse_capacity = coarse_capacity
+        self.downsample_every = downsample_every
+        self.agent_source = agent_source or _running_agent_ids
+        self.fetcher = fetcher or docker.get_container_stats_snapshot
+        self.on_sample = on_sample
+        self.is_running = False
+        self._agents = {}
+        # Agent IDs to sample, or None for every running agent. Replaced, never mutated.
+        self._watched = None
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stats")
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def start(self):
+        if not self.is_running:
+            self.is_running = True
+            self._thread.start()
+
+    def stop(self):
+        if self.is_running:
+            self.is_running = False
+            if self._thread.is_alive():
+                self._thread.join()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        while self.is_running:
+            started = time.monotonic()
+            try:
+                self.sample_once()
+            except Exception as e:
+                print(f"StatsSampler: Sampling round failed: {e}")
+            deadline = started + self.interval
+            while self.is_running and time.monotonic() < deadline:
+                time.sleep(min(0.5, self.interval))
+
+    def watch(self, agent_ids):
+        """Limits sampling to `agent_ids`, e.g. the agents clients are subscribed to.
+
+        Agents that are no longer watched lose their history at the next round.
+        """
+        self._watched = frozenset(agent_ids)
+
+    def sample_once(self):
+        """Runs one sampling round over the running (and watched) agents.
+
+        Returns:
+            A dict {agent_id: latest metrics} for the agents sampled this round.
+        """
+        watched = self._watched
+        if watched is not None and not watched:
+            # Nobody is subscribed, so skip the agent query and the Docker calls.
+            agent_ids = []
+        else:
+            agent_ids = [agent_id for agent_id in self.agent_source() if watched is None or agent_id in watched]
+        raws = list(self._executor.map(self.fetcher, agent_ids))
+        now = time.time()
+        latest = {}
+        with self._lock:
+            for agent_id in set(self._agents) - set(agent_ids):
+                del self._agents[agent_id]
+            for agent_id, raw in zip(agent_ids, raws):
+                if not raw:
+                    continue
+                stats = self._agents.get(agent_id)
+                if stats is None:
+                    stats = AgentStats(self.fine_capacity, self.coarse_capacity, self.downsample_every)
+                    self._agents[agent_id] = stats
+                metrics, stats.counters = parse_stats(raw, stats.counters)
+                stats.add(now, metrics)
+                latest[agent_id] = stats.latest
+        if latest and self.on_sample:
+            self.on_sample(latest)
+        return latest
+
+    def latest(self, agent_id):
+        """Returns the most recent metrics for an agent, or None."""
+        with self._lock:
+            stats = self._agents.get(agent_id)
+            return dict(stats.latest) if stats and stats.latest else None
+
+    def history(self, agent_id, resolution="fine"):
+        """Returns {metric: [(timestamp, value), ...]} for an agent, oldest first."""
+        with self._lock:
+            stats = self._agents.get(agent_id)
+            return stats.history(resolution) if stats else {}
@@ -0,0 +1,227 @@
+# subscriptions.py
+
+from collections import deque
+
+from snapshot import decode_agent
+from zones import zone_key_for
+
+
+def agent_zone(agent):
+    """Returns the zone key of an agent row, or None."""
+    return agent.get("zone_key") or zone_key_for(agent.get("zone"))
+
+
+class Subscription:
+    """
+    What one client wants to see: a set of zones and/or agent IDs, optionally
+    only active agents, and optionally only some fields of each agent.
+
+    An agent matches if it is in one of the zones or one of the agent IDs;
+    with neither given, every agent matches.
+    """
+
+    def __init__(self, zones=None, agent_ids=None, active_only=False, fields=None):
+        # Zones may be given by key or by name; they are matched by key.
+        self.zones = frozenset(zone_key_for(zone) or zone for zone in (zones or ()))
+        self.agent_ids = frozenset(agent_ids or ())
+        self.active_only = bool(active_only)
+        # The ID is always sent; the client needs it to apply deltas.
+        self.fields = ("id",) + tuple(f for f in fields if f != "id") if fields else None
+
+    @classmethod
+    def from_command(cls, command):
+        """Builds a subscription from a `subscribe` WebSocket command.
+
+        Raises:
+            ValueError: If a filter has the wrong type.
+        """
+        for key in ("zones", "agent_ids", "fields"):
+            value = command.get(key)
+            if value is not None and not (isinstance(value, list) and all(isinstance(v, str) for v in value)):
+                raise ValueError(f"'{key}' must be a list of strings.")
+        return cls(
+            zones=command.get("zones"),
+            agent_ids=command.get("agent_ids"),
+            active_only=command.get("active_only", False),
+            fields=command.get("fields"),
+        )
+
+    @property
+    def is_wildcard(self):
+        """True if the subscription is not limited to particular zones or agents."""
+        return not (self.zones or self.agent_ids)
+
+    def matches(self, agent):
+        if self.active_only and not agent.get("is_active"):
+            return False
+        if self.is_wildcard:
+            return True
+        return agent["id"] in self.agent_ids or agent_zone(agent) in self.zones
+
+    def project(self, agent):
+        """Returns the agent as this client should receive it."""
+        agent = decode_agent(agent)
+        if self.fields is None:
+            return agent
+        return {field: agent[field] for field in self.fields if field in agent}
+
+
+class SubscriptionRouter:
+    """
+    Routes agent changes to the subscribed clients that care about them.
+
+    Clients are indexed by the agent IDs and zones they asked for, and agents
+    by their current zone, so a change only reaches the clients interested
+    in that agent or in the zone it was or is in. Clients without a
+    subscription are not tracked here; they get the shared broadcast.
+    """
+
+    def __init__(self, history_size=50):
+        self._subscriptions = {}
+        self._by_agent = {}
+        self._by_zone = {}
+        self._wildcard = set()
+        # Current zone of every agent, and the agents in every zone.
+        self._zone_of = {}
+        self._members = {}
+        # Zones agents left in each recent generation, to reach clients that still show them there.
+        self._departures = deque(maxlen=history_size)
+        self.generation = None
+        self._indexed_since = None
+
+    def __contains__(self, client):
+        return client in self._subscriptions
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def get(self, client):
+        return self._subscriptions.get(client)
+
+    def subscribe(self, client, subscription):
+        """Sets (or replaces) a client's subscription."""
+        self.unsubscribe(client)
+        self._subscriptions[client] = subscription
+        if subscription.is_wildcard:
+            self._wildcard.add(client)
+        for agent_id in subscription.agent_ids:
+            self._by_agent.setdefault(agent_id, set()).add(client)
+        for zone in subscription.zones:
+            self._by_zone.setdefault(zone, set()).add(client)
+
+    def unsubscribe(self, client):
+        subscription = self._subscriptions.pop(client, None)
+        if subscription is None:
+            return
+        self._wildcard.discard(client)
+        for key, index in ((subscription.agent_ids, self._by_agent), (subscription.zones, self._by_zone)):
+            for value in key:
+                clients = index.get(value)
+                if clients is not None:
+                    clients.discard(client)
+                    if not clients:
+                        del index[value]
+
+    def members(self, zone):
+        """Returns the IDs of the agents currently in a zone (by key)."""
+        return self._members.get(zone, set())
+
+    def _place(self, agent_id, zone):
+        old = self._zone_of.get(agent_id)
+        if old == zone:
+            return None
+        if old is not None:
+            self._members[old].discard(agent_id)
+        if zone is None:
+            self._zone_of.pop(agent_id, None)
+        else:
+            self._zone_of[agent_id] = zone
+            self._members.setdefault(zone, set()).add(agent_id)
+        return old
+
+    def index(self, tracker):
+        """Brings the zone index up to date with the tracker's latest generation.
+
+        Call after every `tracker.update` that returned a new generation. If
+        generations were skipped, the index is rebuilt and older deltas fall
+        back to snapshots.
+        """
+        if tracker.generation == self.generation:
+            return
+        last = tracker.last_change()
+        if self.generation is None or last is None or last[0] != self.generation + 1:
+            self._zone_of, self._members = {}, {}
+            for agent_id, agent in tracker.agents.items():
+                self._place(agent_id, agent_zone(agent))
+            self._departures.clear()
+            self.generation = self._indexed_since = tracker.generation
+            return
+
+        generation, added, changed, removed = last
+        departed = {}
+        for agent_id in added | changed:
+            old = self._place(agent_id, agent_zone(tracker.agents[agent_id]))
+            if old is not None:
+                departed[agent_id] = old
+        for agent_id in removed:
+            old = self._place(agent_id, None)
+            if old is not None:
+                departed[agent_id] = old
+        self._departures.append((generation, departed))
+        self.generation = generation
+
+    def _interested(self, agent_id, zones):
+        clients = set(self._wildcard)
+        clients |= self._by_agent.get(agent_id, set())
+        for zone in zones:
+            clients |= self._by_zone.get(zone, set())
+        return clients
+
+    def route(self, delta, clients):
+        """Splits a tracker delta into per-client deltas.
+
+        Args:
+            delta (dict): A message from `tracker.delta_since`.
+            clients (iterable): The subscribed clients that acknowledged `delta["base"]`.
+
+        Returns:
+            A dict mapping each client to its own `added`, `changed` and
+            `removed` lists, or None if the index cannot cover this base and
+            the clients need filtered snapshots instead.
+        """
+        if self._indexed_since is None or delta["base"] < self._indexed_since:
+            return None
+        clients = set(clients)
+        routed = {client: {"added": [], "changed": [], "removed": []} for client in clients}
+        departed = {}
+        for generation, moves in self._departures:
+            if generation > delta["base"]:
+                for agent_id, zone in moves.items():
+                    departed.setdefault(agent_id, set()).add(zone)
+
+        for key in ("added", "changed"):
+            for agent in delta[key]:
+                zones = departed.get(agent["id"], set()) | {self._zone_of.get(agent["id"])}
+                for client in self._interested(agent["id"], zones) & clients:
+                    subscription = self._subscriptions[client]
+                    if subscription.matches(agent):
+                        routed[client][key].append(subscription.project(agent))
+                    else:
+                        # It may have matched before; tell the client to drop it.
+                        routed[client]["removed"].append(agent["id"])
+        for agent_id in delta["removed"]:
+            for client in self._interested(agent_id, departed.get(agent_id, ())) & clients:
+                routed[client]["removed"].append(agent_id)
+        return routed
+
+    def snapshot_agents(self, client, tracker):
+        """Returns the agents a subscribed client should see, already projected."""
+        subscription = self._subscriptions[client]
+        if subscription.is_wildcard:
+            candidates = tracker.agents.keys()
+        else:
+            candidates = set(subscription.agent_ids)
+            for zone in subscription.zones:
+                candidates |= self.members(zone)
+        agents = (tracker.agents[agent_id] for agent_id in candidates if agent_id in tracker.agents)
+        return [subscription.project(agent) for agent in agents if subscription.matches(agent)]
@@ -0,0 +1,364 @@
+# task_queue.py
+
+import json
+import time
+from datetime import datetime, timedelta
+from threading import Thread
+
+import db
+import metrics
+
+# Task states. A task is queued until leased to an agent, and leased until the
+# agent reports back or its lease runs out.
+QUEUED, LEASED, DONE, FAILED, EXPIRED = "queued", "leased", "done", "failed", "expired"
+
+# Omega's verdicts on a finished task, from the systhanos-rules design.
+RECYCLE, ARCHIVE, DESTROY = "recycle", "archive", "destroy"
+
+_TASK_COLUMNS = "id, task, payload, priority, state, agent_id, attempts, max_attempts, created_at, expires_at, lease_until, finished_at, result, decision"
+
+
+def _task(row):
+    task = dict(row)
+    for field in ("payload", "result"):
+        if task.get(field) is not None:
+            task[field] = json.loads(task[field])
+    return task
+
+
+def _begin(conn):
+    # Take the write lock up front so concurrent dequeues cannot pick the same rows.
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+
+
+@metrics.DB_SECONDS.time(op="enqueue_tasks")
+def enqueue(tasks, now=None):
+    """Adds tasks to the queue in one transaction.
+
+    Args:
+        tasks (iterable): Dicts with a `task` description and optional
+            `payload` (any JSON value), `priority` (higher runs first),
+            `ttl` (seconds until the task expires unstarted) and `max_attempts`.
+        now (datetime): The current time; defaults to utcnow.
+
+    Returns:
+        The IDs of the new tasks, in order.
+
+    Raises:
+        ValueError: If a task has no description.
+    """
+    now = now or datetime.utcnow()
+    rows = []
+    for task in tasks:
+        if not task.get("task"):
+            raise ValueError("Every task needs a 'task' description.")
+        ttl = task.get("ttl")
+        rows.append((
+            task["task"],
+            json.dumps(task.get("payload"), default=str),
+            int(task.get("priority", 0)),
+            int(task.get("max_attempts", 3)),
+            now,
+            now + timedelta(seconds=ttl) if ttl else None,
+        ))
+    if not rows:
+        return []
+    with db.get_db_connection() as conn:
+        _begin(conn)
+        ids = _insert(conn.cursor(), rows)
+        conn.commit()
+    return ids
+
+
+def _insert(cursor, rows):
+    """Inserts task rows inside a write transaction and returns their IDs, in order."""
+    cursor.executemany(
+        "INSERT INTO tasks (task, payload, priority, max_attempts, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+        rows
+    )
+    # The write lock is held, so the newest rows are the ones just inserted.
+    cursor.execute("SELECT id FROM tasks ORDER BY id DESC LIMIT ?", (len(rows),))
+    return [row["id"] for row in reversed(cursor.fetchall())]
+
+
+def _recycled_row(row, now):
+    """Builds the insert row for a recycled copy of `row`, keeping the original time to live."""
+    expires_at = None
+    if row["expires_at"] is not None:
+        ttl = datetime.fromisoformat(str(row["expires_at"])) - datetime.fromisoformat(str(row["created_at"]))
+        expires_at = now + ttl
+    return (row["task"], row["payload"], row["priority"], row["max_attempts"], now, expires_at)
+
+
+@metrics.DB_SECONDS.time(op="lease_tasks")
+def lease(agent_ids, lease_seconds=60, now=None):
+    """Hands the highest-priority queued tasks to agents, one task per agent.
+
+    Dequeue walks the partial index of queued tasks in priority order and
+    skips tasks past their expiry, all in one write transaction.
+
+    Args:
+        agent_ids (list): Idle agents to give work to.
+        lease_seconds (float): How long each agent has to report back before
+            its task is queued again.
+        now (datetime): The current time; defaults to utcnow.
+
+    Returns:
+        A list of leased task dicts, each with its `agent_id`.
+    """
+    agent_ids = list(agent_ids)
+    if not agent_ids:
+        return []
+    now = now or datetime.utcnow()
+    lease_until = now + timedelta(seconds=lease_seconds)
+    with db.get_db_connection() as conn:
+        _begin(conn)
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT {_TASK_COLUMNS} FROM tasks
+            WHERE state = 'queued' AND (expires_at IS NULL OR expires_at > ?)
+            ORDER BY priority DESC, id LIMIT ?
+        """, (now, len(agent_ids)))
+        tasks = [_task(row) for row in cursor.fetchall()]
+        for task, agent_id in zip(tasks, agent_ids):
+            task.update(state=LEASED, agent_id=agent_id, attempts=task["attempts"] + 1, lease_until=lease_until)
+        cursor.executemany(
+            "UPDATE tasks SET state = 'leased', agent_id = ?, attempts = attempts + 1, lease_until = ? WHERE id = ?",
+            [(task["agent_id"], lease_until, task["id"]) for task in tasks]
+        )
+        conn.commit()
+    return tasks
+
+
+def _finish(task_id, agent_id, state, result, decision=None, now=None):
+    """Moves a leased task to a final state. Returns the task, or None if it was not leased to `agent_id`.
+
+    A RECYCLE decision queues the task again as a new task in the same transaction.
+    """
+    now = now or datetime.utcnow()
+    with db.get_db_connection() as conn:
+        _begin(conn)
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {_TASK_COLUMNS} FROM tasks WHERE id = ? AND state = 'leased'", (task_id,))
+        row = cursor.fetchone()
+        if row is None or (agent_id is not None and row["agent_id"] != agent_id):
+            conn.rollback()
+            return None
+        cursor.execute(
+            "UPDATE tasks SET state = ?, result = ?, decision = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+            (state, json.dumps(result, default=str), decision, now, task_id)
+        )
+        if decision == RECYCLE:
+            _insert(cursor, [_recycled_row(row, now)])
+        conn.commit()
+    return dict(_task(row), state=state, result=result, decision=decision, finished_at=now)
+
+
+def ack(task_id, result=None, agent_id=None, decision=None, now=None):
+    """Marks a leased task as done.
+
+    A late report for a task whose lease already ran out (and that was
+    queued again or handed to another agent) is rejected. With a RECYCLE
+    `decision` the task is queued again as a new task, with the same time
+    to live, atomically with the ack.
+
+    Returns:
+        The finished task dict, or None if the task was not leased (to `agent_id`).
+    """
+    return _finish(task_id, agent_id, DONE, result, decision, now)
+
+
+def nack(task_id, error=None, agent_id=None, now=None):
+    """Reports a failed attempt. The task is queued again until it runs out of attempts.
+
+    Returns:
+        The task dict, or None if the task was not leased (to `agent_id`).
+    """
+    now = now or datetime.utcnow()
+    with db.get_db_connection() as conn:
+        _begin(conn)
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {_TASK_COLUMNS} FROM tasks WHERE id = ? AND state = 'leased'", (task_id,))
+        row = cursor.fetchone()
+        if row is None or (agent_id is not None and row["agent_id"] != agent_id):
+            conn.rollback()
+            return None
+        state = QUEUED if row["attempts"] < row["max_attempts"] else FAILED
+        cursor.execute(
+            "UPDATE tasks SET state = ?, result = ?, agent_id = NULL, lease_until = NULL, finished_at = ? WHERE id = ?",
+            (state, json.dumps(error, default=str), now if state == FAILED else None, task_id)
+        )
+        conn.commit()
+    return dict(_task(row), state=state, result=error)
+
+
+@metrics.DB_SECONDS.time(op="expire_tasks")
+def reap(now=None):
+    """Queues again tasks whose lease ran out, and expires queued tasks past their deadline.
+
+    Returns:
+        A dict with the number of tasks `requeued`, `failed` and `expired`.
+    """
+    now = now or datetime.utcnow()
+    with db.get_db_connection() as conn:
+        _begin(conn)
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE tasks SET state = 'failed', agent_id = NULL, lease_until = NULL, finished_at = ?
+            WHERE state = 'leased' AND lease_until < ? AND attempts >= max_attempts
+        """, (now, now))
+        failed = cursor.rowcount
+        cursor.execute("""
+            UPDATE tasks SET state = 'queued', agent_id = NULL, lease_until = NULL
+            WHERE state = 'leased' AND lease_until < ?
+        """, (now,))
+        requeued = cursor.rowcount
+        cursor.execute("""
+            UPDATE tasks SET state = 'expired', finished_at = ?
+            WHERE state = 'queued' AND expires_at IS NOT NULL AND expires_at <= ?
+        """, (now, now))
+        expired = cursor.rowcount
+        conn.commit()
+    return {"requeued": requeued, "failed": failed, "expired": expired}
+
+
+def idle_agents(limit):
+    """Returns up to `limit` running agents that hold no leased task."""
+    with db.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id FROM agents
+            WHERE is_active = TRUE AND status = 'running'
+              AND NOT EXISTS (SELECT 1 FROM tasks WHERE state = 'leased' AND tasks.agent_id = agents.id)
+            LIMIT ?
+        """, (limit,))
+        return [row["id"] for row in cursor.fetchall()]
+
+
+def get_task(task_id):
+    with db.get_db_connection() as conn:
+        row = conn.execute(f"SELECT {_TASK_COLUMNS} FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    return _task(row) if row is not None else None
+
+
+def counts():
+    """Returns the number of tasks in each state."""
+    with db.get_db_connection() as conn:
+        rows = conn.execute("SELECT state, COUNT(*) AS n FROM tasks GROUP BY state").fetchall()
+    return {row["state"]: row["n"] for row in rows}
+
+
+class Omega:
+    """
+    Collects task results and decides what happens to each finished task.
+
+    As in the systhanos-rules prototype, urgent tasks are recycled (queued
+    again as a new task), log tasks are archived and everything else is
+    destroyed. Here the verdict is recorded on the task rather than acted on
+    a container; `decide` can be replaced to change the rules.
+    """
+
+    def __init__(self, decide=None, on_result=None):
+        """Initializes the collector.
+
+        Args:
+            decide (callable): Called as `decide(task, result)`; returns
+                RECYCLE, ARCHIVE or DESTROY.
+            on_result (callable): Called with every finished task dict.
+        """
+        self.decide = decide or self.default_decision
+        self.on_result = on_result
+
+    @staticmethod
+    def default_decision(task, result):
+        description = task["task"]
+        if "urgent" in description:
+            return RECYCLE
+        if "log" in description:
+            return ARCHIVE
+        return DESTROY
+
+    def report(self, task_id, agent_id, result=None, success=True):
+        """Takes an agent's report on a leased task.
+
+        Returns:
+            The task dict, with its `decision` when it succeeded, or None if
+            the task is not leased to this agent.
+        """
+        if not success:
+            task = nack(task_id, result, agent_id=agent_id)
+        else:
+            leased = get_task(task_id)
+            if leased is None:
+                return None
+            decision = self.decide(leased, result)
+            task = ack(task_id, result, agent_id=agent_id, decision=decision)
+        if task is not None and self.on_result:
+            try:
+                self.on_result(task)
+            except Exception as e:
+                print(f"Omega: Result listener failed: {e}")
+        return task
+
+
+class Dispatcher:
+    """
+    Alpha: hands queued tasks to idle agents in batches.
+
+    Every round reaps expired leases and deadlines, finds up to `batch_size`
+    idle agents and leases them the highest-priority tasks in a single
+    transaction. `deliver` is called with each batch of assignments; it is
+    how tasks reach the agents.
+    """
+
+    def __init__(self, deliver=None, batch_size=100, lease_seconds=60, interval=1, idle_agents=idle_agents):
+        """Initializes the dispatcher.
+
+        Args:
+            deliver (callable): Called with a list of leased task dicts after every non-empty round.
+            batch_size (int): Most tasks leased per round.
+            lease_seconds (float): Lease length handed to `lease`.
+            interval (float): Seconds between rounds when there was nothing to do.
+            idle_agents (callable): Called with a limit; returns idle agent IDs.
+        """
+        self.deliver = deliver
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self.idle_agents = idle_agents
+        self.is_running = False
+        self._thread = None
+
+    def dispatch(self):
+        """Runs one round. Returns the leased tasks."""
+        reap()
+        agents = self.idle_agents(self.batch_size)
+        tasks = lease(agents, self.lease_seconds) if agents else []
+        if tasks and self.deliver:
+            try:
+                self.deliver(tasks)
+            except Exception as e:
+                print(f"Dispatcher: Delivering {len(tasks)} tasks failed: {e}")
+        return tasks
+
+    def start(self):
+        if self.is_running:
+            return
+        self.is_running = True
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.is_running = False
+
+    def _run(self):
+        while self.is_running:
+            try:
+                tasks = self.dispatch()
+            except Exception as e:
+                print(f"Dispatcher: Round failed: {e}")
+                tasks = []
+            # A full batch means there may be more to hand out right away.
+            if len(tasks) < self.batch_size:
+                time.sleep(self.interval)
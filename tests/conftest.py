@@ -24,5 +24,10 @@ def clean_db(db_connection):
     """Function-scoped fixture to clean the database before each test."""
     cursor = db_connection.cursor()
     cursor.execute("DELETE FROM agents")
+    cursor.execute("DELETE FROM agent_events")
+    cursor.execute("DELETE FROM agent_event_hourly")
+    cursor.execute("DELETE FROM agent_thoughts")
+    cursor.execute("DELETE FROM archived_agents")
+    cursor.execute("DELETE FROM tasks")
     db_connection.commit()
     yield
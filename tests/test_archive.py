@@ -0,0 +1,88 @@
+import pytest
+import sys
+import os
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import archive
+import db
+import memory_garden
+
+@pytest.fixture
+def archive_db(tmp_path, monkeypatch):
+    pool = db.ConnectionPool(str(tmp_path / 'archive.db'))
+    monkeypatch.setattr(archive, '_pool', pool)
+    archive.init_archive()
+    yield pool
+    pool.close_all()
+
+def _retire(agent_id, name):
+    db.add_or_update_agent({'id': agent_id, 'name': name, 'status': 'exited'})
+    db.deactivate_agent(agent_id)
+
+def _container(container_id, status='exited'):
+    container = MagicMock()
+    container.id = container_id
+    container.name = f'echo-{container_id}'
+    container.status = status
+    container.labels = {}
+    return container
+
+def test_archive_moves_only_old_retired_agents(db_connection, archive_db):
+    """Test that long-retired agents and their thoughts leave the hot tables but stay retrievable."""
+    _retire('old', 'ancient')
+    db.append_thoughts([('old', 'a memory')])
+    db.add_or_update_agent({'id': 'alive', 'name': 'living', 'status': 'running'})
+
+    assert archive.archive_retired_agents(older_than_days=30, now=datetime.utcnow() + timedelta(days=31)) == 1
+
+    assert [agent['id'] for agent in db.get_all_agents(active_only=False)] == ['alive']
+    assert db.get_thoughts('old') == []
+    record = memory_garden.get_archived_agent('old')
+    assert record['name'] == 'ancient'
+    assert [t['content'] for t in record['thoughts']] == ['a memory']
+    assert [agent['id'] for agent in memory_garden.find_archived_agents('ancient')] == ['old']
+
+def test_garden_pages_continue_into_the_archive(db_connection, archive_db):
+    """Test that paging runs through the hot Memory Garden and then the archive."""
+    for i in range(3):
+        _retire(f'old-{i}', f'old-{i}')
+    archive.archive_retired_agents(older_than_days=0, now=datetime.utcnow() + timedelta(seconds=1))
+    _retire('recent', 'recent')
+
+    seen, cursor = [], None
+    while True:
+        agents, cursor = memory_garden.get_retired_agents_page(limit=2, cursor=cursor)
+        seen.extend(agent['id'] for agent in agents)
+        if cursor is None:
+            break
+    assert seen == ['recent', 'old-2', 'old-1', 'old-0']
+    assert len(memory_garden.get_retired_agents()) == 1
+    assert len(memory_garden.get_retired_agents(include_archived=True)) == 4
+
+def test_sync_does_not_resurrect_archived_agents(db_connection, archive_db):
+    """Test that a stopped container of an archived agent is not re-added by sync."""
+    _retire('old', 'ancient')
+    archive.archive_retired_agents(older_than_days=0, now=datetime.utcnow() + timedelta(seconds=1))
+
+    change_set = db.sync_containers_with_db(None, [_container('old'), _container('new')])
+
+    assert change_set['added'] == ['new']
+    assert [agent['id'] for agent in db.get_all_agents(active_only=False)] == ['new']
+
+def test_sync_restores_archived_agents_running_again(db_connection, archive_db):
+    """Test that a running container of an archived agent is un-archived and added back by sync."""
+    _retire('old', 'ancient')
+    archive.archive_retired_agents(older_than_days=0, now=datetime.utcnow() + timedelta(seconds=1))
+
+    change_set = db.update_agents_from_containers([_container('old', 'running')])
+
+    assert change_set['added'] == ['old']
+    assert [agent['id'] for agent in db.get_all_agents()] == ['old']
+    assert memory_garden.find_archived_agents('ancient') == []
+    # Once it stops again it is an ordinary retired agent, not an archived one.
+    db.sync_containers_with_db(None, [_container('old')])
+    assert [agent['id'] for agent in db.get_all_agents(active_only=False)] == ['old']
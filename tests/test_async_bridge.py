@@ -0,0 +1,74 @@
+import pytest
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+import sys
+import os
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from async_bridge import AsyncDockerBridge
+
+@pytest.mark.asyncio
+async def test_blocking_call_does_not_block_event_loop():
+    """Test that a slow Docker call leaves the event loop free to run other tasks."""
+    bridge = AsyncDockerBridge()
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    def slow_stop(container_id, action):
+        time.sleep(0.2)
+        return True, f"Container {container_id} stopped."
+
+    with patch('async_bridge.docker.control_container', side_effect=slow_stop):
+        result, _ = await asyncio.gather(bridge.control_container('abc', 'stop'), ticker())
+
+    assert result == (True, "Container abc stopped.")
+    assert len(ticks) == 5
+    bridge.shutdown()
+
+@pytest.mark.asyncio
+async def test_timeout_is_reported_as_failure():
+    """Test that an operation exceeding its timeout returns (False, message)."""
+    bridge = AsyncDockerBridge(timeouts={"logs": 0.05})
+    release = threading.Event()
+
+    def hung_logs(container_id, tail):
+        release.wait(2)
+        return True, "late"
+
+    with patch('async_bridge.docker.get_container_logs', side_effect=hung_logs):
+        success, message = await bridge.get_container_logs('abc')
+
+    release.set()
+    assert success is False
+    assert "timed out" in message
+    bridge.shutdown()
+
+@pytest.mark.asyncio
+async def test_heavy_operations_respect_concurrency_limit():
+    """Test that no more than `heavy_limit` create calls run at once."""
+    bridge = AsyncDockerBridge(max_workers=8, heavy_limit=2)
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+
+    def create(name):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(0.05)
+        with lock:
+            state["running"] -= 1
+        return True, name
+
+    results = await asyncio.gather(*(bridge.call("create", create, f"echo-{i}") for i in range(6)))
+
+    assert [r[1] for r in results] == [f"echo-{i}" for i in range(6)]
+    assert state["peak"] == 2
+    bridge.shutdown()
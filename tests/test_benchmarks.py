@@ -0,0 +1,38 @@
+import sys
+import os
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.fake_docker import FakeDockerDaemon
+from benchmarks.bench_sync import run_size, compare
+
+def test_fake_daemon_churn():
+    """Test that churn changes, adds and removes the requested share of containers."""
+    daemon = FakeDockerDaemon(1000, seed=1)
+    counts = daemon.churn(status_changes=0.05, additions=0.01, removals=0.02)
+    assert counts == {'changed': 50, 'added': 10, 'removed': 20}
+    assert len(daemon.get_all_containers()) == 990
+
+def test_run_size_reports_sync_metrics():
+    """Test a tiny benchmark run end to end against a temporary database."""
+    entry = run_size(50, cycles=2, churn=0.1)
+    assert entry['agents_read'] >= 50
+    assert entry['initial_rows_written'] == 50
+    assert entry['idle_rows_written'] == 0
+    assert entry['churn_rows_written_avg'] > 0
+    assert 0 < entry['delta_bytes'] < entry['snapshot_bytes']
+
+def test_compare_flags_regressions():
+    """Test that metrics slower than the threshold are reported."""
+    baseline = {'results': [{'size': 100, 'initial_sync_s': 1.0, 'snapshot_bytes': 100}]}
+    current = {'results': [{'size': 100, 'initial_sync_s': 1.5, 'snapshot_bytes': 100}]}
+    assert compare(current, baseline, threshold=1.2) == [(100, 'initial_sync_s', 1.0, 1.5)]
+
+def test_task_benchmark_drains_the_queue():
+    """Test a tiny task queue benchmark run end to end against a temporary database."""
+    from benchmarks.bench_tasks import run_size as run_tasks
+    entry = run_tasks(120, agents=25)
+    assert entry['tasks_done'] == 120
+    assert entry['dispatch_rounds'] == 5
+    assert entry['end_to_end_tasks_per_s'] > 0
@@ -0,0 +1,116 @@
+import pytest
+import asyncio
+import sys
+import os
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cluster import ClusterNode, LeaderLock
+
+async def _until(predicate, timeout=2):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+def test_leader_lock_is_exclusive(tmp_path):
+    """Test that only one holder gets the lock and that releasing it lets another take over."""
+    first = LeaderLock(str(tmp_path / 'leader.lock'))
+    second = LeaderLock(str(tmp_path / 'leader.lock'))
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    first.release()
+    assert second.try_acquire()
+    second.release()
+
+@pytest.mark.asyncio
+async def test_follower_receives_changes_and_takes_over(tmp_path):
+    """Test change feed delivery to a follower and its promotion when the leader leaves."""
+    promoted, received, connects = [], [], []
+
+    def node(name):
+        async def on_promote():
+            promoted.append(name)
+        return ClusterNode(str(tmp_path), on_promote=on_promote, on_message=received.append, poll_interval=0.05,
+                           on_connect=lambda: connects.append(name))
+
+    leader, follower = node('leader'), node('follower')
+    await leader.run()
+    follower_task = asyncio.create_task(follower.run())
+    await _until(lambda: leader.server.follower_count == 1)
+
+    leader.publish('change_set', {'added': ['a']})
+    follower.publish('change_set', {'added': ['ignored']})
+    await _until(lambda: received)
+    assert received == [{'kind': 'change_set', 'payload': {'added': ['a']}}]
+    assert promoted == ['leader']
+    # Followers are told when they (re)connect, so they can catch up on anything missed.
+    assert connects == ['follower']
+
+    await leader.close()
+    await asyncio.wait_for(follower_task, 2)
+    assert follower.is_leader
+    assert promoted == ['leader', 'follower']
+    await follower.close()
+
+@pytest.mark.asyncio
+async def test_follower_calls_run_in_the_leader(tmp_path):
+    """Test that a follower's call runs in the leader, streams progress back and surfaces errors."""
+    calls = []
+
+    async def on_call(op, args, progress):
+        calls.append((os.getpid(), op))
+        if op == 'fail':
+            raise ValueError('no such container')
+        progress({'done': 1})
+        return {'echo': args['value']}
+
+    async def on_promote():
+        pass
+
+    leader = ClusterNode(str(tmp_path), on_promote=on_promote, on_message=lambda m: None, poll_interval=0.05, on_call=on_call)
+    follower = ClusterNode(str(tmp_path), on_promote=on_promote, on_message=lambda m: None, poll_interval=0.05, on_call=on_call)
+    await leader.run()
+    follower_task = asyncio.create_task(follower.run())
+    await _until(lambda: leader.server.follower_count == 1 and follower._follower.connected)
+
+    progress = []
+    assert await follower.call('echo', {'value': 7}, progress.append) == {'echo': 7}
+    assert progress == [{'done': 1}]
+    with pytest.raises(RuntimeError, match='no such container'):
+        await follower.call('fail', {})
+    # The leader runs its own calls directly.
+    assert await leader.call('echo', {'value': 1}) == {'echo': 1}
+    assert [op for _, op in calls] == ['echo', 'fail', 'echo']
+
+    await leader.close()
+    await asyncio.wait_for(follower_task, 2)
+    await follower.close()
+
+@pytest.mark.asyncio
+async def test_messages_and_calls_larger_than_the_stream_default(tmp_path):
+    """Test that change sets and calls over asyncio's 64 KiB line limit still get through."""
+    received = []
+    zone_keys = {f'agent-{i:05d}': 'DOCKER_CORE' for i in range(5000)}
+
+    async def on_call(op, args, progress):
+        return {'stopped': len(args['agent_ids'])}
+
+    async def on_promote():
+        pass
+
+    leader = ClusterNode(str(tmp_path), on_promote=on_promote, on_message=received.append, poll_interval=0.05, on_call=on_call)
+    follower = ClusterNode(str(tmp_path), on_promote=on_promote, on_message=received.append, poll_interval=0.05, on_call=on_call)
+    await leader.run()
+    follower_task = asyncio.create_task(follower.run())
+    await _until(lambda: leader.server.follower_count == 1 and follower._follower.connected)
+
+    leader.publish('change_set', {'zone_keys': zone_keys})
+    await _until(lambda: received)
+    assert received[0]['payload']['zone_keys'] == zone_keys
+    assert await follower.call('retire_batch', {'agent_ids': list(zone_keys)}) == {'stopped': 5000}
+
+    await leader.close()
+    await asyncio.wait_for(follower_task, 2)
+    await follower.close()
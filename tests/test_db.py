@@ -3,7 +3,9 @@ import sqlite3
 import sys
 import os
 import json
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
 
 # Add project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -65,3 +67,274 @@ def test_deactivate_agent(db_connection):
     inactive_agents = db.get_memory_garden_agents()
     assert len(inactive_agents) == 1
     assert inactive_agents[0]['id'] == 'test_agent_2'
+
+def _container(container_id, name, status, zone_label=None):
+    container = MagicMock()
+    container.id = container_id
+    container.name = name
+    container.status = status
+    container.labels = {'echosim.zone': zone_label} if zone_label else {}
+    return container
+
+def test_sync_containers_with_db_returns_change_set(db_connection):
+    """Test that a bulk sync adds, updates, skips and deactivates in one pass."""
+    db.sync_containers_with_db(None, [
+        _container('a', 'alpha', 'running'),
+        _container('b', 'beta', 'running'),
+        _container('c', 'gamma', 'running'),
+    ])
+
+    change_set = db.sync_containers_with_db(None, [
+        _container('a', 'alpha', 'running'),
+        _container('b', 'beta', 'exited'),
+        _container('d', 'delta', 'created'),
+    ])
+
+    assert change_set['added'] == ['d']
+    assert change_set['updated'] == ['b']
+    assert change_set['deactivated'] == ['c']
+    assert change_set['unchanged'] == 1
+
+    agents = {agent['id']: agent for agent in db.get_all_agents(active_only=False)}
+    assert agents['b']['status'] == 'exited'
+    assert not agents['c']['is_active']
+    assert agents['d']['is_active']
+
+def test_sync_containers_with_db_skips_unchanged_rows(db_connection):
+    """Test that rows whose name, status and zone are unchanged are not rewritten."""
+    db.sync_containers_with_db(None, [_container('a', 'alpha', 'running')])
+    before = db.get_all_agents()[0]['updated_at']
+
+    change_set = db.sync_containers_with_db(None, [_container('a', 'alpha', 'running')])
+
+    assert change_set == {'added': [], 'updated': [], 'deactivated': [], 'unchanged': 1, 'transitions': [], 'zone_keys': {}}
+    assert db.get_all_agents()[0]['updated_at'] == before
+
+def test_sync_containers_with_db_no_containers(db_connection):
+    """Test that an empty container list deactivates every active agent."""
+    db.sync_containers_with_db(None, [_container('a', 'alpha', 'running')])
+
+    change_set = db.sync_containers_with_db(None, [])
+
+    assert change_set['deactivated'] == ['a']
+    assert db.get_all_agents(active_only=True) == []
+
+def test_connection_pool_reuses_connection_per_thread(tmp_path):
+    """Test that the pool hands each thread one reused, WAL-mode connection."""
+    pool = db.ConnectionPool(database=str(tmp_path / 'pool.db'))
+    try:
+        conn = pool.connection()
+        assert pool.connection() is conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(pool.connection()))
+        thread.start()
+        thread.join()
+        assert other[0] is not conn
+    finally:
+        pool.close_all()
+
+def test_connection_pool_reader_not_blocked_by_writer(tmp_path):
+    """Test that a reader on another thread sees committed data while a write transaction is open."""
+    pool = db.ConnectionPool(database=str(tmp_path / 'wal.db'))
+    try:
+        writer = pool.connection()
+        writer.execute("CREATE TABLE t (v INTEGER)")
+        writer.execute("INSERT INTO t VALUES (1)")
+        writer.commit()
+        writer.execute("INSERT INTO t VALUES (2)")  # Leaves a write transaction open
+
+        rows = []
+        thread = threading.Thread(target=lambda: rows.extend(pool.connection().execute("SELECT v FROM t").fetchall()))
+        thread.start()
+        thread.join(timeout=2)
+        assert [row[0] for row in rows] == [1]
+        writer.rollback()
+    finally:
+        pool.close_all()
+
+def test_connection_pool_reopens_closed_connection(tmp_path):
+    """Test that a connection closed by a caller is replaced transparently."""
+    pool = db.ConnectionPool(database=str(tmp_path / 'reopen.db'))
+    try:
+        conn = pool.connection()
+        conn.close()
+        assert pool.connection() is not conn
+    finally:
+        pool.close_all()
+
+def test_connection_pool_closes_connections_of_exited_threads(tmp_path):
+    """Test that a short-lived thread's connection is closed once a new connection is opened."""
+    pool = db.ConnectionPool(database=str(tmp_path / 'threads.db'))
+    try:
+        opened = []
+        for _ in range(3):
+            thread = threading.Thread(target=lambda: opened.append(pool.connection()))
+            thread.start()
+            thread.join()
+        pool.connection()
+
+        assert len(pool._connections) == 1
+        with pytest.raises(sqlite3.ProgrammingError):
+            opened[0].execute("SELECT 1")
+    finally:
+        pool.close_all()
+
+def test_sync_records_only_real_transitions(db_connection):
+    """Test that sync appends agent_events only when status or zone changes."""
+    db.sync_containers_with_db(None, [_container('a', 'alpha', 'running')])
+    db.sync_containers_with_db(None, [_container('a', 'alpha', 'running')])
+    db.sync_containers_with_db(None, [_container('a', 'alpha-renamed', 'running')])
+    db.sync_containers_with_db(None, [_container('a', 'alpha-renamed', 'exited')])
+    db.sync_containers_with_db(None, [_container('a', 'alpha-renamed', 'running'), _container('b', 'beta', 'running')])
+    db.sync_containers_with_db(None, [_container('b', 'beta', 'running')])
+
+    events = db.get_agent_events('a')
+    assert [(e['kind'], e['from_status'], e['to_status']) for e in events] == [
+        ('added', None, 'running'),
+        ('changed', 'running', 'exited'),
+        ('changed', 'exited', 'running'),
+        ('deactivated', 'running', 'running'),
+    ]
+    assert db.count_agent_events('a', kind='changed', to_status='running') == 1
+    assert db.get_agent_event_counts() == [('a', 4), ('b', 1)]
+
+def test_agent_events_range_query(db_connection):
+    """Test that event queries honour the time range."""
+    db.sync_containers_with_db(None, [_container('a', 'alpha', 'running')])
+    now = datetime.utcnow()
+    assert len(db.get_agent_events('a', start=now - timedelta(minutes=1))) == 1
+    assert db.get_agent_events('a', end=now - timedelta(minutes=1)) == []
+
+def test_compact_agent_events_rolls_up_into_hourly_summaries(db_connection):
+    """Test that compaction removes old raw events but keeps their counts."""
+    db.sync_containers_with_db(None, [_container('a', 'alpha', 'running')])
+    db.sync_containers_with_db(None, [_container('a', 'alpha', 'exited')])
+    db.sync_containers_with_db(None, [_container('a', 'alpha', 'running')])
+
+    compacted = db.compact_agent_events(retention_days=1, now=datetime.utcnow() + timedelta(days=2))
+
+    assert compacted == 3
+    assert db.get_agent_events('a') == []
+    assert db.count_agent_events('a') == 3
+    assert db.count_agent_events('a', kind='changed', to_status='running') == 1
+
+    # Compacting again into the same hour adds to the existing summary.
+    db.sync_containers_with_db(None, [_container('a', 'alpha', 'exited')])
+    db.compact_agent_events(retention_days=1, now=datetime.utcnow() + timedelta(days=2))
+    assert db.count_agent_events('a') == 4
+
+def test_memory_garden_keyset_pagination(db_connection):
+    """Test that garden pages walk every retired agent once, newest first."""
+    for i in range(5):
+        db.add_or_update_agent({'id': f'agent_{i}', 'name': f'Agent {i}'})
+        db.deactivate_agent(f'agent_{i}')
+    db.add_or_update_agent({'id': 'alive', 'name': 'Still Active'})
+
+    seen = []
+    page, cursor = db.get_memory_garden_page(limit=2)
+    seen.extend(agent['id'] for agent in page)
+    while cursor:
+        page, cursor = db.get_memory_garden_page(limit=2, cursor=cursor)
+        seen.extend(agent['id'] for agent in page)
+
+    assert seen == [agent['id'] for agent in db.get_memory_garden_agents()]
+    assert sorted(seen) == [f'agent_{i}' for i in range(5)]
+
+def test_memory_garden_page_rejects_bad_cursor(db_connection):
+    """Test that a malformed cursor raises ValueError."""
+    with pytest.raises(ValueError):
+        db.get_memory_garden_page(cursor='not-a-cursor')
+
+def test_sync_stores_zone_key_and_reports_zone_changes(db_connection):
+    """Test that sync assigns zone keys from labels and status and reports them in the change set."""
+    change_set = db.sync_containers_with_db(None, [
+        _container('a', 'alpha', 'running'),
+        _container('b', 'beta', 'running', zone_label='{"name": "Docker Core"}'),
+    ])
+    assert change_set['zone_keys'] == {'a': 'ECHO_PLAZA', 'b': 'DOCKER_CORE'}
+
+    change_set = db.sync_containers_with_db(None, [
+        _container('a', 'alpha', 'exited'),
+        _container('b', 'beta', 'running', zone_label='{"name": "Docker Core"}'),
+    ])
+    assert change_set['zone_keys'] == {'a': 'OMEGA_GATE'}
+    assert [agent['id'] for agent in db.get_zone_agents('OMEGA_GATE')] == ['a']
+    assert sorted(db.get_active_zone_assignments()) == [('a', 'OMEGA_GATE'), ('b', 'DOCKER_CORE')]
+
+def test_init_db_adds_and_backfills_zone_key(tmp_path):
+    """Test the migration of a database created before the zone_key column."""
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE agents (id TEXT PRIMARY KEY, name TEXT NOT NULL, status TEXT, mood TEXT, zone TEXT,
+                    created_at TIMESTAMP, updated_at TIMESTAMP, is_active BOOLEAN DEFAULT TRUE, thought_log TEXT)""")
+    conn.execute("INSERT INTO agents (id, name, status, zone) VALUES ('a', 'alpha', 'paused', '{}')")
+    conn.execute("""INSERT INTO agents (id, name, status, zone) VALUES ('b', 'beta', 'running', '{"name": "Alpha Hall"}')""")
+    conn.commit()
+    conn.close()
+
+    with patch.object(db, 'DATABASE_FILE', path):
+        db.init_db()
+        rows = {row['id']: row['zone_key'] for row in db.get_db_connection().execute("SELECT id, zone_key FROM agents")}
+        db.get_db_connection().close()
+    assert rows == {'a': 'DOCKER_CORE', 'b': 'ALPHA_HALL'}
+
+def test_append_thoughts_numbers_each_agent_and_sets_count(db_connection):
+    """Test that a batch is numbered per agent and the agent row carries only the latest seq."""
+    db.add_or_update_agent({'id': 'a', 'name': 'alpha', 'status': 'running'})
+    records = db.append_thoughts([('a', 'one'), ('b', {'idea': 2}), ('a', 'three')])
+    assert [(r['agent_id'], r['seq']) for r in records] == [('a', 1), ('b', 1), ('a', 2)]
+    db.append_thoughts([('a', 'four')])
+
+    agent = db.get_all_agents()[0]
+    assert agent['thought_count'] == 3
+    assert 'thought_log' not in agent
+    assert [t['content'] for t in db.get_thoughts('a')] == ['one', 'three', 'four']
+    assert db.get_thoughts('b')[0]['content'] == {'idea': 2}
+
+def test_add_or_update_agent_seeds_thoughts_only_on_insert(db_connection):
+    """Test that a thought_log seeds a new agent and is not appended again on every update."""
+    agent = {'id': 'a', 'name': 'alpha', 'status': 'running', 'thought_log': ['born']}
+    db.add_or_update_agent(agent)
+    db.add_or_update_agent(dict(agent, status='exited'))
+
+    assert [t['content'] for t in db.get_thoughts('a')] == ['born']
+    assert db.get_all_agents(active_only=False)[0]['thought_count'] == 1
+
+def test_get_thoughts_is_bounded_in_both_directions(db_connection):
+    """Test latest-N, paging backwards with before_seq, and catching up with after_seq."""
+    db.append_thoughts([('a', i) for i in range(1, 11)])
+    assert [t['seq'] for t in db.get_thoughts('a', limit=3)] == [8, 9, 10]
+    assert [t['seq'] for t in db.get_thoughts('a', limit=3, before_seq=8)] == [5, 6, 7]
+    assert [t['seq'] for t in db.get_thoughts('a', limit=3, after_seq=2)] == [3, 4, 5]
+    assert db.get_thoughts('a', after_seq=10) == []
+
+def test_init_db_moves_thought_log_blobs(tmp_path):
+    """Test the migration of thought_log JSON blobs into the append-only table."""
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE agents (id TEXT PRIMARY KEY, name TEXT NOT NULL, status TEXT, mood TEXT, zone TEXT,
+                    created_at TIMESTAMP, updated_at TIMESTAMP, is_active BOOLEAN DEFAULT TRUE, thought_log TEXT)""")
+    conn.execute("""INSERT INTO agents (id, name, status, thought_log) VALUES ('a', 'alpha', 'running', '["hm", "aha"]')""")
+    conn.commit()
+    conn.close()
+
+    with patch.object(db, 'DATABASE_FILE', path):
+        db.init_db()
+        thoughts = db.get_thoughts('a')
+        row = db.get_db_connection().execute("SELECT thought_log, thought_count FROM agents").fetchone()
+        db.get_db_connection().close()
+    assert [(t['seq'], t['content']) for t in thoughts] == [(1, 'hm'), (2, 'aha')]
+    assert (row['thought_log'], row['thought_count']) == (None, 2)
+
+def test_deactivate_agents_in_one_change_set(db_connection):
+    """Test that bulk deactivation only reports agents that were still active."""
+    db.sync_containers_with_db(None, [_container(i, i, 'running') for i in ('a', 'b', 'c')])
+    db.deactivate_agent('c')
+
+    change_set = db.deactivate_agents(['a', 'c', 'missing', 'a'])
+
+    assert change_set['deactivated'] == ['a']
+    assert [t['kind'] for t in change_set['transitions']] == ['deactivated']
+    assert [agent['id'] for agent in db.get_all_agents()] == ['b']
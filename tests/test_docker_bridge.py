@@ -38,3 +38,93 @@ def test_get_all_containers_docker_error():
     """Test that an empty list is returned when the Docker client is not available."""
     containers = docker_bridge.get_all_containers()
     assert containers == []
+
+def test_list_containers_makes_one_filtered_call():
+    """Test that the lean listing uses a single label-filtered API call and compact records."""
+    mock_client = MagicMock()
+    mock_client.api.containers.return_value = [
+        {'Id': 'abc123', 'Names': ['/echo-1'], 'State': 'running', 'Labels': {'source': 'echosim'}},
+        {'Id': 'def456', 'Names': ['/echo-2'], 'State': 'exited', 'Labels': None},
+    ]
+    with patch('docker_bridge.get_docker_client', return_value=mock_client):
+        containers = docker_bridge.list_containers(['source=echosim'])
+
+    mock_client.api.containers.assert_called_once_with(all=True, filters={'label': ['source=echosim']})
+    mock_client.containers.list.assert_not_called()
+    assert [(c.id, c.name, c.status, c.labels) for c in containers] == [
+        ('abc123', 'echo-1', 'running', {'source': 'echosim'}),
+        ('def456', 'echo-2', 'exited', {}),
+    ]
+    mock_client.api.inspect_container.assert_not_called()
+
+def test_container_summary_inspects_lazily():
+    """Test that full inspect data is only fetched when read, and only once."""
+    mock_client = MagicMock()
+    mock_client.api.inspect_container.return_value = {'Id': 'abc123', 'Config': {}}
+    summary = docker_bridge.ContainerSummary({'Id': 'abc123', 'Names': ['/echo-1'], 'State': 'running'})
+    with patch('docker_bridge.get_docker_client', return_value=mock_client):
+        assert summary.attrs['Config'] == {}
+        assert summary.attrs['Id'] == 'abc123'
+    mock_client.api.inspect_container.assert_called_once_with('abc123')
+
+def test_list_containers_raises_instead_of_returning_nothing():
+    """Test that an API error is raised rather than reported as an empty fleet."""
+    mock_client = MagicMock()
+    mock_client.api.containers.side_effect = docker.errors.APIError('daemon busy')
+    with patch('docker_bridge.get_docker_client', return_value=mock_client):
+        with pytest.raises(docker.errors.APIError):
+            docker_bridge.list_containers([])
+    mock_client.api.containers.assert_called_once_with(all=True, filters=None)
+
+def test_commands_are_routed_to_the_owning_host():
+    """Test that host-qualified agent IDs reach the right daemon with the bare container ID."""
+    clients = {'edge1': MagicMock(), 'edge2': MagicMock()}
+    with patch.dict('docker_bridge.DOCKER_HOSTS', {'edge1': 'tcp://a:2375', 'edge2': 'tcp://b:2375'}), \
+            patch('docker_bridge.get_host_client', side_effect=clients.get):
+        assert docker_bridge.split_agent_id('edge2:abc') == ('edge2', 'abc')
+        assert docker_bridge.split_agent_id('abc') == (None, 'abc')
+        success, _ = docker_bridge.control_container('edge2:abc', 'stop')
+
+        clients['edge2'].api.containers.return_value = [{'Id': 'abc', 'Names': ['/echo'], 'State': 'running'}]
+        listed = docker_bridge.list_containers([], host='edge2')
+
+    assert success
+    clients['edge2'].containers.get.assert_called_once_with('abc')
+    clients['edge1'].containers.get.assert_not_called()
+    assert [(c.id, c.host) for c in listed] == [('edge2:abc', 'edge2')]
+
+def test_parse_hosts_rejects_bad_entries():
+    """Test DOCKER_HOSTS parsing."""
+    assert docker_bridge._parse_hosts('a=tcp://x:1, b=unix:///s') == {'a': 'tcp://x:1', 'b': 'unix:///s'}
+    with pytest.raises(ValueError):
+        docker_bridge._parse_hosts('a:1=tcp://x')
+    with pytest.raises(ValueError):
+        docker_bridge._parse_hosts('tcp://x')
+
+def test_stop_container_kills_after_a_failed_stop():
+    """Test the stop timeout is passed through and a failed stop falls back to kill."""
+    mock_client = MagicMock()
+    container = mock_client.containers.get.return_value
+    container.labels = {'source': 'echosim'}
+    container.stop.side_effect = docker.errors.APIError('timed out')
+    with patch('docker_bridge.get_docker_client', return_value=mock_client):
+        assert docker_bridge.stop_container('abc', timeout=3, kill=False)[0] is False
+        success, message = docker_bridge.stop_container('abc', timeout=3, kill=True)
+        mock_client.containers.get.side_effect = docker.errors.NotFound('gone')
+        assert docker_bridge.stop_container('abc')[0] is True
+
+    assert success and 'killed' in message
+    container.stop.assert_called_with(timeout=3)
+    container.kill.assert_called_once()
+
+def test_stop_container_leaves_unlabelled_containers_running():
+    """Test that stop_container refuses a container without the agent labels, e.g. one matched by an ID prefix."""
+    mock_client = MagicMock()
+    container = mock_client.containers.get.return_value
+    container.labels = {'com.example.service': 'db'}
+    with patch('docker_bridge.get_docker_client', return_value=mock_client):
+        success, message = docker_bridge.stop_container('a')
+
+    assert not success and 'not an agent container' in message
+    container.stop.assert_not_called()
+    container.kill.assert_not_called()
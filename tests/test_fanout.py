@@ -0,0 +1,123 @@
+import pytest
+import asyncio
+import sys
+import os
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fanout import ClientChannel
+
+class FakeWebSocket:
+    """Records sent messages; `gate` lets a test stall the client."""
+    def __init__(self, name):
+        self.client = name
+        self.sent = []
+        self.closed_with = None
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def send_text(self, message):
+        await self.gate.wait()
+        self.sent.append(message)
+
+    async def send_bytes(self, message):
+        await self.send_text(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_delay_fast_client():
+    """Test that a stalled client does not hold up delivery to the others."""
+    fast, slow = FakeWebSocket('fast'), FakeWebSocket('slow')
+    slow.gate.clear()
+    channels = [ClientChannel(fast), ClientChannel(slow)]
+    for channel in channels:
+        channel.start()
+
+    for channel in channels:
+        channel.offer('hello')
+    await asyncio.sleep(0.01)
+
+    assert fast.sent == ['hello']
+    assert slow.sent == []
+    assert channels[1].stats()['queued'] == 0  # Taken by the writer, waiting on the socket
+
+    slow.gate.set()
+    await asyncio.sleep(0.01)
+    assert slow.sent == ['hello']
+    for channel in channels:
+        await channel.close()
+
+@pytest.mark.asyncio
+async def test_coalesce_policy_keeps_latest_state():
+    """Test that queued state messages are replaced by newer ones for a lagging client."""
+    websocket = FakeWebSocket('lagging')
+    websocket.gate.clear()
+    channel = ClientChannel(websocket, policy='coalesce')
+    channel.start()
+
+    channel.offer('state-1', coalesce_key='state')
+    await asyncio.sleep(0)  # The writer picks up state-1 and blocks on the socket
+    channel.offer('state-2', coalesce_key='state')
+    channel.offer('receipt')
+    channel.offer('state-3', coalesce_key='state')
+
+    websocket.gate.set()
+    await asyncio.sleep(0.01)
+    assert websocket.sent == ['state-1', 'state-3', 'receipt']
+    assert channel.coalesced == 1
+    await channel.close()
+
+@pytest.mark.asyncio
+async def test_drop_policy_discards_when_queue_full():
+    """Test that the drop policy rejects new messages once the queue is full."""
+    websocket = FakeWebSocket('lagging')
+    websocket.gate.clear()
+    channel = ClientChannel(websocket, max_queue=2, policy='drop')
+    channel.start()
+    channel.offer('m0')
+    await asyncio.sleep(0)
+
+    assert channel.offer('m1')
+    assert channel.offer('m2')
+    assert not channel.offer('m3')
+    assert channel.dropped == 1
+    assert channel.lag() >= 0
+    await channel.close()
+
+@pytest.mark.asyncio
+async def test_disconnect_policy_closes_slow_client():
+    """Test that the disconnect policy closes a client whose queue overflows."""
+    websocket = FakeWebSocket('lagging')
+    websocket.gate.clear()
+    closed = []
+    channel = ClientChannel(websocket, max_queue=1, policy='disconnect', on_close=closed.append)
+    channel.start()
+    channel.offer('m0')
+    await asyncio.sleep(0)
+    channel.offer('m1')
+
+    assert not channel.offer('m2')
+    await asyncio.sleep(0.01)
+    assert websocket.closed_with == 1013
+    assert closed == [channel]
+
+@pytest.mark.asyncio
+async def test_send_error_closes_channel():
+    """Test that a failed send cleans the client up instead of raising into the broadcaster."""
+    websocket = FakeWebSocket('broken')
+    async def broken_send(message):
+        raise RuntimeError('connection reset')
+    websocket.send_text = broken_send
+    closed = []
+    channel = ClientChannel(websocket, on_close=closed.append)
+    channel.start()
+
+    channel.offer('hello')
+    await asyncio.sleep(0.01)
+
+    assert channel.closed
+    assert closed == [channel]
+    assert not channel.offer('again')
@@ -0,0 +1,85 @@
+import threading
+import time
+import sys
+import os
+from unittest.mock import MagicMock
+
+import docker
+import pytest
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from image_cache import ImageCache, normalize_image
+
+class FakeImages:
+    """Counts calls the way the cache uses `client.images`."""
+    def __init__(self, local=()):
+        self.local = set(local)
+        self.pulls = []
+        self.gets = 0
+
+    def list(self):
+        images = []
+        for tag in self.local:
+            image = MagicMock()
+            image.id = f'sha256:{tag}'
+            image.tags = [tag]
+            image.attrs = {}
+            images.append(image)
+        return images
+
+    def get(self, name):
+        self.gets += 1
+        if normalize_image(name) not in self.local:
+            raise docker.errors.ImageNotFound(name)
+
+    def pull(self, name):
+        time.sleep(0.05)
+        self.pulls.append(name)
+        self.local.add(normalize_image(name))
+
+def _cache(images):
+    client = MagicMock()
+    client.images = images
+    return ImageCache(lambda: client)
+
+def test_normalize_image():
+    """Test that untagged references default to ':latest' without touching registry ports."""
+    assert normalize_image('alpine') == 'alpine:latest'
+    assert normalize_image('alpine:3.19') == 'alpine:3.19'
+    assert normalize_image('localhost:5000/echo') == 'localhost:5000/echo:latest'
+    assert normalize_image('echo@sha256:abc') == 'echo@sha256:abc'
+
+def test_known_image_needs_no_docker_call():
+    """Test that an image seen by the refresh is served from memory."""
+    images = FakeImages(local=['hello-world:latest'])
+    cache = _cache(images)
+    cache.refresh()
+    cache.ensure('hello-world')
+    assert images.gets == 0
+    assert images.pulls == []
+
+def test_concurrent_ensures_share_one_pull():
+    """Test that simultaneous creates of a missing image pull it only once."""
+    images = FakeImages()
+    cache = _cache(images)
+    threads = [threading.Thread(target=cache.ensure, args=('alpine',)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert images.pulls == ['alpine']
+    assert cache.is_present('alpine:latest')
+
+def test_failed_pull_is_reported_and_retried():
+    """Test that a failed pull raises to the caller and does not poison later attempts."""
+    images = FakeImages()
+    images.pull = MagicMock(side_effect=docker.errors.APIError('registry down'))
+    cache = _cache(images)
+    with pytest.raises(docker.errors.APIError):
+        cache.ensure('alpine')
+    assert not cache.is_present('alpine')
+    with pytest.raises(docker.errors.APIError):
+        cache.ensure('alpine')
+    assert images.pull.call_count == 2
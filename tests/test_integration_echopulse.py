@@ -11,10 +11,15 @@ from echopulse import app
 client = TestClient(app)
 
 def test_websocket_connection():
-    """Tests that a client can connect to the WebSocket and receive a message."""
+    """Tests that a client can connect to the WebSocket and receive a full snapshot, and resync after an ack."""
     with client.websocket_connect("/ws") as websocket:
         data = websocket.receive_json()
         assert data["type"] == "full_update"
-        assert "payload" in data
-        assert "active_agents" in data["payload"]
-        assert "memory_garden" in data["payload"]
+        assert isinstance(data["generation"], int)
+        assert isinstance(data["agents"], list)
+
+        websocket.send_json({"action": "ack", "generation": data["generation"]})
+        websocket.send_json({"action": "resync"})
+        again = websocket.receive_json()
+        assert again["type"] == "full_update"
+        assert again["generation"] == data["generation"]
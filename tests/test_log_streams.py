@@ -0,0 +1,147 @@
+import pytest
+import queue
+import threading
+import time
+import sys
+import os
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from log_streams import LogStreamHub, _split_timestamp
+
+class FakeLogStream:
+    """A closable log stream fed by the test through a queue."""
+    def __init__(self):
+        self.chunks = queue.Queue()
+        self.closed = False
+
+    def __iter__(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None or self.closed:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    def close(self):
+        self.closed = True
+        self.chunks.put(None)
+
+class FakeOpener:
+    def __init__(self):
+        self.calls = []
+        self.streams = []
+        self.opened = threading.Event()
+
+    def __call__(self, container_id, since=None, tail='all'):
+        stream = FakeLogStream()
+        self.calls.append((container_id, since, tail))
+        self.streams.append(stream)
+        self.opened.set()
+        return stream
+
+def _wait_for(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.005)
+    return False
+
+def test_split_timestamp():
+    """Test parsing of Docker's timestamped log lines."""
+    stamp, text = _split_timestamp('2024-01-01T00:00:01.500000000Z hello world')
+    assert text == 'hello world'
+    assert stamp == 1704067201_500000000
+    # Stamps a nanosecond apart stay distinct, unlike float seconds.
+    assert _split_timestamp('2024-01-01T00:00:01.500000001Z x')[0] == stamp + 1
+    assert _split_timestamp('no timestamp here') == (None, 'no timestamp here')
+
+def test_viewers_share_one_upstream_and_late_joiners_get_history():
+    """Test that two viewers of one container share a stream and the second gets buffered lines."""
+    opener = FakeOpener()
+    hub = LogStreamHub(history_lines=2, opener=opener, reconnect_delay=0)
+    first = []
+    assert hub.follow('c1', 'viewer-1', lambda cid, lines: first.extend(lines)) == []
+    assert opener.opened.wait(1)
+
+    opener.streams[0].chunks.put(b'2024-01-01T00:00:01Z one\n2024-01-01T00:00:02Z tw')
+    opener.streams[0].chunks.put(b'o\n2024-01-01T00:00:03Z three\n')
+    assert _wait_for(lambda: len(first) == 3)
+    assert first == ['one', 'two', 'three']
+
+    second = []
+    history = hub.follow('c1', 'viewer-2', lambda cid, lines: second.extend(lines))
+    assert history == ['two', 'three']
+    assert len(opener.calls) == 1
+
+    opener.streams[0].chunks.put(b'2024-01-01T00:00:04Z four\n')
+    assert _wait_for(lambda: second == ['four'])
+    assert first[-1] == 'four'
+
+    hub.unfollow('c1', 'viewer-1')
+    assert not opener.streams[0].closed
+    hub.unfollow('c1', 'viewer-2')
+    assert opener.streams[0].closed
+    assert hub.followed_containers() == []
+
+def test_reconnect_resumes_from_cursor_without_duplicates():
+    """Test that a dropped stream reopens with `since` and skips lines already delivered."""
+    opener = FakeOpener()
+    hub = LogStreamHub(opener=opener, reconnect_delay=0)
+    received = []
+    hub.follow('c1', 'viewer', lambda cid, lines: received.extend(lines))
+    assert opener.opened.wait(1)
+
+    opener.streams[0].chunks.put(b'2024-01-01T00:00:01Z one\n')
+    assert _wait_for(lambda: received == ['one'])
+    opener.streams[0].chunks.put(ConnectionError('daemon restarted'))
+
+    assert _wait_for(lambda: len(opener.streams) == 2)
+    assert opener.calls[1][1] == pytest.approx(1704067201.0)
+    opener.streams[1].chunks.put(b'2024-01-01T00:00:01Z one\n2024-01-01T00:00:02Z two\n')
+    assert _wait_for(lambda: received == ['one', 'two'])
+
+    hub.unfollow_all('viewer')
+    assert hub.followed_containers() == []
+
+def test_lines_sharing_a_timestamp_survive_a_reconnect():
+    """Test that a reconnect skips only the repeated lines, even when distinct lines share a stamp."""
+    opener = FakeOpener()
+    hub = LogStreamHub(opener=opener, reconnect_delay=0)
+    received = []
+    hub.follow('c1', 'viewer', lambda cid, lines: received.extend(lines))
+    assert opener.opened.wait(1)
+
+    opener.streams[0].chunks.put(b'2024-01-01T00:00:01.000000001Z a\n2024-01-01T00:00:01.000000001Z b\n')
+    assert _wait_for(lambda: received == ['a', 'b'])
+    opener.streams[0].chunks.put(ConnectionError('daemon restarted'))
+
+    assert _wait_for(lambda: len(opener.streams) == 2)
+    opener.streams[1].chunks.put(b'2024-01-01T00:00:01.000000001Z a\n2024-01-01T00:00:01.000000001Z b\n'
+                                 b'2024-01-01T00:00:01.000000001Z c\n2024-01-01T00:00:01.000000002Z d\n')
+    assert _wait_for(lambda: received == ['a', 'b', 'c', 'd'])
+    hub.unfollow_all('viewer')
+
+def test_unfollow_while_opening_closes_the_new_stream():
+    """Test that a stream opened after its last viewer left is closed instead of read forever."""
+    opening, release = threading.Event(), threading.Event()
+    opener = FakeOpener()
+
+    def slow_opener(container_id, since=None, tail='all'):
+        opening.set()
+        release.wait(2)
+        return opener(container_id, since, tail)
+
+    hub = LogStreamHub(opener=slow_opener, reconnect_delay=0)
+    hub.follow('c1', 'viewer', lambda cid, lines: None)
+    assert opening.wait(1)
+    thread = hub._followed['c1'].thread
+    hub.unfollow('c1', 'viewer')
+    release.set()
+
+    thread.join(2)
+    assert not thread.is_alive()
+    assert opener.streams[0].closed
@@ -0,0 +1,55 @@
+import sys
+import os
+import threading
+import time
+from unittest.mock import patch
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+import memory_garden
+
+def test_retire_agents_stops_concurrently_and_deactivates_once(db_connection):
+    """Test that a bulk retire stops in parallel, reports progress and deactivates in one call."""
+    for agent_id in ('a', 'b', 'c', 'd'):
+        db.add_or_update_agent({'id': agent_id, 'name': agent_id, 'status': 'running'})
+    lock = threading.Lock()
+    state = {'running': 0, 'peak': 0}
+
+    def stop_container(agent_id, timeout, kill):
+        with lock:
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+        time.sleep(0.02)
+        with lock:
+            state['running'] -= 1
+        if agent_id == 'd':
+            return False, 'daemon error'
+        return True, f'stopped after at most {timeout}s'
+
+    progress = []
+    with patch('memory_garden.docker.stop_container', side_effect=stop_container), \
+            patch('memory_garden.db.deactivate_agents', wraps=db.deactivate_agents) as deactivate:
+        results, change_set = memory_garden.retire_agents(['a', 'b', 'c', 'd'], parallelism=2,
+                                                          stop_timeout=1, progress=progress.append)
+
+    assert state['peak'] == 2
+    assert [r['stopped'] for r in results] == [True, True, True, False]
+    assert results[0]['result'] == 'stopped after at most 1s'
+    assert sorted(p['done'] for p in progress) == [1, 2, 3, 4]
+    deactivate.assert_called_once()
+    # Like retire_agent, agents are retired even when their container would not stop.
+    assert change_set['deactivated'] == ['a', 'b', 'c', 'd']
+    assert db.get_all_agents() == []
+
+def test_retire_agents_skips_unknown_ids(db_connection):
+    """Test that IDs without an agent row are reported as failures and never sent to Docker."""
+    db.add_or_update_agent({'id': 'known', 'name': 'known', 'status': 'running'})
+    with patch('memory_garden.docker.stop_container', return_value=(True, 'stopped')) as stop:
+        results, change_set = memory_garden.retire_agents(['known', 'a', 'b'], stop_timeout=1)
+
+    stop.assert_called_once_with('known', 1, True)
+    assert [r['stopped'] for r in results] == [True, False, False]
+    assert results[1]['result'] == 'Unknown agent a.'
+    assert change_set['deactivated'] == ['known']
@@ -0,0 +1,61 @@
+import pytest
+import sys
+import os
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+import metrics
+
+def test_histogram_renders_cumulative_buckets():
+    """Test the Prometheus text format of a labelled histogram."""
+    histogram = metrics.Histogram('test_seconds', 'A test.', ('call',), buckets=(0.1, 1))
+    histogram.observe(0.05, call='list')
+    histogram.observe(0.5, call='list')
+    histogram.observe(5, call='list')
+
+    assert histogram.render().splitlines() == [
+        '# HELP test_seconds A test.',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{call="list",le="0.1"} 1',
+        'test_seconds_bucket{call="list",le="1"} 2',
+        'test_seconds_bucket{call="list",le="+Inf"} 3',
+        'test_seconds_sum{call="list"} 5.55',
+        'test_seconds_count{call="list"} 3',
+    ]
+    with pytest.raises(ValueError):
+        histogram.observe(1, host='x')
+
+def test_timer_works_as_decorator_and_gauge_reads_function():
+    """Test that decorated calls are timed even when they raise, and gauges are read at render time."""
+    histogram = metrics.Histogram('test_call_seconds', 'A test.')
+
+    @histogram.time()
+    def fail():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        fail()
+    with histogram.time():
+        pass
+    assert 'test_call_seconds_count 2' in histogram.render()
+
+    gauge = metrics.Gauge('test_clients', 'A test.')
+    gauge.set_function(lambda: 7)
+    assert gauge.render().endswith('test_clients 7')
+
+    lags = {('10.0.0.1:5000',): 0.5, ('10.0.0.2:5000',): 2}
+    labelled = metrics.Gauge('test_lag_seconds', 'A test.', ('client',))
+    labelled.set_function(lambda: lags)
+    assert labelled.render().splitlines()[2:] == ['test_lag_seconds{client="10.0.0.1:5000"} 0.5',
+                                                  'test_lag_seconds{client="10.0.0.2:5000"} 2']
+    del lags[('10.0.0.1:5000',)]
+    assert 'client="10.0.0.1:5000"' not in labelled.render()
+
+def test_db_transactions_are_timed(db_connection):
+    """Test that sync records a database transaction timing."""
+    before = metrics.DB_SECONDS._series.get((('op', 'sync'),), {}).get('count', 0)
+    db.sync_containers_with_db(None, [])
+    assert metrics.DB_SECONDS._series[(('op', 'sync'),)]['count'] == before + 1
+    assert 'echosim_db_transaction_seconds_count{op="sync"}' in metrics.render()
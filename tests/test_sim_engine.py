@@ -0,0 +1,222 @@
+import pytest
+from unittest.mock import patch, MagicMock
+import threading
+import time
+import sys
+import os
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+from sim_engine import SimEngine
+
+def _container(container_id, status='running'):
+    container = MagicMock()
+    container.id = container_id
+    container.name = f'echo-{container_id}'
+    container.status = status
+    container.labels = {}
+    return container
+
+def _event(action, container_id, time_nano):
+    return {'Type': 'container', 'Action': action, 'id': container_id, 'timeNano': time_nano}
+
+class FakeEventSource:
+    """Replays scripted event batches, one batch per connection, then stops the engine."""
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.since_calls = []
+        self.engine = None
+
+    def __call__(self, since=None):
+        self.since_calls.append(since)
+        if not self.batches:
+            self.engine.is_running = False
+            return iter(())
+        batch = self.batches.pop(0)
+        def stream():
+            for item in batch:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        return stream()
+
+@pytest.fixture
+def engine_factory():
+    with patch('sim_engine.docker.get_docker_client', return_value=MagicMock()):
+        def make(**kwargs):
+            return SimEngine(db_session=None, sync_mode='events', reconnect_delay=0, **kwargs)
+        yield make
+
+def test_container_event_updates_only_affected_agent(engine_factory, db_connection):
+    """Test that a 'die' event refreshes just that container's row."""
+    db.sync_containers_with_db(None, [_container('a'), _container('b')])
+    engine = engine_factory()
+
+    with patch('sim_engine.docker.get_container', return_value=_container('a', 'exited')) as get_container:
+        change_set = engine.handle_container_event(_event('die', 'a', 1_700_000_000_000_000_001))
+
+    get_container.assert_called_once_with('a')
+    assert change_set['updated'] == ['a']
+    agents = {agent['id']: agent for agent in db.get_all_agents()}
+    assert agents['a']['status'] == 'exited'
+    assert agents['b']['status'] == 'running'
+    assert engine.last_event_since == '1700000000.000000001'
+
+def test_destroy_event_deactivates_agent(engine_factory, db_connection):
+    """Test that a 'destroy' event moves the agent to the Memory Garden without a Docker call."""
+    db.sync_containers_with_db(None, [_container('a')])
+    engine = engine_factory()
+
+    with patch('sim_engine.docker.get_container') as get_container:
+        change_set = engine.handle_container_event(_event('destroy', 'a', 5))
+
+    get_container.assert_not_called()
+    assert change_set['deactivated'] == ['a']
+    assert db.get_all_agents(active_only=True) == []
+
+def test_event_stream_reconnects_from_last_timestamp(engine_factory, db_connection):
+    """Test that the watcher reopens a failed stream and resumes after the last seen event."""
+    source = FakeEventSource([
+        [_event('start', 'a', 1_000_000_000_000_000_000), ConnectionError('daemon went away')],
+        [_event('start', 'b', 1_000_000_002_000_000_000)],
+    ])
+    engine = engine_factory(event_source=source)
+    source.engine = engine
+    engine.is_running = True
+
+    with patch('sim_engine.docker.get_container', side_effect=lambda cid: _container(cid)):
+        engine._watch_events()
+
+    assert source.since_calls == [None, '1000000000.000000000', '1000000002.000000000']
+    assert {agent['id'] for agent in db.get_all_agents()} == {'a', 'b'}
+
+def test_unrelated_events_are_ignored(engine_factory):
+    """Test that non-lifecycle events do not touch Docker or the database."""
+    engine = engine_factory()
+    with patch('sim_engine.docker.get_container') as get_container:
+        assert engine.handle_container_event(_event('exec_start', 'a', 1)) is None
+        assert engine.handle_container_event({'Type': 'network', 'Action': 'connect'}) is None
+    get_container.assert_not_called()
+
+def test_create_agents_runs_concurrently_and_registers_in_one_sync(engine_factory, db_connection):
+    """Test that a batch creates containers in parallel, reports progress and syncs once."""
+    engine = engine_factory()
+    lock = threading.Lock()
+    state = {'running': 0, 'peak': 0}
+
+    def create_agent(name, image):
+        with lock:
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+        time.sleep(0.02)
+        with lock:
+            state['running'] -= 1
+        if name == 'echo-bad':
+            return False, 'image not found'
+        return True, f'id-{name}'
+
+    progress = []
+    specs = [{'name': f'echo-{i}'} for i in range(6)] + [{'name': 'echo-bad', 'image': 'nope'}]
+    with patch('sim_engine.docker.create_agent', side_effect=create_agent), \
+            patch('sim_engine.docker.get_container', side_effect=lambda cid: _container(cid, 'created')), \
+            patch('sim_engine.db.update_agents_from_containers', wraps=db.update_agents_from_containers) as update:
+        results = engine.create_agents(specs, parallelism=3, progress=progress.append)
+
+    assert state['peak'] == 3
+    assert [r['success'] for r in results] == [True] * 6 + [False]
+    assert results[-1]['result'] == 'image not found'
+    assert sorted(p['done'] for p in progress) == list(range(1, 8))
+    assert all(p['total'] == 7 for p in progress)
+    update.assert_called_once()
+    assert len(db.get_all_agents()) == 6
+
+def test_create_new_agent_uses_targeted_sync(engine_factory, db_connection):
+    """Test that a single create refreshes only the new container instead of a full sync."""
+    engine = engine_factory()
+    with patch('sim_engine.docker.create_agent', return_value=(True, 'new-id')), \
+            patch('sim_engine.docker.get_container', return_value=_container('new-id')), \
+            patch('sim_engine.docker.list_containers') as list_all:
+        assert engine.create_new_agent('echo') == (True, 'new-id')
+
+    list_all.assert_not_called()
+    assert [agent['id'] for agent in db.get_all_agents()] == ['new-id']
+
+def test_federated_sync_is_concurrent_and_scoped_to_healthy_hosts(engine_factory, db_connection):
+    """Test that a down or slow host is skipped and only its own agents are left untouched."""
+    db.sync_containers_with_db(None, [_container('edge1:old'), _container('edge2:x'), _container('edge3:y')])
+
+    def list_containers(host=None):
+        if host == 'edge2':
+            raise ConnectionError('host down')
+        if host == 'edge3':
+            time.sleep(0.5)
+        return [_container(f'{host}:new')]
+
+    with patch('sim_engine.docker.get_hosts', return_value=['edge1', 'edge2', 'edge3']):
+        engine = engine_factory(host_timeout=0.1)
+    with patch('sim_engine.docker.list_containers', side_effect=list_containers):
+        started = time.monotonic()
+        change_set = engine.sync_agents_with_docker()
+        elapsed = time.monotonic() - started
+    engine._host_pool.shutdown(wait=True)
+
+    assert elapsed < 0.4
+    assert change_set['added'] == ['edge1:new']
+    assert change_set['deactivated'] == ['edge1:old']
+    active = {agent['id'] for agent in db.get_all_agents(active_only=True)}
+    assert active == {'edge1:new', 'edge2:x', 'edge3:y'}
+    assert engine.host_status['edge1']['ok']
+    assert engine.host_status['edge2']['error'] == 'host down'
+    assert 'timed out' in engine.host_status['edge3']['error']
+
+def test_federated_events_are_host_qualified(engine_factory, db_connection):
+    """Test that an event from a federated host updates the host-qualified agent."""
+    engine = engine_factory()
+    with patch('sim_engine.docker.get_container', return_value=_container('edge1:a', 'exited')) as get_container:
+        engine.handle_container_event(_event('die', 'a', 2_000_000_000_000_000_000), host='edge1')
+
+    get_container.assert_called_once_with('edge1:a')
+    assert engine.host_event_since == {'edge1': '2000000000.000000000'}
+    assert engine.last_event_since is None
+
+def test_on_change_only_fires_for_real_changes(engine_factory, db_connection):
+    """Test that the change listener sees syncs that changed something, and only those."""
+    seen = []
+    engine = engine_factory(on_change=seen.append)
+    with patch('sim_engine.docker.list_containers', return_value=[_container('a')]):
+        engine.sync_agents_with_docker()
+        engine.sync_agents_with_docker()
+    assert [change_set['added'] for change_set in seen] == [['a']]
+
+def test_resync_requests_are_targeted_and_bursts_coalesce(engine_factory):
+    """Test that a few resyncs run as one targeted sync and a burst runs one full sync."""
+    engine = engine_factory(resync_delay=0.05, resync_burst_limit=3)
+    done = threading.Event()
+    threads = set()
+
+    def record(*args):
+        threads.add(threading.current_thread())
+        done.set()
+
+    with patch.object(engine, 'sync_agents', side_effect=record) as sync_agents, \
+            patch.object(engine, 'sync_agents_with_docker', side_effect=record) as full_sync:
+        engine.request_resync('b')
+        engine.request_resync('a')
+        engine.request_resync('a')
+        assert done.wait(2)
+        sync_agents.assert_called_once_with(['a', 'b'])
+        full_sync.assert_not_called()
+
+        done.clear()
+        for i in range(5):
+            engine.request_resync(f'c{i}')
+        assert done.wait(2)
+        full_sync.assert_called_once()
+        assert sync_agents.call_count == 1
+    # Every burst runs on the same long-lived worker.
+    assert len(threads) == 1
+    engine.stop()
+    engine._resync_thread.join(1)
+    assert not engine._resync_thread.is_alive()
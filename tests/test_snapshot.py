@@ -0,0 +1,140 @@
+import pytest
+import json
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import snapshot
+from snapshot import AgentSnapshotTracker, SnapshotEncoder
+
+def _agent(agent_id, status='running', updated_at='t0'):
+    return {'id': agent_id, 'name': agent_id, 'status': status, 'updated_at': updated_at}
+
+def test_update_bumps_generation_only_on_change():
+    """Test that identical reads, or reads differing only in updated_at, do not create a generation."""
+    tracker = AgentSnapshotTracker()
+    assert tracker.update([_agent('a'), _agent('b')]) == 1
+    assert tracker.update([_agent('a'), _agent('b')]) is None
+    assert tracker.update([_agent('a', updated_at='t1'), _agent('b')]) is None
+    assert tracker.generation == 1
+
+def test_delta_since_reports_added_changed_and_removed():
+    """Test that a delta contains only what changed after the acknowledged generation."""
+    tracker = AgentSnapshotTracker()
+    tracker.update([_agent('a'), _agent('b')])
+    tracker.update([_agent('a', status='exited'), _agent('c')])
+
+    delta = tracker.delta_since(1)
+    assert delta['type'] == 'delta'
+    assert delta['base'] == 1
+    assert delta['generation'] == 2
+    assert [a['id'] for a in delta['added']] == ['c']
+    assert [a['id'] for a in delta['changed']] == ['a']
+    assert delta['changed'][0]['status'] == 'exited'
+    assert delta['removed'] == ['b']
+
+def test_delta_since_merges_multiple_generations():
+    """Test that deltas spanning several generations collapse to the final state."""
+    tracker = AgentSnapshotTracker()
+    tracker.update([_agent('a')])
+    tracker.update([_agent('a'), _agent('b')])
+    tracker.update([_agent('a'), _agent('b', status='exited')])
+    tracker.update([_agent('a', status='paused')])
+
+    delta = tracker.delta_since(1)
+    assert delta['added'] == []
+    assert [a['id'] for a in delta['changed']] == ['a']
+    # 'b' was added and removed inside the window; removing it is harmless and safe.
+    assert delta['removed'] == ['b']
+
+def test_delta_since_requires_snapshot_when_too_far_behind():
+    """Test that clients older than the retained history get None (i.e. a full snapshot)."""
+    tracker = AgentSnapshotTracker(history_size=2)
+    for i in range(5):
+        tracker.update([_agent('a', status=f's{i}')])
+
+    assert tracker.delta_since(None) is None
+    assert tracker.delta_since(1) is None
+    assert tracker.delta_since(3) is not None
+    assert tracker.delta_since(5)['changed'] == []
+
+def test_snapshot_contains_all_agents():
+    """Test the full snapshot message."""
+    tracker = AgentSnapshotTracker()
+    tracker.update([_agent('a'), _agent('b')])
+    snapshot = tracker.snapshot()
+    assert snapshot['type'] == 'full_update'
+    assert snapshot['generation'] == 1
+    assert {a['id'] for a in snapshot['agents']} == {'a', 'b'}
+
+def test_encoder_matches_tracker_messages_with_decoded_fields():
+    """Test that encoded snapshots and deltas carry the same data, with JSON fields decoded."""
+    tracker = AgentSnapshotTracker()
+    encoder = SnapshotEncoder(tracker)
+    zoned = dict(_agent('a'), zone='{"name": "Alpha Hall"}', mood='{"not": "decoded"}')
+    tracker.update([zoned, _agent('b')])
+
+    message = json.loads(encoder.encode_snapshot())
+    assert message['type'] == 'full_update'
+    assert message['generation'] == 1
+    assert message['agents'][0]['zone'] == {'name': 'Alpha Hall'}
+    assert message['agents'][0]['mood'] == '{"not": "decoded"}'
+
+    tracker.update([zoned, _agent('b', status='exited'), _agent('c')])
+    delta = json.loads(encoder.encode_delta(1))
+    expected = tracker.delta_since(1)
+    assert delta['removed'] == expected['removed']
+    assert [a['id'] for a in delta['added']] == ['c']
+    assert [a['status'] for a in delta['changed']] == ['exited']
+    assert encoder.encode_delta(-50) is None
+    assert json.loads(encoder.encode_state(-50))['type'] == 'full_update'
+
+def test_encoder_only_reencodes_changed_agents():
+    """Test that unchanged agents reuse their cached fragment across generations."""
+    tracker = AgentSnapshotTracker()
+    encoder = SnapshotEncoder(tracker)
+    tracker.update([_agent(str(i)) for i in range(10)])
+    encoder.encode_snapshot()
+
+    tracker.update([_agent('0', status='exited')] + [_agent(str(i), updated_at='t1') for i in range(1, 10)])
+    with patch('snapshot.json.dumps', wraps=json.dumps) as dumps:
+        message = json.loads(encoder.encode_snapshot())
+    encoded_agents = [c.args[0] for c in dumps.call_args_list if isinstance(c.args[0], dict) and 'id' in c.args[0]]
+    assert [agent['id'] for agent in encoded_agents] == ['0']
+    assert len(message['agents']) == 10
+
+def test_encoder_is_safe_to_share_between_threads():
+    """Test that concurrent snapshot and delta encodes, including cache pruning, agree and do not fail."""
+    tracker = AgentSnapshotTracker()
+    encoder = SnapshotEncoder(tracker)
+    tracker.update([_agent(str(i)) for i in range(2000)])
+    encoder.encode_snapshot()
+    # Half the agents go away, so the next snapshots prune the cache while others read it.
+    tracker.update([_agent(str(i), status='exited') for i in range(1000)])
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        snapshots = list(pool.map(lambda _: encoder.encode_snapshot(), range(8)))
+        deltas = list(pool.map(lambda _: encoder.encode_delta(1), range(8)))
+
+    assert len(set(snapshots)) == 1 and len(set(deltas)) == 1
+    assert len(json.loads(snapshots[0])['agents']) == 1000
+
+def test_encoder_rejects_unknown_encoding():
+    """Test that asking for an unavailable encoding fails loudly."""
+    encoder = SnapshotEncoder(AgentSnapshotTracker())
+    with pytest.raises(ValueError):
+        encoder.encode_snapshot('xml')
+
+def test_encoder_msgpack_round_trip():
+    """Test that the MessagePack encoding splices fragments into a valid message."""
+    msgpack = pytest.importorskip('msgpack')
+    tracker = AgentSnapshotTracker()
+    encoder = SnapshotEncoder(tracker)
+    tracker.update([_agent('a'), _agent('b')])
+    message = msgpack.unpackb(encoder.encode_snapshot('msgpack'))
+    assert message['generation'] == 1
+    assert sorted(agent['id'] for agent in message['agents']) == ['a', 'b']
@@ -0,0 +1,85 @@
+import pytest
+import sys
+import os
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from stats_sampler import MetricRing, StatsSampler, parse_stats
+
+def _raw(cpu_total, system_total, usage=200, rx=0, tx=0):
+    return {
+        'cpu_stats': {'cpu_usage': {'total_usage': cpu_total}, 'system_cpu_usage': system_total, 'online_cpus': 2},
+        'memory_stats': {'usage': usage, 'limit': 1000, 'stats': {'inactive_file': 100}},
+        'networks': {'eth0': {'rx_bytes': rx, 'tx_bytes': tx}},
+    }
+
+def test_metric_ring_keeps_most_recent_values():
+    """Test that the ring overwrites the oldest samples once full."""
+    ring = MetricRing(3)
+    for i in range(5):
+        ring.append(float(i), i * 10.0)
+    assert len(ring) == 3
+    assert ring.items() == [(2.0, 20.0), (3.0, 30.0), (4.0, 40.0)]
+
+def test_parse_stats_uses_previous_counters_for_cpu():
+    """Test CPU and memory parsing; CPU needs a previous sample in one-shot mode."""
+    metrics, counters = parse_stats(_raw(100, 1000))
+    assert metrics['cpu_percent'] == 0.0
+    assert metrics['mem_bytes'] == 100.0
+    assert metrics['mem_percent'] == 10.0
+
+    metrics, _ = parse_stats(_raw(150, 1100), counters)
+    assert metrics['cpu_percent'] == pytest.approx(50 / 100 * 2 * 100)
+
+def test_sampler_collects_history_and_downsamples():
+    """Test a sampling round end to end with a fake fetcher."""
+    pushed = []
+    calls = {'n': 0}
+
+    def fetcher(agent_id):
+        calls['n'] += 1
+        return None if agent_id == 'gone' else _raw(calls['n'] * 10, calls['n'] * 100)
+
+    sampler = StatsSampler(fine_capacity=4, coarse_capacity=4, downsample_every=2,
+                           agent_source=lambda: ['a', 'gone'], fetcher=fetcher, on_sample=pushed.append)
+    for _ in range(5):
+        sampler.sample_once()
+
+    assert list(pushed[-1]) == ['a']
+    assert sampler.latest('gone') is None
+    assert len(sampler.history('a')['cpu_percent']) == 4
+    assert len(sampler.history('a', 'coarse')['cpu_percent']) == 2
+    sampler.stop()
+
+def test_sampler_forgets_agents_that_stop_running():
+    """Test that agents missing from the source are dropped from the buffers."""
+    agents = ['a', 'b']
+    sampler = StatsSampler(agent_source=lambda: list(agents), fetcher=lambda agent_id: _raw(1, 10))
+    sampler.sample_once()
+    agents.remove('b')
+    sampler.sample_once()
+    assert sampler.latest('a') is not None
+    assert sampler.latest('b') is None
+    sampler.stop()
+
+def test_sampler_only_samples_watched_agents():
+    """Test that a watch list limits the Docker calls and the published samples."""
+    fetched, pushed = [], []
+
+    def fetcher(agent_id):
+        fetched.append(agent_id)
+        return _raw(1, 10)
+
+    sources = []
+    sampler = StatsSampler(agent_source=lambda: sources.append(1) or ['a', 'b', 'c'], fetcher=fetcher,
+                           on_sample=pushed.append)
+    sampler.watch([])
+    assert sampler.sample_once() == {}
+    assert (fetched, pushed, sources) == ([], [], [])
+
+    sampler.watch(['b', 'missing'])
+    sampler.sample_once()
+    assert fetched == ['b']
+    assert list(pushed[-1]) == ['b']
+    sampler.stop()
@@ -0,0 +1,73 @@
+import pytest
+import json
+import sys
+import os
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from snapshot import AgentSnapshotTracker
+from subscriptions import Subscription, SubscriptionRouter
+
+def _agent(agent_id, zone='Echo Plaza', status='running', is_active=True):
+    return {'id': agent_id, 'name': agent_id, 'status': status, 'is_active': is_active,
+            'zone': json.dumps({'name': zone}), 'updated_at': 't0'}
+
+def _setup(agents):
+    tracker = AgentSnapshotTracker()
+    tracker.update(agents)
+    router = SubscriptionRouter()
+    router.index(tracker)
+    return tracker, router
+
+def test_subscription_matching_and_projection():
+    """Test zone/agent filters, active_only and field projection."""
+    subscription = Subscription(zones=['Omega Gate'], agent_ids=['b'], active_only=True, fields=['status'])
+    assert subscription.matches(_agent('a', zone='Omega Gate'))
+    assert subscription.matches(_agent('b'))
+    assert not subscription.matches(_agent('c'))
+    assert not subscription.matches(_agent('a', zone='Omega Gate', is_active=False))
+    assert subscription.project(_agent('a')) == {'id': 'a', 'status': 'running'}
+    with pytest.raises(ValueError):
+        Subscription.from_command({'zones': 'Omega Gate'})
+
+def test_changes_reach_only_interested_clients():
+    """Test that a change is routed to clients of its zone or ID, not to everyone."""
+    tracker, router = _setup([_agent('a'), _agent('b', zone='Omega Gate')])
+    router.subscribe('plaza', Subscription(zones=['Echo Plaza']))
+    router.subscribe('gate', Subscription(zones=['Omega Gate']))
+    router.subscribe('watch-b', Subscription(agent_ids=['b']))
+
+    tracker.update([_agent('a', status='paused'), _agent('b', zone='Omega Gate')])
+    router.index(tracker)
+    routed = router.route(tracker.delta_since(1), ['plaza', 'gate', 'watch-b'])
+
+    assert [agent['status'] for agent in routed['plaza']['changed']] == ['paused']
+    assert routed['gate'] == {'added': [], 'changed': [], 'removed': []}
+    assert routed['watch-b'] == {'added': [], 'changed': [], 'removed': []}
+
+def test_agent_leaving_a_zone_is_removed_for_its_subscribers():
+    """Test that moving zones or going inactive turns into a removal for clients that showed the agent."""
+    tracker, router = _setup([_agent('a'), _agent('b')])
+    router.subscribe('plaza', Subscription(zones=['Echo Plaza'], active_only=True))
+    router.subscribe('gate', Subscription(zones=['Omega Gate']))
+
+    tracker.update([_agent('a', zone='Omega Gate'), _agent('b', is_active=False)])
+    router.index(tracker)
+    routed = router.route(tracker.delta_since(1), ['plaza', 'gate'])
+
+    assert sorted(routed['plaza']['removed']) == ['a', 'b']
+    assert [agent['id'] for agent in routed['gate']['changed']] == ['a']
+    assert router.members('OMEGA_GATE') == {'a'}
+
+def test_snapshot_uses_the_zone_index():
+    """Test filtered snapshots and that a skipped generation forces snapshots."""
+    tracker, router = _setup([_agent('a'), _agent('b', zone='Omega Gate'), _agent('c', zone='Omega Gate')])
+    router.subscribe('gate', Subscription(zones=['Omega Gate'], fields=['name']))
+    assert sorted(a['id'] for a in router.snapshot_agents('gate', tracker)) == ['b', 'c']
+
+    tracker.update([_agent('a')])
+    tracker.update([_agent('a', status='exited')])
+    router.index(tracker)
+    assert router.route(tracker.delta_since(1), ['gate']) is None
+    assert router.snapshot_agents('gate', tracker) == []
@@ -0,0 +1,78 @@
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+import task_queue
+from task_queue import Dispatcher, Omega
+
+def test_lease_takes_highest_priority_unexpired_tasks(db_connection):
+    """Test that dequeue follows priority, then age, and skips tasks past their expiry."""
+    now = datetime.utcnow()
+    low, high, stale, mid = task_queue.enqueue([
+        {'task': 'low'}, {'task': 'high', 'priority': 5},
+        {'task': 'stale', 'priority': 9, 'ttl': 1}, {'task': 'mid', 'priority': 1},
+    ], now=now)
+
+    leased = task_queue.lease(['a', 'b'], now=now + timedelta(seconds=2))
+
+    assert [(t['id'], t['agent_id'], t['attempts']) for t in leased] == [(high, 'a', 1), (mid, 'b', 1)]
+    assert task_queue.reap(now=now + timedelta(seconds=2))['expired'] == 1
+    assert task_queue.counts() == {'leased': 2, 'queued': 1, 'expired': 1}
+
+def test_expired_leases_are_requeued_until_attempts_run_out(db_connection):
+    """Test lease expiry, late acks and the attempt limit."""
+    now = datetime.utcnow()
+    [task_id] = task_queue.enqueue([{'task': 'flaky', 'max_attempts': 2}], now=now)
+    task_queue.lease(['a'], lease_seconds=10, now=now)
+    assert task_queue.reap(now=now + timedelta(seconds=11))['requeued'] == 1
+    # The first agent's lease is gone, so its late report is rejected.
+    assert task_queue.ack(task_id, 'late', agent_id='a') is None
+
+    task_queue.lease(['b'], lease_seconds=10, now=now + timedelta(seconds=12))
+    assert task_queue.reap(now=now + timedelta(seconds=30)) == {'requeued': 0, 'failed': 1, 'expired': 0}
+    assert task_queue.get_task(task_id)['state'] == 'failed'
+
+def test_dispatcher_batches_idle_agents_and_omega_decides(db_connection):
+    """Test one dispatch round and Omega's recycle/archive/destroy verdicts."""
+    for agent_id in ('a', 'b', 'c'):
+        db.add_or_update_agent({'id': agent_id, 'name': agent_id, 'status': 'running'})
+    task_queue.enqueue([{'task': 'urgent: crawl logs', 'priority': 2}, {'task': 'log: cleanup', 'priority': 1},
+                        {'task': 'index .epub files'}, {'task': 'left over'}])
+    delivered = []
+    dispatcher = Dispatcher(deliver=delivered.append, batch_size=10)
+
+    tasks = dispatcher.dispatch()
+    assert delivered == [tasks]
+    assert sorted(t['agent_id'] for t in tasks) == ['a', 'b', 'c']
+    # Every agent is busy now, so the next round hands out nothing.
+    assert dispatcher.dispatch() == []
+
+    results = []
+    omega = Omega(on_result=results.append)
+    decisions = {t['task']: omega.report(t['id'], t['agent_id'], {'ok': True})['decision'] for t in tasks}
+    assert decisions == {'urgent: crawl logs': 'recycle', 'log: cleanup': 'archive', 'index .epub files': 'destroy'}
+    assert omega.report(tasks[0]['id'], tasks[0]['agent_id']) is None
+    assert len(results) == 3
+    # The recycled task is queued again beside the one that was left over.
+    assert task_queue.counts() == {'done': 3, 'queued': 2}
+
+def test_recycled_task_keeps_its_time_to_live(db_connection):
+    """Test that a recycled task is queued with the original TTL in the same transaction as the ack."""
+    now = datetime.utcnow()
+    first, second = task_queue.enqueue([{'task': 'urgent: ping', 'ttl': 30, 'priority': 4}, {'task': 'urgent: pong'}], now=now)
+    assert second == first + 1
+    task_queue.lease(['a', 'b'], now=now)
+
+    later = now + timedelta(seconds=10)
+    task = task_queue.ack(first, {'ok': True}, agent_id='a', decision=task_queue.RECYCLE, now=later)
+    assert task['state'] == 'done'
+    recycled = task_queue.get_task(second + 1)
+    assert (recycled['task'], recycled['state'], recycled['priority']) == ('urgent: ping', 'queued', 4)
+    assert recycled['expires_at'] == str(later + timedelta(seconds=30))
+
+    task_queue.ack(second, agent_id='b', decision=task_queue.RECYCLE, now=later)
+    assert task_queue.get_task(second + 2)['expires_at'] is None
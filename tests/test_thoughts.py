@@ -0,0 +1,64 @@
+import sys
+import os
+import threading
+import time
+from unittest.mock import patch
+
+# Add project root to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+from thoughts import ThoughtLog
+
+def test_flush_writes_one_batch_and_streams_to_followers(db_connection):
+    """Test that buffered appends are written together and followers get only new thoughts."""
+    db.append_thoughts([('a', 'old')])
+    log = ThoughtLog()
+    log.is_running = True  # Buffer without starting the writer thread
+    received = []
+    history = log.follow('a', 'client', lambda agent_id, records: received.append(records))
+    assert [t['content'] for t in history] == ['old']
+
+    log.append('a', 'new-1')
+    log.append('b', 'other')
+    log.append('a', 'new-2')
+    assert db.get_thoughts('a', limit=10)[-1]['content'] == 'old'
+    log.flush()
+
+    assert [[(r['seq'], r['content']) for r in batch] for batch in received] == [[(2, 'new-1'), (3, 'new-2')]]
+
+def test_catch_up_delivers_thoughts_written_elsewhere(db_connection):
+    """Test that a follower is caught up from the database once thought_count moves past its cursor."""
+    log = ThoughtLog()
+    received = []
+    log.follow('a', 'client', lambda agent_id, records: received.extend(records), history=0)
+    db.append_thoughts([('a', 'from another worker')])
+
+    log.catch_up({'a': {'thought_count': 1}})
+    log.catch_up({'a': {'thought_count': 1}})
+    log.unfollow_all('client')
+
+    assert [r['content'] for r in received] == ['from another worker']
+    assert log.followed_agents() == []
+
+def test_full_buffer_wakes_the_writer_instead_of_flushing_inline(db_connection):
+    """Test that append never writes on the caller's thread while the writer runs."""
+    writers = []
+    real_append = db.append_thoughts
+
+    def record_thread(entries, db_session=None):
+        writers.append(threading.current_thread())
+        return real_append(entries, db_session)
+
+    log = ThoughtLog(flush_interval=60, max_batch=3)
+    with patch.object(db, 'append_thoughts', side_effect=record_thread):
+        log.start()
+        for i in range(3):
+            log.append('a', i)
+        deadline = time.time() + 2
+        while not writers and time.time() < deadline:
+            time.sleep(0.01)
+        log.stop()
+
+    assert writers and writers[0] is not threading.current_thread()
+    assert [t['content'] for t in db.get_thoughts('a')] == [0, 1, 2]
@@ -29,3 +29,29 @@ def test_assign_zone_unknown_status():
     result = assign_zone(unknown_status)
     assert result['name'] == "The Void", "Unknown status should be assigned to 'The Void'"
     assert result['emoji'] == "🌌", "The emoji for 'The Void' should be correct"
+
+def test_assign_zone_rules_order():
+    """Test that the zone label wins over label rules, which win over the status."""
+    import zones
+    assert zones.assign_zone('running', {'echosim.zone': 'OMEGA_GATE'}) == 'OMEGA_GATE'
+    assert zones.assign_zone('running', {'echosim.zone': '{"name": "Docker Core"}'}) == 'DOCKER_CORE'
+    assert zones.assign_zone('running', {'echosim.zone': '{}'}) == 'ECHO_PLAZA'
+    original = list(zones.LABEL_RULES)
+    zones.LABEL_RULES.append(('echosim.role', 'core', 'DOCKER_CORE'))
+    try:
+        assert zones.assign_zone('created', {'echosim.role': 'core'}) == 'DOCKER_CORE'
+        assert zones.assign_zone('created', {'echosim.role': 'edge'}) == 'ALPHA_HALL'
+    finally:
+        zones.LABEL_RULES[:] = original
+
+def test_zone_index_follows_change_sets():
+    """Test occupancy and membership updates from sync change sets."""
+    from zones import ZoneIndex
+    index = ZoneIndex()
+    index.load([('a', 'ECHO_PLAZA'), ('b', 'ECHO_PLAZA')])
+    index.apply({'zone_keys': {'a': 'OMEGA_GATE', 'c': 'ALPHA_HALL'}, 'deactivated': ['b']})
+    assert index.occupancy()['ECHO_PLAZA'] == 0
+    assert index.members('OMEGA_GATE') == {'a'}
+    assert index.count('ALPHA_HALL') == 1
+    index.apply({'zone_keys': {'c': None}, 'deactivated': []})
+    assert index.zone_of('c') is None
@@ -0,0 +1,171 @@
+# thoughts.py
+
+from threading import Event, Thread, Lock
+
+import db
+
+
+class ThoughtLog:
+    """
+    Batches thought appends and streams new thoughts to followers.
+
+    Appends are buffered and written by a background thread in one
+    transaction per flush, so a burst of thoughts costs one commit. Each
+    follower has a cursor (the last seq it was sent); freshly written
+    thoughts are delivered from memory, and thoughts written by other
+    workers are caught up from the database when an agent's `thought_count`
+    moves past a follower's cursor.
+    """
+
+    def __init__(self, flush_interval=0.1, max_batch=500, db_session=None):
+        """Initializes the log.
+
+        Args:
+            flush_interval (float): Seconds between flushes of buffered appends.
+            max_batch (int): Buffered appends that wake the writer before the interval is up.
+            db_session (ConnectionPool): Optional pool to write through.
+        """
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.db_session = db_session
+        self.is_running = False
+        self._pending = []
+        self._pending_lock = Lock()
+        self._flush_lock = Lock()
+        # Set to make the writer flush now instead of at the end of the interval.
+        self._wakeup = Event()
+        # agent_id -> {key: [callback, cursor]}
+        self._followers = {}
+        self._followers_lock = Lock()
+        self._thread = None
+
+    def append(self, agent_id, content):
+        """Queues a thought for the writer thread.
+
+        A full buffer wakes the writer early rather than flushing on the
+        caller's thread. Without a running writer the thought is written at once.
+        """
+        with self._pending_lock:
+            self._pending.append((agent_id, content))
+            full = len(self._pending) >= self.max_batch
+        if not self.is_running:
+            self.flush()
+        elif full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Writes every buffered thought in one transaction and notifies followers.
+
+        Returns:
+            The stored records.
+        """
+        with self._flush_lock:
+            with self._pending_lock:
+                entries, self._pending = self._pending, []
+            if not entries:
+                return []
+            try:
+                records = db.append_thoughts(entries, self.db_session)
+            except Exception:
+                # Keep them for the next flush, ahead of anything appended since.
+                with self._pending_lock:
+                    self._pending[:0] = entries
+                raise
+        by_agent = {}
+        for record in records:
+            by_agent.setdefault(record["agent_id"], []).append(record)
+        for agent_id, agent_records in by_agent.items():
+            self._deliver(agent_id, agent_records)
+        return records
+
+    def follow(self, agent_id, key, callback, history=50):
+        """Starts streaming an agent's new thoughts to `callback(agent_id, records)`.
+
+        Args:
+            agent_id (str): The agent to follow.
+            key: Identifies the follower, e.g. its WebSocket.
+            callback (callable): Called with each batch of new records, possibly from another thread.
+            history (int): Number of recent thoughts to return now.
+
+        Returns:
+            The latest `history` thoughts, oldest first.
+        """
+        recent = db.get_thoughts(agent_id, limit=history) if history else []
+        cursor = recent[-1]["seq"] if recent else self._latest_seq(agent_id)
+        with self._followers_lock:
+            self._followers.setdefault(agent_id, {})[key] = [callback, cursor]
+        return recent
+
+    def _latest_seq(self, agent_id):
+        latest = db.get_thoughts(agent_id, limit=1)
+        return latest[-1]["seq"] if latest else 0
+
+    def unfollow(self, agent_id, key):
+        with self._followers_lock:
+            followers = self._followers.get(agent_id)
+            if followers is not None:
+                followers.pop(key, None)
+                if not followers:
+                    del self._followers[agent_id]
+
+    def unfollow_all(self, key):
+        with self._followers_lock:
+            agent_ids = [agent_id for agent_id, followers in self._followers.items() if key in followers]
+        for agent_id in agent_ids:
+            self.unfollow(agent_id, key)
+
+    def followed_agents(self):
+        with self._followers_lock:
+            return list(self._followers)
+
+    def _deliver(self, agent_id, records):
+        """Sends each follower of an agent the records past its cursor."""
+        deliveries = []
+        with self._followers_lock:
+            for entry in self._followers.get(agent_id, {}).values():
+                callback, cursor = entry
+                fresh = [record for record in records if record["seq"] > cursor]
+                if fresh:
+                    entry[1] = fresh[-1]["seq"]
+                    deliveries.append((callback, fresh))
+        for callback, fresh in deliveries:
+            try:
+                callback(agent_id, fresh)
+            except Exception as e:
+                print(f"ThoughtLog: Follower callback failed for {agent_id}: {e}")
+
+    def catch_up(self, agents):
+        """Delivers thoughts that followers missed, e.g. ones written by another worker.
+
+        Args:
+            agents (dict): Agent rows by ID, carrying `thought_count`.
+        """
+        for agent_id in self.followed_agents():
+            latest = (agents.get(agent_id) or {}).get("thought_count") or 0
+            with self._followers_lock:
+                cursors = [cursor for _, cursor in self._followers.get(agent_id, {}).values()]
+            if not cursors or latest <= min(cursors):
+                continue
+            self._deliver(agent_id, db.get_thoughts(agent_id, limit=db.MAX_THOUGHTS_PAGE, after_seq=min(cursors)))
+
+    def start(self):
+        if self.is_running:
+            return
+        self.is_running = True
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the writer thread and flushes anything still buffered."""
+        self.is_running = False
+        self._wakeup.set()
+        self.flush()
+
+    def _run(self):
+        while self.is_running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"ThoughtLog: Flush failed: {e}")
@@ -1,42 +1,153 @@
+import json
+from threading import Lock
+
 # --- Zone Definitions ---
+# `statuses` lists the container statuses that place an Echo in the zone.
 ZONES = {
     "ALPHA_HALL": {
         "name": "Alpha Hall",
         "description": "The birthplace of new Echoes, where potential takes form.",
-        "emoji": "✨"
+        "emoji": "✨",
+        "statuses": ["created"]
     },
     "ECHO_PLAZA": {
         "name": "Echo Plaza",
         "description": "The bustling hub where active Echoes live and interact.",
-        "emoji": "🏙️"
+        "emoji": "🏙️",
+        "statuses": ["running", "up"]
     },
     "DOCKER_CORE": {
         "name": "Docker Core",
         "description": "The inner sanctum where the fundamental forces of the Simverse are at work.",
-        "emoji": "⚙️"
+        "emoji": "⚙️",
+        "statuses": ["restarting", "paused"]
     },
     "OMEGA_GATE": {
         "name": "Omega Gate",
         "description": "The final gateway, where Echoes prepare to fade into memory.",
-        "emoji": "🚪"
+        "emoji": "🚪",
+        "statuses": ["exited", "dead", "stopped"]
     },
     "THE_VOID": {
         "name": "The Void",
         "description": "An uncharted space between defined zones.",
-        "emoji": "🌌"
+        "emoji": "🌌",
+        "statuses": []
     }
 }
 
-def assign_zone(agent_status):
-    """Assigns an Echo to a zone based on its container status."""
-    if agent_status in ['created']:
-        return "ALPHA_HALL"
-    elif agent_status in ['running', 'up']:
-        return "ECHO_PLAZA"
-    elif agent_status in ['restarting', 'paused']:
-        return "DOCKER_CORE"
-    elif agent_status in ['exited', 'dead', 'stopped']:
-        return "OMEGA_GATE"
-    else:
-        # Default case for any unknown statuses
-        return "THE_VOID"
\ No newline at end of file
+# Container label that pins an Echo to a zone, by key ("ECHO_PLAZA"), by name,
+# or as a JSON object with a "name".
+ZONE_LABEL = "echosim.zone"
+
+# Extra label rules, checked in order after ZONE_LABEL: (label, value, zone key).
+# A value of None matches any value of the label.
+LABEL_RULES = []
+
+_ZONE_NAMES = {zone["name"].lower(): key for key, zone in ZONES.items()}
+_STATUS_ZONES = {status: key for key, zone in ZONES.items() for status in zone["statuses"]}
+
+def zone_key_for(value):
+    """Resolves a zone key, zone name or JSON zone label to a zone key, or None."""
+    if isinstance(value, str):
+        if value in ZONES:
+            return value
+        if value.lower() in _ZONE_NAMES:
+            return _ZONE_NAMES[value.lower()]
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    if isinstance(value, dict) and isinstance(value.get("name"), str):
+        return _ZONE_NAMES.get(value["name"].lower())
+    return None
+
+def assign_zone(agent_status, labels=None):
+    """Assigns an Echo to a zone.
+
+    Rules are checked in order and the first match wins: the `echosim.zone`
+    label, then LABEL_RULES, then the container status. Unknown statuses go
+    to The Void.
+
+    Args:
+        agent_status (str): The container status.
+        labels (dict): The container labels, if known.
+
+    Returns:
+        The zone key.
+    """
+    labels = labels or {}
+    pinned = zone_key_for(labels.get(ZONE_LABEL))
+    if pinned:
+        return pinned
+    for label, value, zone_key in LABEL_RULES:
+        if label in labels and (value is None or labels[label] == value):
+            return zone_key
+    # Default case for any unknown statuses
+    return _STATUS_ZONES.get(agent_status, "THE_VOID")
+
+
+class ZoneIndex:
+    """
+    Zone membership of active agents, kept up to date from sync change sets.
+
+    Occupancy counts and membership lookups are O(1) and never touch the
+    database. Sync threads write to it while the event loop reads, so every
+    access takes a lock.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._zone_of = {}
+        self._members = {key: set() for key in ZONES}
+
+    def load(self, assignments):
+        """Replaces the index with (agent_id, zone_key) pairs for the active agents."""
+        with self._lock:
+            self._zone_of = {}
+            self._members = {key: set() for key in ZONES}
+            for agent_id, zone_key in assignments:
+                self._place(agent_id, zone_key)
+
+    def _place(self, agent_id, zone_key):
+        old = self._zone_of.pop(agent_id, None)
+        if old is not None:
+            self._members[old].discard(agent_id)
+        if zone_key is not None:
+            zone_key = zone_key if zone_key in ZONES else "THE_VOID"
+            self._zone_of[agent_id] = zone_key
+            self._members[zone_key].add(agent_id)
+
+    def place(self, agent_id, zone_key):
+        """Moves an agent to a zone; a zone_key of None removes it."""
+        with self._lock:
+            self._place(agent_id, zone_key)
+
+    def remove(self, agent_id):
+        self.place(agent_id, None)
+
+    def apply(self, change_set):
+        """Applies a change set from `db.sync_containers_with_db` or `db.update_agents_from_containers`."""
+        with self._lock:
+            for agent_id, zone_key in change_set.get("zone_keys", {}).items():
+                self._place(agent_id, zone_key)
+            for agent_id in change_set.get("deactivated", ()):
+                self._place(agent_id, None)
+
+    def zone_of(self, agent_id):
+        with self._lock:
+            return self._zone_of.get(agent_id)
+
+    def count(self, zone_key):
+        with self._lock:
+            return len(self._members.get(zone_key, ()))
+
+    def members(self, zone_key):
+        """Returns the IDs of the active agents in a zone."""
+        with self._lock:
+            return set(self._members.get(zone_key, ()))
+
+    def occupancy(self):
+        """Returns {zone key: number of active agents}."""
+        with self._lock:
+            return {key: len(members) for key, members in self._members.items()}